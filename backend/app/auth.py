@@ -1,8 +1,16 @@
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import asyncio
+import hashlib
 import os
+import time
 from dotenv import load_dotenv
+from .cache import MemoryBackend, cache, user_key
+from .database import SessionLocal
+from .hydration import user_card
 
 load_dotenv()
 
@@ -10,7 +18,24 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Changing the cost takes effect for existing users on their next login (see needs_rehash)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so these threads hash in parallel; requests beyond the
+# limit queue here instead of tying up request workers
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Tokens outlive deleted accounts; a verified token is trusted this long before its
+# account is looked up again
+TOKEN_RECHECK_SECONDS = float(os.getenv("TOKEN_RECHECK_SECONDS", "300"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -18,23 +43,79 @@ def hash_password(password: str) -> str:
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
+def needs_rehash(hashed: str) -> bool:
+    return pwd_context.needs_update(hashed)
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, hash_password, password)
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, plain, hashed)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+class TokenUser(NamedTuple):
+    id: int
+    # None for tokens issued before usernames were added to the claims
+    username: str | None
+
+# Verified tokens, keyed by digest so raw tokens are never held, until their exp
+# or for TOKEN_RECHECK_SECONDS, whichever comes first
+token_cache = MemoryBackend(maxsize=TOKEN_CACHE_SIZE)
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _account_exists(user_id: int) -> bool:
+    # Usually a hit on the profile card cache; deleted accounts have no card
+    db = SessionLocal()
+    try:
+        return cache.get_or_load(user_key(user_id), lambda: user_card(db, user_id)) is not None
+    finally:
+        db.close()
+
+def decode_token(token: str) -> TokenUser:
+    key = _token_key(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
     except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("user_id") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user = TokenUser(payload["user_id"], payload.get("username"))
+    if not _account_exists(user.id):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    ttl = min(payload["exp"] - time.time(), TOKEN_RECHECK_SECONDS) if "exp" in payload else 0
+    if ttl > 0:
+        token_cache.set(key, user, ttl)
+    return user
+
+def forget_token(token: str):
+    # Other workers drop it within TOKEN_RECHECK_SECONDS
+    token_cache.delete(_token_key(token))
+
+def decode_user_id(token: str) -> int:
+    return decode_token(token).id
+
+def get_token_user(token: str = Depends(oauth2_scheme)) -> TokenUser:
+    # For routes that can use the username claim instead of loading the user
+    return decode_token(token)
+
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    return decode_user_id(token)
+
+def get_stream_user_id(token: str = Query(...)) -> int:
+    # EventSource cannot send an Authorization header, so streams take the token as a query param
+    return decode_user_id(token)
\ No newline at end of file
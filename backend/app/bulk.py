@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+from .database import insert_for
+from .models import Like, Follow, Rec, User
+from .schemas import RecImport
+from . import timeline, counters, outbox, images
+
+# Set-based writes for likes, follows and rec imports. Each batch is validated with
+# one lookup and written with one INSERT ... ON CONFLICT DO NOTHING RETURNING, so
+# duplicates are resolved by the unique constraints instead of check-then-insert.
+# The single-item endpoints go through here as well. Callers commit and invalidate
+# the cache.
+
+def _unique(items: list) -> list:
+    return list(dict.fromkeys(items))
+
+def like(db: Session, user_id: int, rec_ids: list[int]) -> list[dict]:
+    rec_ids = _unique(rec_ids)
+    authors = dict(db.query(Rec.id, Rec.user_id).filter(Rec.id.in_(rec_ids), Rec.deleted_at.is_(None)).all())
+    rows = [{"user_id": user_id, "rec_id": rec_id} for rec_id in rec_ids if rec_id in authors]
+    liked = set()
+    if rows:
+        stmt = insert_for(db, Like).values(rows).on_conflict_do_nothing(index_elements=["user_id", "rec_id"])
+        liked = set(db.execute(stmt.returning(Like.rec_id)).scalars())
+        counters.recs_liked(db, liked)
+        # Notifications (if not liking own rec) are written by the outbox worker
+        for rec_id in liked:
+            if authors[rec_id] != user_id:
+                outbox.enqueue(db, "notification", {"user_id": authors[rec_id], "from_user_id": user_id, "type": "like", "rec_id": rec_id})
+    return [
+        {"rec_id": rec_id, "status": "liked" if rec_id in liked else "already_liked" if rec_id in authors else "not_found"}
+        for rec_id in rec_ids
+    ]
+
+def unlike(db: Session, user_id: int, rec_ids: list[int]) -> list[dict]:
+    # Unliked results carry liked_at, the time of the like that went, for trending
+    rec_ids = _unique(rec_ids)
+    stmt = delete(Like).where(Like.user_id == user_id, Like.rec_id.in_(rec_ids)).returning(Like.rec_id, Like.created_at)
+    unliked = dict(db.execute(stmt.execution_options(synchronize_session=False)).all())
+    counters.recs_liked(db, list(unliked), -1)
+    return [
+        {"rec_id": rec_id, "status": "unliked", "liked_at": unliked[rec_id]} if rec_id in unliked else {"rec_id": rec_id, "status": "not_liked"}
+        for rec_id in rec_ids
+    ]
+
+def follow(db: Session, follower_id: int, usernames: list[str]) -> list[dict]:
+    usernames = _unique(usernames)
+    ids = dict(db.query(User.username, User.id).filter(User.username.in_(usernames), User.deleted_at.is_(None)).all())
+    rows = [
+        {"follower_id": follower_id, "following_id": user_id}
+        for user_id in ids.values() if user_id != follower_id
+    ]
+    followed = set()
+    if rows:
+        stmt = insert_for(db, Follow).values(rows).on_conflict_do_nothing(index_elements=["follower_id", "following_id"])
+        followed = set(db.execute(stmt.returning(Follow.following_id)).scalars())
+        counters.users_followed(db, follower_id, followed)
+        timeline.backfill(db, follower_id, list(followed))
+        for user_id in followed:
+            outbox.enqueue(db, "notification", {"user_id": user_id, "from_user_id": follower_id, "type": "follow", "rec_id": None})
+
+    def status(username):
+        if username not in ids:
+            return "not_found"
+        if ids[username] == follower_id:
+            return "self"
+        return "followed" if ids[username] in followed else "already_following"
+
+    return [{"username": username, "status": status(username), "user_id": ids.get(username)} for username in usernames]
+
+def import_recs(db: Session, user_id: int, recs: list[RecImport]) -> list[int]:
+    # Returns the new ids in request order; recs without a date get the import time
+    now = datetime.now(timezone.utc)
+    rows = [{**fields, "user_id": user_id, "created_at": fields["created_at"] or now} for fields in images.rec_fields(db, recs)]
+    stmt = insert(Rec).returning(Rec.id, sort_by_parameter_order=True)
+    rec_ids = list(db.execute(stmt, rows).scalars())
+    counters.rec_created(db, user_id, len(rec_ids))
+    timeline.fan_out_many(db, rec_ids, user_id)
+    return rec_ids
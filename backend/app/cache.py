@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Read-through cache for hot rows (user profiles, rec cards). Values are plain
+# JSON-compatible dicts so every backend can store them. Write paths must call
+# cache.invalidate(...) after they commit.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+
+class MemoryBackend:
+    def __init__(self, maxsize: int = CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: int):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._data)
+
+class RedisBackend:
+    # Shared across workers. Needs the optional `redis` package; eviction is left to
+    # the server's maxmemory-policy (allkeys-lru).
+    def __init__(self, url: str = CACHE_URL, prefix: str = "recs:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: int):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def size(self) -> int:
+        return self.client.dbsize()
+
+class Cache:
+    def __init__(self, backend, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Request threads share the counters
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: str, loader, ttl: int | None = None):
+        # None results are not cached, so a missing row is looked up again next time
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not None:
+            return value
+        value = loader()
+        if value is not None:
+            self.backend.set(key, value, ttl or self.ttl)
+        return value
+
+    def invalidate(self, *keys: str):
+        self.backend.delete(*keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "size": self.backend.size(),
+            "evictions": self.backend.evictions,
+        }
+
+def make_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+cache = Cache(make_backend())
+
+def set_backend(backend):
+    # Swap the backend, e.g. for a local stand-in of the shared store
+    cache.backend = backend
+    with cache._lock:
+        cache.hits = cache.misses = 0
+
+def rec_key(rec_id: int) -> str:
+    return f"rec:{rec_id}"
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def username_key(username: str) -> str:
+    return f"username:{username}"
@@ -0,0 +1,72 @@
+import os
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+
+try:
+    import brotli
+except ImportError:
+    # Optional; without it only gzip is offered
+    brotli = None
+
+# Response compression: brotli when the client accepts it and the `brotli` package
+# is installed, gzip otherwise. Bodies under COMPRESSION_MINIMUM_SIZE are sent as is
+# (the headers would outweigh the saving), as are streams and media that is already
+# compressed. Levels are kept moderate: these are small JSON bodies compressed on
+# every request, not static assets compressed once.
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+class _ExcludeMedia:
+    async def send_with_compression(self, message):
+        if message["type"] == "http.response.start":
+            excluded = Headers(raw=message["headers"]).get("content-type", "").startswith(EXCLUDED_CONTENT_TYPES)
+            await super().send_with_compression(message)
+            self.content_type_is_excluded = self.content_type_is_excluded or excluded
+        else:
+            await super().send_with_compression(message)
+
+class _GZip(_ExcludeMedia, GZipResponder):
+    pass
+
+class _Identity(_ExcludeMedia, IdentityResponder):
+    pass
+
+class _Brotli(_ExcludeMedia, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if more_body:
+            return self.compressor.process(body) + self.compressor.flush()
+        return self.compressor.process(body) + self.compressor.finish()
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and _accepts(accept_encoding, "br"):
+            responder = _Brotli(self.app, self.minimum_size, BROTLI_QUALITY)
+        elif _accepts(accept_encoding, "gzip"):
+            responder = _GZip(self.app, self.minimum_size, compresslevel=GZIP_LEVEL)
+        else:
+            responder = _Identity(self.app, self.minimum_size)
+        await responder(scope, receive, send)
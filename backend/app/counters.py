@@ -0,0 +1,86 @@
+from collections import defaultdict
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from .models import User, Rec, Follow, Like, Comment
+
+# Counter updates are single atomic UPDATE ... SET col = col + delta statements and
+# must be issued in the same transaction as the write they describe.
+
+def _bump(db: Session, column, row_id: int, delta: int):
+    model = column.class_
+    db.execute(update(model).where(model.id == row_id).values({column: column + delta}))
+
+def _bump_all(db: Session, column, row_ids, delta: int):
+    if row_ids:
+        model = column.class_
+        db.execute(update(model).where(model.id.in_(row_ids)).values({column: column + delta}))
+
+def rec_created(db: Session, user_id: int, delta: int = 1):
+    _bump(db, User.recs_count, user_id, delta)
+
+def rec_liked(db: Session, rec_id: int, delta: int = 1):
+    _bump(db, Rec.likes_count, rec_id, delta)
+
+def recs_liked(db: Session, rec_ids, delta: int = 1):
+    _bump_all(db, Rec.likes_count, rec_ids, delta)
+
+def rec_commented(db: Session, rec_id: int, delta: int = 1):
+    _bump(db, Rec.comments_count, rec_id, delta)
+
+def comments_removed(db: Session, counts: dict[int, int]):
+    # counts: comments removed per rec id; one UPDATE per distinct count
+    by_count = defaultdict(list)
+    for rec_id, count in counts.items():
+        by_count[count].append(rec_id)
+    for count, rec_ids in by_count.items():
+        _bump_all(db, Rec.comments_count, rec_ids, -count)
+
+def user_followed(db: Session, follower_id: int, following_id: int, delta: int = 1):
+    _bump(db, User.following_count, follower_id, delta)
+    _bump(db, User.followers_count, following_id, delta)
+
+def users_followed(db: Session, follower_id: int, following_ids, delta: int = 1):
+    if following_ids:
+        _bump(db, User.following_count, follower_id, delta * len(following_ids))
+        _bump_all(db, User.followers_count, following_ids, delta)
+
+def followers_removed(db: Session, follower_ids, following_id: int):
+    # The reverse of users_followed, for when the account followed goes away
+    if follower_ids:
+        _bump_all(db, User.following_count, follower_ids, -1)
+        _bump(db, User.followers_count, following_id, -len(follower_ids))
+
+# Reconciliation recomputes every counter from the source tables and only rewrites
+# rows that drifted, so it is cheap to run on a schedule.
+# Deleted recs stop counting as soon as they are deleted, before app.purge removes
+# them; everything else counts until the row is gone.
+RECONCILED = [
+    (User, User.recs_count, Rec, Rec.user_id, Rec.deleted_at.is_(None)),
+    (User, User.followers_count, Follow, Follow.following_id, None),
+    (User, User.following_count, Follow, Follow.follower_id, None),
+    (Rec, Rec.likes_count, Like, Like.rec_id, None),
+    (Rec, Rec.comments_count, Comment, Comment.rec_id, None),
+]
+
+def reconcile(db: Session) -> dict[str, int]:
+    fixed = {}
+    for model, column, source, fk, condition in RECONCILED:
+        actual = select(func.count()).select_from(source).where(fk == model.id)
+        if condition is not None:
+            actual = actual.where(condition)
+        actual = actual.scalar_subquery()
+        result = db.execute(
+            update(model).where(column != actual).values({column: actual}).execution_options(synchronize_session=False)
+        )
+        fixed[f"{model.__tablename__}.{column.key}"] = result.rowcount
+    db.commit()
+    return fixed
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        for name, count in reconcile(db).items():
+            print(f"{name}: {count} rows fixed")
+    finally:
+        db.close()
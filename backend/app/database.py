@@ -1,18 +1,176 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 import os
+import threading
+import time
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+# Optional streaming replica; read-only GET routes use it through get_read_db
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# "sync" serves routes from the threadpool with psycopg2; "async" serves them on the
+# event loop through an AsyncEngine (see routers/asyncify.py).
+DB_MODE = os.getenv("DB_MODE", "sync")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.timeouts += timed_out
+
+# Called with the seconds each checkout waited; app.instrumentation uses it to
+# attribute pool waits to the request that made them
+checkout_listeners = []
+
+class TimedPoolMixin:
+    # Times how long each checkout waits for a free connection
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self._record(time.perf_counter() - started, timed_out=True)
+            raise
+        self._record(time.perf_counter() - started)
+        return conn
+
+    def _record(self, waited: float, timed_out: bool = False):
+        self.stats.record(waited, timed_out)
+        for listener in checkout_listeners:
+            listener(waited)
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, poolclass) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite") and ":memory:" in url:
+        return options
+    return {
+        **options,
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, TimedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+replica_engine = None
+ReplicaSessionLocal = SessionLocal
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL, TimedQueuePool))
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+def insert_for(db, model):
+    # INSERT with the dialect's ON CONFLICT clauses; Postgres and SQLite share them
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    # Read-only routes; falls back to the primary when no replica is configured.
+    # Replicas lag slightly, so only use this where read-your-writes is not required.
+    db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+async_engine = None
+async_replica_engine = None
+AsyncSessionLocal = None
+AsyncReplicaSessionLocal = None
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    url = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
+    async_engine = create_async_engine(url, **engine_options(url, TimedAsyncQueuePool))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=True)
+    AsyncReplicaSessionLocal = AsyncSessionLocal
+    if DATABASE_REPLICA_URL:
+        replica_url = async_url(DATABASE_REPLICA_URL)
+        async_replica_engine = create_async_engine(replica_url, **engine_options(replica_url, TimedAsyncQueuePool))
+        AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=True)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with AsyncReplicaSessionLocal() as db:
+        yield db
+
+def pool_metrics() -> dict:
+    engines = {
+        "primary": engine,
+        "replica": replica_engine,
+        "async_primary": async_engine and async_engine.sync_engine,
+        "async_replica": async_replica_engine and async_replica_engine.sync_engine,
+    }
+    metrics = {}
+    for name, eng in engines.items():
+        if eng is None:
+            continue
+        pool = eng.pool
+        stats = getattr(pool, "stats", None)
+        metrics[name] = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkouts": stats.checkouts if stats else None,
+            "wait_seconds_total": stats.wait_seconds_total if stats else None,
+            "wait_seconds_max": stats.wait_seconds_max if stats else None,
+            "timeouts": stats.timeouts if stats else None,
+        }
+    return metrics
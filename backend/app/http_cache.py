@@ -0,0 +1,49 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from fastapi import Request, Response
+
+# Conditional GETs. Validators are built from the version columns on users and recs
+# (bumped by every UPDATE of the row, counters included, see models.py), so a route
+# can answer If-None-Match from a cached card or one narrow query, before doing the
+# work of building the response. ETags are weak: the same body may go out gzip- or
+# brotli-encoded.
+
+# Comment threads are the same for every viewer, so browsers and shared caches may
+# reuse them briefly without revalidating
+COMMENTS_MAX_AGE = int(os.getenv("COMMENTS_MAX_AGE", "10"))
+
+# Per-viewer responses: stored by the browser only, and revalidated on every use
+PRIVATE = "private, no-cache"
+
+def etag(*parts) -> str:
+    return 'W/"' + hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest() + '"'
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+def _http_date(value) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        # SQLite hands back naive timestamps; they are UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def not_modified(request: Request, response: Response, tag: str, last_modified=None, cache_control: str = PRIVATE) -> Response | None:
+    # Sets the validators on the response; returns a 304 to send instead when the
+    # client's copy is current
+    headers = {"ETag": tag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    if cache_control.startswith("private"):
+        headers["Vary"] = "Authorization"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
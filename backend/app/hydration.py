@@ -0,0 +1,122 @@
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import Like, Follow, Rec, User, Comment
+from .schemas import RecOut, UserProfile, CommentOut
+from .cache import cache, rec_key, user_key
+
+def visible(query):
+    # For (rec, username, user_avatar) queries. Deleted recs and accounts are hidden
+    # here at once and removed later by app.purge.
+    return query.filter(Rec.deleted_at.is_(None), User.deleted_at.is_(None))
+
+def hydrate_recs(db: Session, rows, user_id: int, comments: int = 0) -> list[RecOut]:
+    # rows are (rec, username, user_avatar) tuples, already joined with User by the caller.
+    # likes_count is a column on Rec; is_liked for the whole page is a single IN lookup,
+    # and a comments preview (when asked for) is one more windowed query.
+    rec_ids = [rec.id for rec, _, _ in rows]
+    liked = set()
+    if rec_ids:
+        liked = {
+            rec_id for rec_id, in db.query(Like.rec_id).filter(Like.user_id == user_id, Like.rec_id.in_(rec_ids))
+        }
+    previews = latest_comments(db, rec_ids, comments) if comments else {}
+
+    return [
+        RecOut(
+            **rec.__dict__,
+            username=username,
+            is_liked=rec.id in liked,
+            user_avatar=user_avatar or "",
+            latest_comments=previews.get(rec.id, [])
+        )
+        for rec, username, user_avatar in rows
+    ]
+
+def comment_out(comment: Comment, username: str, user_avatar: str | None) -> CommentOut:
+    return CommentOut(
+        id=comment.id,
+        user_id=comment.user_id,
+        rec_id=comment.rec_id,
+        content=comment.content,
+        created_at=comment.created_at,
+        username=username,
+        user_avatar=user_avatar or ""
+    )
+
+def comments_query(db: Session):
+    return db.query(Comment, User.username, User.avatar).join(User, User.id == Comment.user_id).filter(User.deleted_at.is_(None))
+
+def latest_comments(db: Session, rec_ids: list[int], limit: int) -> dict[int, list[CommentOut]]:
+    # Top `limit` comments per rec in one query, returned oldest first per rec
+    if not rec_ids or limit <= 0:
+        return {}
+    position = func.row_number().over(
+        partition_by=Comment.rec_id, order_by=(Comment.created_at.desc(), Comment.id.desc())
+    ).label("position")
+    ranked = db.query(Comment.id, position).filter(Comment.rec_id.in_(rec_ids)).subquery()
+    rows = comments_query(db).join(ranked, ranked.c.id == Comment.id).filter(
+        ranked.c.position <= limit
+    ).order_by(Comment.rec_id, Comment.created_at, Comment.id).all()
+
+    grouped = defaultdict(list)
+    for comment, username, user_avatar in rows:
+        grouped[comment.rec_id].append(comment_out(comment, username, user_avatar))
+    return grouped
+
+def to_profile(user: User, is_following: bool) -> UserProfile:
+    return UserProfile(
+        id=user.id,
+        username=user.username,
+        bio=user.bio,
+        avatar=user.avatar,
+        avatar_variants=user.avatar_variants or [],
+        recs_count=user.recs_count,
+        tuned_in=user.followers_count,
+        tuned_to=user.following_count,
+        is_following=is_following
+    )
+
+def build_profiles(db: Session, users: list[User], viewer_id: int) -> list[UserProfile]:
+    # Counters live on the rows already; the viewer's follow edges come from one IN lookup.
+    ids = [user.id for user in users]
+    followed = set()
+    if ids:
+        followed = {
+            following_id for following_id, in db.query(Follow.following_id).filter(
+                Follow.follower_id == viewer_id, Follow.following_id.in_(ids)
+            )
+        }
+    return [to_profile(user, user.id in followed) for user in users]
+
+# Cache cards hold everything that is the same for every viewer; is_liked and
+# is_following are filled in per request.
+
+def _validators(row) -> dict:
+    # Not part of the response models; read by app.http_cache
+    modified = row.updated_at or row.created_at
+    return {"version": row.version, "updated_at": modified.isoformat() if modified else None}
+
+def user_card(db: Session, user_id: int) -> dict | None:
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
+    return {**to_profile(user, False).model_dump(exclude={"is_following"}), **_validators(user)} if user else None
+
+def rec_card(db: Session, rec_id: int) -> dict | None:
+    rec = db.query(Rec).filter(Rec.id == rec_id, Rec.deleted_at.is_(None)).first()
+    if not rec:
+        return None
+    return {
+        **RecOut.model_validate(rec).model_dump(mode="json", exclude={"username", "is_liked", "user_avatar", "latest_comments"}),
+        **_validators(rec),
+    }
+
+def cached_rec(db: Session, rec_id: int, user_id: int) -> RecOut | None:
+    card = cache.get_or_load(rec_key(rec_id), lambda: rec_card(db, rec_id))
+    if not card:
+        return None
+    author = cache.get_or_load(user_key(card["user_id"]), lambda: user_card(db, card["user_id"]))
+    if not author:
+        # The author's account is deleted and waiting to be purged
+        return None
+    is_liked = db.query(Like.id).filter(Like.user_id == user_id, Like.rec_id == rec_id).first() is not None
+    return RecOut(**card, username=author["username"], is_liked=is_liked, user_avatar=author["avatar"] or "")
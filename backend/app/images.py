@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from .models import Image
+from .schemas import RecCreate
+
+# Uploaded rec images and avatars. The upload is streamed to a temporary file while
+# it is hashed; images are content-addressed by that SHA-256, so the same picture
+# uploaded twice is processed once. Decoding and resizing run in a process pool
+# (IMAGE_WORKERS), off the event loop and outside the GIL, and produce WebP and
+# JPEG variants at a few widths. Variants are recorded in the images table and
+# copied onto Rec.image_variants / User.avatar_variants so clients can pick the
+# smallest size that fits.
+
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "local")
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", Path(__file__).resolve().parent.parent / "media"))
+# Public prefix of stored files: a CDN in front of this app's /media mount, or the
+# bucket's URL when IMAGE_STORAGE=s3. Unset, URLs point at /media on the host the
+# upload came in on.
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "").rstrip("/")
+IMAGE_BUCKET = os.getenv("IMAGE_BUCKET", "")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Larger images are rejected from their header, before any pixel is decoded
+# (decompression bombs)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(40_000_000)))
+CHUNK_BYTES = 1024 * 1024
+# Room for the multipart boundary and part headers around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+TOO_LARGE = f"Images are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+TOO_MANY_PIXELS = f"Images are limited to {MAX_IMAGE_PIXELS / 1_000_000:g} megapixels"
+
+# Target widths per kind; a source narrower than a width is not upscaled. Avatars
+# are cropped square.
+VARIANT_WIDTHS = {
+    "rec": (320, 640, 1280),
+    "avatar": (64, 128, 256),
+}
+# The variant an old client gets in Rec.image / User.avatar. Feed avatars render at
+# 40px, so 128 covers high-density screens.
+DEFAULT_WIDTH = {"rec": 640, "avatar": 128}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+class ImageError(Exception):
+    pass
+
+class ImageTooLarge(ImageError):
+    # Over MAX_UPLOAD_BYTES or MAX_IMAGE_PIXELS; the router answers 413
+    pass
+
+class LocalStorage:
+    # Files under MEDIA_ROOT, served by the /media mount in main.py
+    def __init__(self, root: Path = MEDIA_ROOT):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put(self, key: str, path: Path, content_type: str):
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(path, target)
+
+class S3Storage:
+    # Any S3-compatible bucket. Needs the optional `boto3` package; credentials come
+    # from the usual AWS_* environment variables.
+    def __init__(self, bucket: str = IMAGE_BUCKET):
+        import boto3
+        self.client = boto3.client("s3", endpoint_url=os.getenv("S3_ENDPOINT_URL") or None)
+        self.bucket = bucket
+
+    def put(self, key: str, path: Path, content_type: str):
+        self.client.upload_file(str(path), self.bucket, key, ExtraArgs={
+            "ContentType": content_type,
+            # Keys are content hashes, so a stored file never changes
+            "CacheControl": "public, max-age=31536000, immutable",
+        })
+
+def make_storage():
+    if IMAGE_STORAGE == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+storage = make_storage()
+
+_pool = None
+
+def pool() -> ProcessPoolExecutor:
+    # Created on first upload, so workers that never see one don't fork
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+def render_variants(source: str, out_dir: str, kind: str) -> tuple[int, int, list[dict]]:
+    # Runs in a pool process. Returns the source size and, per width, the written
+    # files (relative to out_dir).
+    from PIL import Image as PILImage, ImageOps
+
+    # Pillow only raises past twice its limit and merely warns below that, so the
+    # size from the header is checked here as well
+    PILImage.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    widths = VARIANT_WIDTHS[kind]
+    try:
+        with PILImage.open(source) as im:
+            if im.width * im.height > MAX_IMAGE_PIXELS:
+                raise ImageTooLarge(TOO_MANY_PIXELS)
+            # JPEG can decode at 1/2, 1/4 or 1/8 scale directly, far cheaper than a full decode
+            im.draft("RGB", (max(widths), max(widths)))
+            im = ImageOps.exif_transpose(im)
+            im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+            width, height = im.size
+            # Widths below the source's, then the source's own (capped at the largest)
+            limit = min(width, height) if kind == "avatar" else width
+            targets = [target for target in widths if target < limit] + [min(limit, max(widths))]
+            variants = []
+            for target in dict.fromkeys(targets):
+                if kind == "avatar":
+                    resized = ImageOps.fit(im, (target, target), PILImage.LANCZOS)
+                else:
+                    resized = im.copy()
+                    resized.thumbnail((target, target * 4), PILImage.LANCZOS)
+                files = {"webp": f"{target}.webp", "jpeg": f"{target}.jpg"}
+                resized.save(Path(out_dir) / files["webp"], "WEBP", quality=WEBP_QUALITY, method=4)
+                flat = resized
+                if resized.mode == "RGBA":
+                    flat = PILImage.new("RGB", resized.size, (255, 255, 255))
+                    flat.paste(resized, mask=resized.getchannel("A"))
+                flat.save(Path(out_dir) / files["jpeg"], "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+                variants.append({"width": resized.width, "height": resized.height, **files})
+            return width, height, variants
+    except PILImage.DecompressionBombError:
+        raise ImageTooLarge(TOO_MANY_PIXELS)
+    except (PILImage.UnidentifiedImageError, OSError):
+        raise ImageError("Not a supported image")
+
+async def save_upload(file: UploadFile, directory: str, kind: str) -> tuple[str, Path]:
+    # Copies the upload to a temporary file in chunks, hashing as it goes. The kind is
+    # part of the hash because the same picture gets different variants as an avatar.
+    digest = hashlib.sha256(kind.encode() + b":")
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as out:
+        while chunk := await file.read(CHUNK_BYTES):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise ImageTooLarge(TOO_LARGE)
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), Path(path)
+
+class UploadLimitMiddleware:
+    # Starlette spools the whole multipart body to disk before the route runs, so
+    # the cap in save_upload alone would come after the disk and I/O were spent.
+    # Uploads declaring a larger Content-Length are refused unread, and a body
+    # without one stops being read as soon as it crosses the cap.
+    def __init__(self, app, path: str = "/images", limit: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.path = path
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].rstrip("/") != self.path:
+            await self.app(scope, receive, send)
+            return
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > self.limit:
+            await JSONResponse({"detail": TOO_LARGE}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Raised inside the form parser; FastAPI passes HTTPException through
+                    raise HTTPException(status_code=413, detail=TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def variant_urls(base_url: str, image_id: str, variants: list[dict]) -> list[dict]:
+    return [
+        {
+            "width": variant["width"], "height": variant["height"],
+            "webp": f"{base_url}/{image_id}/{variant['webp']}",
+            "jpeg": f"{base_url}/{image_id}/{variant['jpeg']}",
+        }
+        for variant in variants
+    ]
+
+def default_url(image: Image) -> str:
+    # JPEG, for clients that only read Rec.image / User.avatar
+    target = DEFAULT_WIDTH[image.kind]
+    return next((variant for variant in image.variants if variant["width"] >= target), image.variants[-1])["jpeg"]
+
+def get(db: Session, image_id: str, kind: str) -> Image:
+    image = db.get(Image, image_id)
+    if image is None or image.kind != kind:
+        raise ImageError("Unknown image")
+    return image
+
+def rec_fields(db: Session, recs: list[RecCreate]) -> list[dict]:
+    # Column values for new recs: an image_id is swapped for the image's default URL
+    # and variants, looked up for the whole batch at once
+    ids = {rec.image_id for rec in recs if rec.image_id}
+    found = {image.id: image for image in db.query(Image).filter(Image.id.in_(ids), Image.kind == "rec")} if ids else {}
+    if ids - found.keys():
+        raise ImageError("Unknown image")
+    rows = []
+    for rec in recs:
+        row = rec.model_dump(exclude={"image_id"})
+        if rec.image_id:
+            image = found[rec.image_id]
+            row["image"], row["image_variants"] = default_url(image), image.variants
+        rows.append(row)
+    return rows
+
+async def ingest(db: Session, file: UploadFile, kind: str, user_id: int, base_url: str) -> Image:
+    with tempfile.TemporaryDirectory() as work:
+        image_id, source = await save_upload(file, work, kind)
+        image = await run_in_threadpool(db.get, Image, image_id)
+        if image is not None:
+            return image
+        width, height, variants = await asyncio.get_running_loop().run_in_executor(pool(), render_variants, str(source), work, kind)
+        for variant in variants:
+            for format, content_type in (("webp", "image/webp"), ("jpeg", "image/jpeg")):
+                await run_in_threadpool(storage.put, f"{image_id}/{variant[format]}", Path(work) / variant[format], content_type)
+
+    def record():
+        # A concurrent upload of the same bytes may have got here first; its files are identical
+        image = db.get(Image, image_id)
+        if image is not None:
+            return image
+        db.add(Image(id=image_id, user_id=user_id, kind=kind, width=width, height=height, variants=variant_urls(base_url, image_id, variants)))
+        try:
+            db.commit()
+        except IntegrityError:
+            # ... or committed between the lookup and the insert
+            db.rollback()
+        return db.get(Image, image_id, populate_existing=True)
+
+    return await run_in_threadpool(record)
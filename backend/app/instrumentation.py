@@ -0,0 +1,202 @@
+import hmac
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from fastapi import Header, HTTPException
+from sqlalchemy import event
+from . import database
+from .cache import cache
+
+# Per-request database accounting. SQLAlchemy cursor events and the timed pools add
+# to the RequestStats of whichever request is running (tracked in a ContextVar,
+# which follows the handler into the threadpool and into run_sync greenlets).
+# RequestMetrics middleware turns it into a Server-Timing header, feeds the
+# /metrics exposition and logs N+1 patterns and slow statements.
+
+# Log when one statement runs more than this many times within a single request
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# /metrics, /cache/stats and /db/stats expose pool, cache and traffic internals, so
+# they are off unless this is set; scrapers send it as a bearer token
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.statements = Counter()
+
+current = ContextVar("request_stats", default=None)
+
+def require_metrics_token(authorization: str = Header("")):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_started
+    stats = current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.statements[statement] += 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%.0f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+def _on_checkout_wait(waited: float):
+    stats = current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += waited
+
+def instrument_engines():
+    engines = [
+        database.engine,
+        database.replica_engine,
+        database.async_engine and database.async_engine.sync_engine,
+        database.async_replica_engine and database.async_replica_engine.sync_engine,
+    ]
+    for eng in engines:
+        if eng is not None and not event.contains(eng, "before_cursor_execute", _before_cursor_execute):
+            event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+            event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+    if _on_checkout_wait not in database.checkout_listeners:
+        database.checkout_listeners.append(_on_checkout_wait)
+
+class Registry:
+    # Process-wide aggregates, keyed by route template rather than raw path
+    def __init__(self):
+        self.requests = Counter()
+        self.duration_buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.queries = Counter()
+        self.db_seconds = Counter()
+        self.pool_wait_seconds = Counter()
+        self.n_plus_one = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats, repeated: int):
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            buckets = self.duration_buckets[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.duration_sum[key] += seconds
+            self.duration_count[key] += 1
+            self.queries[key] += stats.queries
+            self.db_seconds[key] += stats.db_seconds
+            self.pool_wait_seconds[key] += stats.pool_wait_seconds
+            self.n_plus_one[key] += repeated
+
+registry = Registry()
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+def render_metrics() -> str:
+    # Prometheus text exposition format
+    lines = []
+
+    def metric(name: str, kind: str, help: str, samples):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+    with registry.lock:
+        metric("http_requests_total", "counter", "Requests by route and status.", [
+            (_labels(method=method, route=route, status=status), count)
+            for (method, route, status), count in sorted(registry.requests.items())
+        ])
+        histogram = []
+        for (method, route), buckets in sorted(registry.duration_buckets.items()):
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                histogram.append((_labels(method=method, route=route, le=bound), count))
+            histogram.append((_labels(method=method, route=route, le="+Inf"), registry.duration_count[(method, route)]))
+        lines.append("# HELP http_request_duration_seconds Request latency.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        lines.extend(f"http_request_duration_seconds_bucket{labels} {value}" for labels, value in histogram)
+        for (method, route), total in sorted(registry.duration_sum.items()):
+            labels = _labels(method=method, route=route)
+            lines.append(f"http_request_duration_seconds_sum{labels} {total}")
+            lines.append(f"http_request_duration_seconds_count{labels} {registry.duration_count[(method, route)]}")
+        for name, kind, help, values in [
+            ("db_queries_total", "counter", "SQL statements issued by requests.", registry.queries),
+            ("db_query_seconds_total", "counter", "Time requests spent executing SQL.", registry.db_seconds),
+            ("db_pool_wait_seconds_total", "counter", "Time requests waited for a pooled connection.", registry.pool_wait_seconds),
+            ("db_n_plus_one_total", "counter", f"Requests that repeated one statement more than {N_PLUS_ONE_THRESHOLD} times.", registry.n_plus_one),
+        ]:
+            metric(name, kind, help, [(_labels(method=method, route=route), value) for (method, route), value in sorted(values.items())])
+
+    cache_stats = cache.stats()
+    metric("cache_hits_total", "counter", "Read-through cache hits.", [("", cache_stats["hits"])])
+    metric("cache_misses_total", "counter", "Read-through cache misses.", [("", cache_stats["misses"])])
+    metric("cache_evictions_total", "counter", "Entries evicted by the cache backend.", [("", cache_stats["evictions"])])
+    metric("cache_entries", "gauge", "Entries held by the cache backend.", [("", cache_stats["size"])])
+
+    pools = database.pool_metrics()
+    for name, key, kind, help in [
+        ("db_pool_size", "size", "gauge", "Configured pool size."),
+        ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out."),
+        ("db_pool_overflow", "overflow", "gauge", "Connections open beyond pool_size."),
+        ("db_pool_checkouts_total", "checkouts", "counter", "Connection checkouts."),
+        ("db_pool_wait_seconds_max", "wait_seconds_max", "gauge", "Longest checkout wait."),
+        ("db_pool_timeouts_total", "timeouts", "counter", "Checkouts that timed out."),
+    ]:
+        metric(name, kind, help, [(_labels(pool=pool), values[key]) for pool, values in pools.items() if values[key] is not None])
+    return "\n".join(lines) + "\n"
+
+class RequestMetrics:
+    # Pure ASGI middleware, so streaming responses pass through untouched
+    def __init__(self, app):
+        self.app = app
+        instrument_engines()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total = time.perf_counter() - started
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"pool;dur={stats.pool_wait_seconds * 1000:.1f}, "
+                    f"app;dur={(total - stats.db_seconds) * 1000:.1f}, "
+                    f"total;dur={total * 1000:.1f}"
+                )
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            repeated = [(statement, count) for statement, count in stats.statements.items() if count > N_PLUS_ONE_THRESHOLD]
+            for statement, count in repeated:
+                logger.warning(
+                    "N+1 on %s %s: statement ran %d times: %s",
+                    scope["method"], route, count, " ".join(statement.split())[:500],
+                )
+            registry.observe(scope["method"], route, status, time.perf_counter() - started, stats, 1 if repeated else 0)
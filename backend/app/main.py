@@ -1,11 +1,36 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine, Base
-from .routers import auth, recs, users, notifications
+from fastapi.responses import PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from .database import DB_MODE, SessionLocal, pool_metrics
+from .routers import auth, recs, users, notifications, unfurl, images as image_routes
+from .routers.asyncify import asyncify
+from .cache import cache
+from .instrumentation import RequestMetrics, render_metrics, require_metrics_token
+from .compression import CompressionMiddleware
+from . import outbox, images, suggestions, trending, similar, purge
 
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (backend/migrations): run `alembic upgrade head`
+# before starting the app.
 
-app = FastAPI(title="recs API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = outbox.start_worker(SessionLocal) if outbox.OUTBOX_WORKER else None
+    graph_worker = suggestions.start_worker(SessionLocal) if suggestions.SUGGESTIONS_PRELOAD else None
+    trending_worker = trending.start_worker(SessionLocal) if trending.TRENDING_WORKER else None
+    similar_worker = similar.start_worker(SessionLocal) if similar.SIMILAR_WORKER else None
+    purge_worker = purge.start_worker(SessionLocal) if purge.PURGE_WORKER else None
+    yield
+    for thread in (worker, graph_worker, trending_worker, similar_worker, purge_worker):
+        if thread:
+            thread.stop()
+
+app = FastAPI(title="recs API", lifespan=lifespan)
+
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(images.UploadLimitMiddleware)
+app.add_middleware(RequestMetrics)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,12 +43,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def mount(router):
+    app.include_router(asyncify(router) if DB_MODE == "async" else router)
+
+# auth, unfurl and images are never asyncified: their handlers are already async and
+# their cost (bcrypt, remote fetches, resizing) runs on its own executor or limit
 app.include_router(auth.router)
-app.include_router(recs.router)
-app.include_router(users.router)
+app.include_router(unfurl.router)
+app.include_router(image_routes.router)
+
+# Uploaded images, when they are stored locally. Also named for url_for, which the
+# upload route uses to build variant URLs when MEDIA_BASE_URL is unset.
+app.mount("/media", StaticFiles(directory=images.MEDIA_ROOT, check_dir=False), name="media")
+mount(recs.router)
+mount(users.router)
 
 @app.get("/")
 def root():
     return {"message": "recs API is running"}
 
-app.include_router(notifications.router)
+# Internal endpoints: not found unless METRICS_TOKEN is set, then only for requests
+# bearing it (see instrumentation.require_metrics_token)
+
+@app.get("/cache/stats", dependencies=[Depends(require_metrics_token)])
+def cache_stats():
+    return cache.stats()
+
+@app.get("/db/stats", dependencies=[Depends(require_metrics_token)])
+def db_stats():
+    return pool_metrics()
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+def metrics():
+    # Prometheus scrape target; also covers what /cache/stats and /db/stats report
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+mount(notifications.router)
@@ -1,9 +1,18 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, Index, UniqueConstraint, DDL, JSON, event, literal_column, true
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+import sqlalchemy.dialects.postgresql  # registers the typed to_tsvector used by REC_SEARCH_VECTOR
 from .database import Base
 
+def rec_search_vector(title, description, category):
+    # Full-text document for rec search. app.search queries the exact same expression
+    # so Postgres can use ix_recs_search.
+    return func.to_tsvector(
+        literal_column("'english'"),
+        title + literal_column("' '") + func.coalesce(description, literal_column("''")) + literal_column("' '") + category,
+    )
+
 class User(Base):
     __tablename__ = "users"
     
@@ -13,71 +22,280 @@ class User(Base):
     password = Column(String(255), nullable=False)  
     bio = Column(Text, default="")
     avatar = Column(String(255), default="")
+    # Resized copies of an uploaded avatar (app.images); avatar holds the default one
+    avatar_variants = Column(JSON, nullable=False, default=list, server_default="[]")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Denormalized counters, maintained by app.counters
+    recs_count = Column(Integer, nullable=False, default=0, server_default="0")
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped by every UPDATE of the row, counters included; HTTP validators (app.http_cache)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    # Set when the account is deleted: hidden at once, removed by app.purge
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
     
     
     recs = relationship("Rec", back_populates="user")
-    
+
+    __table_args__ = (
+        # Trigram index for substring/fuzzy username search (Postgres only; app.search
+        # falls back to an in-process index elsewhere)
+        Index(
+            "ix_users_username_trgm", "username",
+            postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # app.purge's queue; partial, so it only holds accounts waiting to be purged
+        Index("ix_users_deleted_at", "deleted_at", postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
+
+event.listen(User.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
 
 class Rec(Base):
     __tablename__ = "recs"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     category = Column(String(50), nullable=False)
     title = Column(String(200), nullable=False)
     description = Column(Text, default="")
     link = Column(String(500), default="")
     image = Column(String(500), default="")
+    # Resized copies of an uploaded image (app.images); image holds the default one
+    image_variants = Column(JSON, nullable=False, default=list, server_default="[]")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped by every UPDATE of the row, counters included; HTTP validators (app.http_cache)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    # Set by delete_rec: hidden at once, removed with its likes and comments by app.purge
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # False when the author was over the fan-out limit at posting time: followers'
+    # feeds pull it at read time instead of holding a timeline entry (app.timeline)
+    fanned_out = Column(Boolean, nullable=False, default=True, server_default=true())
     
     
     user = relationship("User", back_populates="recs")
     likes = relationship("Like", back_populates="rec")
 
+    __table_args__ = (
+        # Keyset pagination for profile pages and the feed: one bounded range scan per author
+        Index("ix_recs_user_created_id", "user_id", created_at.desc(), "id"),
+        Index("ix_recs_search", rec_search_vector(title, description, category), postgresql_using="gin").ddl_if(dialect="postgresql"),
+        # Window scans of app.trending's refresh
+        Index("ix_recs_created_at", "created_at"),
+        Index("ix_recs_deleted_at", "deleted_at", postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+        # The recs feeds merge at read time, a range per followed author
+        Index("ix_recs_pulled", "user_id", created_at.desc(), "id", postgresql_where=fanned_out == False, sqlite_where=fanned_out == False),
+    )
+
+
+REC_SEARCH_VECTOR = rec_search_vector(Rec.title, Rec.description, Rec.category)
+
 
 class Follow(Base):
     __tablename__ = "follows"
     
     id = Column(Integer, primary_key=True, index=True)
-    follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)  
-    following_id = Column(Integer, ForeignKey("users.id"), nullable=False) 
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  
+    following_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False) 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        # Conflict target for INSERT ... ON CONFLICT DO NOTHING in bulk.follow
+        UniqueConstraint("follower_id", "following_id", name="uq_follows_follower_following"),
+        # Keyset pagination of following / followers lists
+        Index("ix_follows_follower_created_id", "follower_id", created_at.desc(), "id"),
+        Index("ix_follows_following_created_id", "following_id", created_at.desc(), "id"),
+    )
+
+
+class TimelineEntry(Base):
+    __tablename__ = "timeline"
+
+    # One row per (reader, rec); the primary key doubles as the feed's range-scan index
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True)
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_timeline_user_author", "user_id", "author_id"),
+        Index("ix_timeline_rec", "rec_id"),
+        # Deleting a user checks for timeline rows they authored
+        Index("ix_timeline_author", "author_id"),
+    )
+
 
 class Like(Base):
     __tablename__ = "likes"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    rec_id = Column(Integer, ForeignKey("recs.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
 
     rec = relationship("Rec", back_populates="likes")
 
+    __table_args__ = (
+        # Conflict target for INSERT ... ON CONFLICT DO NOTHING in bulk.like
+        UniqueConstraint("user_id", "rec_id", name="uq_likes_user_rec"),
+        Index("ix_likes_rec_id", "rec_id"),
+        Index("ix_likes_created_at", "created_at"),
+    )
+
 class Comment(Base):
     __tablename__ = "comments"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    rec_id = Column(Integer, ForeignKey("recs.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"))
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User")
     rec = relationship("Rec")
 
+    __table_args__ = (
+        # Comment threads and the per-rec latest-N preview
+        Index("ix_comments_rec_created_id", "rec_id", "created_at", "id"),
+        Index("ix_comments_created_at", "created_at"),
+        Index("ix_comments_user_id", "user_id"),
+    )
+
 class Notification(Base):
     __tablename__ = "notifications"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    from_user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    from_user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     type = Column(String(50))  # 'like', 'comment', 'follow'
-    rec_id = Column(Integer, ForeignKey("recs.id"), nullable=True)
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), nullable=True)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Coalesced notifications: from_user_id is the latest actor, actor_count all of them
+    actor_count = Column(Integer, nullable=False, default=1, server_default="1")
+    # The distinct actors merged so far, so one who comes back is not counted twice;
+    # NULL on rows from before it was kept, which stand for [from_user_id]
+    actor_ids = Column(JSON, nullable=True)
     
     user = relationship("User", foreign_keys=[user_id])
-    from_user = relationship("User", foreign_keys=[from_user_id])
\ No newline at end of file
+    from_user = relationship("User", foreign_keys=[from_user_id])
+
+    __table_args__ = (
+        # Keyset pagination of a user's notifications, newest first
+        Index("ix_notifications_user_created_id", "user_id", created_at.desc(), "id"),
+        Index("ix_notifications_rec_id", "rec_id"),
+        Index("ix_notifications_from_user_id", "from_user_id"),
+        # Unread counts and coalescing: one range past the user's read watermark
+        Index("ix_notifications_user_unread", "user_id", "is_read", "created_at"),
+        # Retention pruning in app.purge
+        Index("ix_notifications_created_at", "created_at"),
+    )
+
+class NotificationWatermark(Base):
+    # Notifications created up to read_at count as read, so "mark all read" moves
+    # one timestamp instead of updating every unread row
+    __tablename__ = "notification_watermarks"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Naive UTC, like notifications.created_at
+    read_at = Column(DateTime, nullable=False)
+
+
+class RecScore(Base):
+    # Time-decayed trending scores, maintained by app.trending. Only recs posted,
+    # liked or commented on within TRENDING_WINDOW_DAYS have a row.
+    __tablename__ = "rec_scores"
+
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), primary_key=True)
+    # Copied from the rec so a category's top-K is one index range
+    category = Column(String(50), nullable=False)
+    # Relative to the start of `epoch`; comparable between rows of the same epoch
+    score = Column(Float, nullable=False)
+    epoch = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rec_scores_score", score.desc(), rec_id.desc()),
+        Index("ix_rec_scores_category_score", "category", score.desc(), rec_id.desc()),
+    )
+
+
+class RecSimilar(Base):
+    # "More like this": the top SIMILAR_RECS recs per rec by cosine similarity of
+    # their likers, written by app.similar
+    __tablename__ = "rec_similar"
+
+    rec_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), primary_key=True)
+    similar_id = Column(Integer, ForeignKey("recs.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_rec_similar_rec_score", "rec_id", score.desc(), "similar_id"),
+        # Dropping a deleted rec from other recs' lists
+        Index("ix_rec_similar_similar_id", "similar_id"),
+    )
+
+
+class SimilarityRun(Base):
+    # Completed app.similar runs; the latest one's start is the next incremental
+    # run's watermark
+    __tablename__ = "similarity_runs"
+
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=False)
+    full = Column(Boolean, nullable=False)
+    recs = Column(Integer, nullable=False)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Failed handler runs; at OUTBOX_MAX_ATTEMPTS the event is parked and skipped
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    parked_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The queue: pending events from the head, past any parked ones
+        Index("ix_outbox_pending", "id", postgresql_where=parked_at.is_(None), sqlite_where=parked_at.is_(None)),
+    )
+
+
+class LinkPreview(Base):
+    # Persistent cache for app.unfurl, keyed by the SHA-256 of the normalized URL
+    __tablename__ = "link_previews"
+
+    key = Column(String(64), primary_key=True)
+    url = Column(Text, nullable=False)
+    title = Column(String(300), nullable=False, default="")
+    description = Column(Text, nullable=False, default="")
+    image = Column(String(500), nullable=False, default="")
+    site_name = Column(String(100), nullable=False, default="")
+    # Set when the fetch failed; such rows expire after UNFURL_FAILURE_TTL_MINUTES
+    error = Column(String(200), nullable=True)
+    fetched_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class Image(Base):
+    # Uploads processed by app.images, keyed by the SHA-256 of kind and content
+    __tablename__ = "images"
+
+    id = Column(String(64), primary_key=True)
+    # Uploader; cleared when the account is deleted, as other recs may use the same image
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+    kind = Column(String(20), nullable=False)  # 'rec', 'avatar'
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    # [{"width", "height", "webp", "jpeg"}], narrowest first
+    variants = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
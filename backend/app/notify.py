@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy.orm import Session
+from .models import Notification, NotificationWatermark, Rec, User
+from .schemas import NotificationOut
+from .cache import cache, user_key
+from .hydration import user_card
+
+# In-process fan-out of new notifications to open /notifications/stream connections.
+# Handlers run in the threadpool, so publish() hands events to each subscriber's
+# event loop with call_soon_threadsafe. Subscribers connected to another worker
+# process are caught up by the stream's periodic database check instead.
+
+class Broker:
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=100)
+        with self.lock:
+            self.subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self.lock:
+            self.subscribers[user_id] = {sub for sub in self.subscribers[user_id] if sub[1] is not queue}
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+    def publish(self, user_id: int, payload: dict):
+        with self.lock:
+            subscribers = list(self.subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_put, queue, payload)
+
+def _put(queue: asyncio.Queue, payload: dict):
+    # A client that stops reading loses events rather than growing the queue;
+    # it catches up from the database on its next heartbeat.
+    if not queue.full():
+        queue.put_nowait(payload)
+
+broker = Broker()
+
+def read_watermark(db: Session, user_id: int) -> datetime | None:
+    # Set by "mark all read"; notifications created up to it are read
+    return db.query(NotificationWatermark.read_at).filter(NotificationWatermark.user_id == user_id).scalar()
+
+def to_out(notification: Notification, from_username: str | None, from_avatar: str | None, read_at: datetime | None = None) -> NotificationOut:
+    return NotificationOut(
+        id=notification.id,
+        type=notification.type,
+        rec_id=notification.rec_id,
+        is_read=notification.is_read or (read_at is not None and notification.created_at <= read_at),
+        created_at=notification.created_at,
+        from_username=from_username or "",
+        from_user_avatar=from_avatar or "",
+        others_count=(notification.actor_count or 1) - 1
+    )
+
+def publish(db: Session, notification: Notification):
+    # Call after the notification is committed
+    if notification.user_id not in broker.subscribers:
+        return
+    sender = cache.get_or_load(user_key(notification.from_user_id), lambda: user_card(db, notification.from_user_id)) or {}
+    out = to_out(notification, sender.get("username"), sender.get("avatar"))
+    broker.publish(notification.user_id, out.model_dump(mode="json"))
+
+def joined_query(db: Session, user_id: int):
+    # Notifications from deleted accounts or about deleted recs are hidden until
+    # app.purge removes them
+    return db.query(Notification, User.username, User.avatar).outerjoin(
+        User, User.id == Notification.from_user_id
+    ).outerjoin(Rec, Rec.id == Notification.rec_id).filter(
+        Notification.user_id == user_id, User.deleted_at.is_(None), Rec.deleted_at.is_(None)
+    )
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from .models import OutboxEvent, Notification, NotificationWatermark, Rec, User
+from . import notify
+
+# Transactional outbox for side effects of write endpoints. A handler enqueues an
+# event in the same transaction as its primary write and returns after a single
+# commit; the worker thread started from main.py picks events up in batches.
+
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "true").lower() == "true"
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1.0"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Unread notifications of the same kind about the same rec within this window are
+# merged into one ("X and 12 others liked your rec")
+NOTIFICATION_COALESCE_MINUTES = int(os.getenv("NOTIFICATION_COALESCE_MINUTES", "60"))
+# Failed runs before an event is parked: kept in the table with its last error, but
+# no longer picked up
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+logger = logging.getLogger(__name__)
+
+def enqueue(db: Session, kind: str, payload: dict):
+    db.add(OutboxEvent(kind=kind, payload=payload))
+
+def handle_notifications(db: Session, payloads: list[dict]) -> list[Notification]:
+    actors = defaultdict(list)
+    for payload in payloads:
+        key = (payload["user_id"], payload["type"], payload.get("rec_id"))
+        if payload["from_user_id"] != payload["user_id"] and payload["from_user_id"] not in actors[key]:
+            actors[key].append(payload["from_user_id"])
+
+    # Recs and accounts deleted after the event was enqueued get no notification
+    rec_ids = {rec_id for _, _, rec_id in actors if rec_id is not None}
+    live_rec_ids = {rec_id for rec_id, in db.query(Rec.id).filter(Rec.id.in_(rec_ids), Rec.deleted_at.is_(None))} if rec_ids else set()
+    user_ids = {user_id for user_id, _, _ in actors} | {user_id for from_user_ids in actors.values() for user_id in from_user_ids}
+    live_user_ids = {user_id for user_id, in db.query(User.id).filter(User.id.in_(user_ids), User.deleted_at.is_(None))} if user_ids else set()
+    # Notifications the recipient has marked read are not merged into
+    recipients = {user_id for user_id, _, _ in actors}
+    read_at = dict(db.query(NotificationWatermark.user_id, NotificationWatermark.read_at).filter(NotificationWatermark.user_id.in_(recipients)))
+
+    now = datetime.utcnow()
+    window_start = now - timedelta(minutes=NOTIFICATION_COALESCE_MINUTES)
+    groups = {}
+    for (user_id, type, rec_id), from_user_ids in actors.items():
+        from_user_ids = [from_user_id for from_user_id in from_user_ids if from_user_id in live_user_ids]
+        if from_user_ids and user_id in live_user_ids and (rec_id is None or rec_id in live_rec_ids):
+            groups[user_id, type, rec_id] = from_user_ids
+
+    # The unread notification each group merges into, for the whole batch in one
+    # range of ix_notifications_user_unread per recipient; the newest wins
+    existing = {}
+    if groups:
+        candidates = db.query(Notification).filter(
+            Notification.user_id.in_({user_id for user_id, _, _ in groups}),
+            Notification.is_read == False,
+            Notification.created_at >= window_start,
+        ).order_by(Notification.id)
+        for notification in candidates:
+            key = (notification.user_id, notification.type, notification.rec_id)
+            if key in groups and notification.created_at > read_at.get(notification.user_id, datetime.min):
+                existing[key] = notification
+
+    written = []
+    for (user_id, type, rec_id), from_user_ids in groups.items():
+        notification = existing.get((user_id, type, rec_id))
+        if notification:
+            known = notification.actor_ids or [notification.from_user_id]
+            new_ids = [from_user_id for from_user_id in from_user_ids if from_user_id not in known]
+            if not new_ids:
+                # Everyone here was already counted, e.g. an unlike and like again
+                continue
+            notification.from_user_id = from_user_ids[-1]
+            notification.actor_ids = known + new_ids
+            notification.actor_count += len(new_ids)
+            notification.created_at = now
+        else:
+            notification = Notification(
+                user_id=user_id,
+                from_user_id=from_user_ids[-1],
+                type=type,
+                rec_id=rec_id,
+                actor_ids=from_user_ids,
+                actor_count=len(from_user_ids),
+                created_at=now
+            )
+            db.add(notification)
+        written.append(notification)
+    return written
+
+HANDLERS = {"notification": handle_notifications}
+
+def _handle(db: Session, events: list[OutboxEvent]) -> list:
+    by_kind = defaultdict(list)
+    for event in events:
+        by_kind[event.kind].append(event.payload)
+    written = []
+    for kind, payloads in by_kind.items():
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            logger.error("No outbox handler for %r; dropping %d events", kind, len(payloads))
+            continue
+        written += handler(db, payloads) or []
+    for event in events:
+        db.delete(event)
+    return written
+
+def _pending(db: Session):
+    # SKIP LOCKED lets several workers drain the outbox without double-processing
+    return db.query(OutboxEvent).filter(OutboxEvent.parked_at.is_(None)).order_by(OutboxEvent.id).with_for_update(skip_locked=True)
+
+def _process_one(db: Session, event_id: int) -> list:
+    # After a batch fails, each of its events runs in its own transaction so the
+    # one that fails does not hold back the others
+    event = _pending(db).filter(OutboxEvent.id == event_id).first()
+    if event is None:
+        db.rollback()
+        return []
+    try:
+        written = _handle(db, [event])
+        db.commit()
+        return written
+    except Exception as e:
+        db.rollback()
+        _failed(db, event_id, e)
+        return []
+
+def _failed(db: Session, event_id: int, error: Exception):
+    event = db.get(OutboxEvent, event_id)
+    event.attempts += 1
+    event.last_error = f"{type(error).__name__}: {error}"[:1000]
+    if event.attempts >= OUTBOX_MAX_ATTEMPTS:
+        event.parked_at = datetime.utcnow()
+        logger.error("Outbox event %d (%s) parked after %d attempts: %s", event_id, event.kind, event.attempts, event.last_error)
+    else:
+        logger.warning("Outbox event %d (%s) failed, attempt %d of %d: %s", event_id, event.kind, event.attempts, OUTBOX_MAX_ATTEMPTS, event.last_error)
+    db.commit()
+
+def process_batch(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> int:
+    events = _pending(db).limit(limit).all()
+    if not events:
+        db.rollback()
+        return 0
+
+    event_ids = [event.id for event in events]
+    try:
+        written = _handle(db, events)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Outbox batch of %d events failed; retrying them one at a time", len(event_ids))
+        written = []
+        for event_id in event_ids:
+            written += _process_one(db, event_id)
+
+    for notification in written:
+        notify.publish(db, notification)
+    return len(event_ids)
+
+def drain(db: Session) -> int:
+    processed = 0
+    while count := process_batch(db):
+        processed += count
+    return processed
+
+class Worker(threading.Thread):
+    def __init__(self, session_factory):
+        super().__init__(name="outbox-worker", daemon=True)
+        self.session_factory = session_factory
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            db = self.session_factory()
+            try:
+                processed = process_batch(db)
+            except Exception:
+                logger.exception("Outbox batch failed")
+                db.rollback()
+                processed = 0
+            finally:
+                db.close()
+            if processed < OUTBOX_BATCH_SIZE:
+                # Waiting between batches is also what lets bursts coalesce
+                self.stopped.wait(OUTBOX_POLL_SECONDS)
+
+    def stop(self):
+        self.stopped.set()
+        self.join(timeout=5)
+
+def start_worker(session_factory) -> Worker:
+    worker = Worker(session_factory)
+    worker.start()
+    return worker
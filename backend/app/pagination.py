@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_offset(offset: int) -> str:
+    # For ranked results (search), where there is no stable (created_at, id) order
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+def decode_offset(cursor: str | None) -> int:
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return max(0, int(json.loads(raw)["offset"]))
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_before(query, created_col, id_col, cursor: str | None):
+    if not cursor:
+        return query
+    created_at, last_id = decode_cursor(cursor)
+    return query.filter(tuple_(created_col, id_col) < tuple_(created_at, last_id))
+
+def keyset_after(query, created_col, id_col, cursor: str | None):
+    if not cursor:
+        return query
+    created_at, last_id = decode_cursor(cursor)
+    return query.filter(tuple_(created_col, id_col) > tuple_(created_at, last_id))
+
+def paginate_desc(query, created_col, id_col, cursor: str | None, skip: int, limit: int, key=lambda row: row):
+    # Keyset pagination over (created_at, id) newest first. With no cursor, skip/offset
+    # is still honoured so older clients keep working.
+    query = query.order_by(created_col.desc(), id_col.desc())
+    if cursor:
+        query = keyset_before(query, created_col, id_col, cursor)
+    elif skip:
+        query = query.offset(skip)
+    return _page(query, limit, key)
+
+def paginate_asc(query, created_col, id_col, cursor: str | None, limit: int, key=lambda row: row):
+    # Oldest first, e.g. comment threads
+    query = keyset_after(query.order_by(created_col.asc(), id_col.asc()), created_col, id_col, cursor)
+    return _page(query, limit, key)
+
+def _page(query, limit: int, key):
+    # One extra row is fetched so next_cursor is only returned when there really is more
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = key(rows[-1])
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
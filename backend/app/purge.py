@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.orm import Session
+from .models import User, Rec, Follow, Like, Comment, Notification, NotificationWatermark, TimelineEntry, RecScore, RecSimilar, Image
+from .cache import cache, rec_key, user_key
+from . import counters, search, suggestions, trending
+
+# Deferred deletion. Deleting a rec or an account only sets its deleted_at, which
+# every read filters on, so it disappears at once and the request is one UPDATE.
+# This worker then removes the rows that depend on it PURGE_BATCH_SIZE at a time,
+# committing between batches, so a rec with 100k likes or an account with years of
+# history never holds locks or builds WAL in one huge transaction. Counters on the
+# rows that stay (likes on other people's recs, follows) are fixed batch by batch.
+#
+# The foreign keys are ON DELETE CASCADE as well, so rows written while a purge is
+# running go with the final delete of the rec or account instead of blocking it.
+#
+# The same pass enforces notification retention: notifications older than
+# NOTIFICATION_RETENTION_DAYS, read or not, are deleted in batches from the head
+# of ix_notifications_created_at, so the table stays the size of the window.
+#
+#     python -m app.purge
+
+PURGE_WORKER = os.getenv("PURGE_WORKER", "true").lower() == "true"
+PURGE_POLL_SECONDS = float(os.getenv("PURGE_POLL_SECONDS", "30"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+# 0 keeps notifications forever
+NOTIFICATION_RETENTION_DAYS = float(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+# Deleted recs and accounts picked up per pass
+PURGE_QUEUE_SIZE = 100
+# A rec or account whose purge fails waits this long before the next try, doubling
+# with each failure up to PURGE_MAX_RETRY_SECONDS, while the rest of the queue moves on
+PURGE_RETRY_SECONDS = 60
+PURGE_MAX_RETRY_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+# Rows that go with a rec: (model, column holding the rec id)
+REC_DEPENDENTS = [
+    (Like, Like.rec_id),
+    (Comment, Comment.rec_id),
+    (Notification, Notification.rec_id),
+    (TimelineEntry, TimelineEntry.rec_id),
+    (RecSimilar, RecSimilar.rec_id),
+    (RecSimilar, RecSimilar.similar_id),
+    (RecScore, RecScore.rec_id),
+]
+
+def _batches(db: Session, model, condition, *returning, on_batch=None, after_commit=None) -> int:
+    # Deletes the rows matching condition, PURGE_BATCH_SIZE per statement and
+    # transaction. Each batch's RETURNING rows go to on_batch inside its
+    # transaction (counters) and to after_commit once it is committed (caches).
+    primary_key = list(model.__table__.primary_key.columns)
+    key = primary_key[0] if len(primary_key) == 1 else tuple_(*primary_key)
+    deleted = 0
+    while True:
+        batch = select(*primary_key).where(condition).limit(PURGE_BATCH_SIZE)
+        stmt = delete(model).where(key.in_(batch)).execution_options(synchronize_session=False)
+        rows = []
+        if returning:
+            rows = db.execute(stmt.returning(*returning)).all()
+            count = len(rows)
+            if on_batch and rows:
+                on_batch(rows)
+        else:
+            count = db.execute(stmt).rowcount
+        db.commit()
+        if after_commit and rows:
+            after_commit(rows)
+        deleted += count
+        if count < PURGE_BATCH_SIZE:
+            return deleted
+
+def _purge_recs(db: Session, rec_ids) -> int:
+    # rec_ids: a list or a SELECT of rec ids
+    def purged(rows):
+        cache.invalidate(*[rec_key(rec_id) for rec_id, in rows])
+        for rec_id, in rows:
+            search.unindex_rec(db, rec_id)
+
+    for model, column in REC_DEPENDENTS:
+        _batches(db, model, column.in_(rec_ids))
+    return _batches(db, Rec, Rec.id.in_(rec_ids), Rec.id, after_commit=purged)
+
+def purge_rec(db: Session, rec_id: int):
+    # delete_rec already took it out of recs_count and trending
+    _purge_recs(db, [rec_id])
+
+def purge_user(db: Session, user_id: int):
+    _purge_recs(db, select(Rec.id).where(Rec.user_id == user_id))
+
+    def recs_changed(rows):
+        cache.invalidate(*{rec_key(rec_id) for rec_id, *_ in rows})
+
+    def unliked(rows):
+        counters.recs_liked(db, [rec_id for rec_id, _ in rows], -1)
+        trending.likes_removed(db, rows)
+
+    def unfollowed(rows):
+        cache.invalidate(*[user_key(following_id) for following_id, in rows])
+        for following_id, in rows:
+            suggestions.unfollowed(user_id, following_id)
+
+    def unfollowed_by(rows):
+        cache.invalidate(*[user_key(follower_id) for follower_id, in rows])
+        for follower_id, in rows:
+            suggestions.unfollowed(follower_id, user_id)
+
+    _batches(
+        db, Like, Like.user_id == user_id, Like.rec_id, Like.created_at,
+        on_batch=unliked, after_commit=recs_changed,
+    )
+    _batches(
+        db, Comment, Comment.user_id == user_id, Comment.rec_id,
+        on_batch=lambda rows: counters.comments_removed(db, Counter(rec_id for rec_id, in rows)), after_commit=recs_changed,
+    )
+    _batches(
+        db, Follow, Follow.follower_id == user_id, Follow.following_id,
+        on_batch=lambda rows: counters.users_followed(db, user_id, [following_id for following_id, in rows], -1), after_commit=unfollowed,
+    )
+    _batches(
+        db, Follow, Follow.following_id == user_id, Follow.follower_id,
+        on_batch=lambda rows: counters.followers_removed(db, [follower_id for follower_id, in rows], user_id), after_commit=unfollowed_by,
+    )
+    _batches(db, Notification, Notification.user_id == user_id)
+    _batches(db, Notification, Notification.from_user_id == user_id)
+    _batches(db, TimelineEntry, TimelineEntry.user_id == user_id)
+    db.execute(delete(NotificationWatermark).where(NotificationWatermark.user_id == user_id))
+    # Uploads stay: other recs may show the same image
+    db.execute(update(Image).where(Image.user_id == user_id).values(user_id=None))
+    db.execute(delete(User).where(User.id == user_id))
+    db.commit()
+    cache.invalidate(user_key(user_id))
+
+# Purges that failed, per model: id -> (failures in a row, monotonic time of the
+# next try). Kept in memory, so a restarted worker retries them at once.
+_failed = {User: {}, Rec: {}}
+
+def _queue(db: Session, model) -> list[int]:
+    # Oldest deletions first, leaving out the ones waiting to be retried
+    now = time.monotonic()
+    waiting = [row_id for row_id, (_, retry_at) in _failed[model].items() if retry_at > now]
+    query = select(model.id).where(model.deleted_at.isnot(None))
+    if waiting:
+        query = query.where(model.id.notin_(waiting))
+    return db.scalars(query.order_by(model.deleted_at).limit(PURGE_QUEUE_SIZE)).all()
+
+def _attempt(db: Session, model, purge, row_id: int) -> bool:
+    try:
+        purge(db, row_id)
+    except Exception:
+        db.rollback()
+        failures = _failed[model].get(row_id, (0, 0))[0] + 1
+        delay = min(PURGE_RETRY_SECONDS * 2 ** (failures - 1), PURGE_MAX_RETRY_SECONDS)
+        _failed[model][row_id] = (failures, time.monotonic() + delay)
+        logger.exception("Purging %s %d failed (%d in a row), next try in %ds", model.__tablename__, row_id, failures, delay)
+        return False
+    _failed[model].pop(row_id, None)
+    return True
+
+def run(db: Session) -> int:
+    # Purges what was deleted, oldest first, until nothing is left but purges
+    # waiting to be retried; returns how many recs and accounts went
+    purged = 0
+    while True:
+        user_ids, rec_ids = _queue(db, User), _queue(db, Rec)
+        db.rollback()
+        if not user_ids and not rec_ids:
+            return purged
+        purged += sum(_attempt(db, User, purge_user, user_id) for user_id in user_ids)
+        purged += sum(_attempt(db, Rec, purge_rec, rec_id) for rec_id in rec_ids)
+
+def prune_notifications(db: Session) -> int:
+    if NOTIFICATION_RETENTION_DAYS <= 0:
+        return 0
+    # Naive UTC, like notifications.created_at
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    return _batches(db, Notification, Notification.created_at < cutoff)
+
+def start_worker(session_factory):
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            db = session_factory()
+            try:
+                started = time.perf_counter()
+                count, pruned = run(db), prune_notifications(db)
+                if count or pruned:
+                    logger.info("Purged %d deleted recs and accounts and %d expired notifications in %.1fs", count, pruned, time.perf_counter() - started)
+            except Exception:
+                db.rollback()
+                logger.exception("Purge failed")
+            finally:
+                db.close()
+            stop.wait(PURGE_POLL_SECONDS)
+
+    thread = threading.Thread(target=work, name="purge", daemon=True)
+    thread.stop = stop.set
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = run(db)
+        print(f"{count} recs and accounts purged, {prune_notifications(db)} expired notifications pruned in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
@@ -0,0 +1,55 @@
+import inspect
+from fastapi import APIRouter, Depends
+from fastapi.params import Depends as DependsParam
+from fastapi.routing import APIRoute
+from ..database import get_db, get_read_db, get_async_db, get_async_read_db
+
+ASYNC_DEPENDENCIES = {get_db: get_async_db, get_read_db: get_async_read_db}
+
+# Builds the async version of a router. Every endpoint that depends on get_db or
+# get_read_db is wrapped in an `async def` that takes the matching AsyncSession
+# instead and runs the original handler through AsyncSession.run_sync: the handler
+# code is unchanged, but its queries go through the async driver on the event loop
+# instead of holding a threadpool worker for the whole request.
+
+def _db_param(endpoint) -> str | None:
+    for name, param in inspect.signature(endpoint).parameters.items():
+        if isinstance(param.default, DependsParam) and param.default.dependency in ASYNC_DEPENDENCIES:
+            return name
+    return None
+
+def _async_endpoint(endpoint, db_param: str):
+    async def endpoint_async(**kwargs):
+        session = kwargs.pop(db_param)
+        return await session.run_sync(lambda sync_session: endpoint(**kwargs, **{db_param: sync_session}))
+
+    signature = inspect.signature(endpoint)
+    endpoint_async.__signature__ = signature.replace(parameters=[
+        param.replace(default=Depends(ASYNC_DEPENDENCIES[param.default.dependency])) if name == db_param else param
+        for name, param in signature.parameters.items()
+    ])
+    endpoint_async.__name__ = endpoint.__name__
+    endpoint_async.__doc__ = endpoint.__doc__
+    return endpoint_async
+
+def asyncify(router: APIRouter) -> APIRouter:
+    async_router = APIRouter()
+    for route in router.routes:
+        if not isinstance(route, APIRoute):
+            async_router.routes.append(route)
+            continue
+        endpoint = route.endpoint
+        db_param = _db_param(endpoint)
+        if db_param:
+            endpoint = _async_endpoint(endpoint, db_param)
+        async_router.add_api_route(
+            route.path,
+            endpoint,
+            methods=list(route.methods),
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            name=route.name,
+            dependencies=route.dependencies,
+        )
+    return async_router
@@ -1,35 +1,53 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import User
 from ..schemas import UserCreate, Token, UserOut
-from ..auth import hash_password, verify_password, create_access_token
+from ..auth import hash_password_async, verify_password_async, needs_rehash, create_access_token
+from .. import search
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-@router.post("/signup", response_model=UserOut)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
+# These handlers are async: bcrypt runs on auth.password_executor and the few
+# queries go to the threadpool, so a login surge queues on the hashing limit
+# instead of holding request workers while they hash.
+
+def _check_available(db: Session, user: UserCreate):
     if db.query(User).filter(User.email == user.email).first():
         raise HTTPException(status_code=400, detail="Email already registered")
     if db.query(User).filter(User.username == user.username).first():
         raise HTTPException(status_code=400, detail="Username already taken")
+
+def _create_user(db: Session, new_user: User) -> User:
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    search.index_user(db, new_user)
+    return new_user
+
+@router.post("/signup", response_model=UserOut)
+async def signup(user: UserCreate, db: Session = Depends(get_db)):
+    await run_in_threadpool(_check_available, db, user)
     
     new_user = User(
         username=user.username,
         email=user.email,
-        password=hash_password(user.password)
+        password=await hash_password_async(user.password)
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    return await run_in_threadpool(_create_user, db, new_user)
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == form_data.username).first()
-    if not db_user or not verify_password(form_data.password, db_user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(lambda: db.query(User).filter(User.email == form_data.username).first())
+    if not db_user or db_user.deleted_at is not None or not await verify_password_async(form_data.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    token = create_access_token({"user_id": db_user.id})
+    # Hashes made with an older BCRYPT_ROUNDS are upgraded while the plain password is at hand
+    if needs_rehash(db_user.password):
+        db_user.password = await hash_password_async(form_data.password)
+        await run_in_threadpool(db.commit)
+    
+    token = create_access_token({"user_id": db_user.id, "username": db_user.username})
     return {"access_token": token, "token_type": "bearer"}
\ No newline at end of file
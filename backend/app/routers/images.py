@@ -0,0 +1,24 @@
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..schemas import ImageOut
+from ..auth import get_current_user_id
+from .. import images
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+# Async like unfurl: the handler mostly waits on the upload and on the resize pool.
+# The returned id goes into RecCreate.image_id or UserUpdate.avatar_id.
+
+@router.post("", response_model=ImageOut)
+async def upload_image(request: Request, file: UploadFile = File(...), kind: Literal["rec", "avatar"] = "rec", db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    base_url = images.MEDIA_BASE_URL or str(request.url_for("media", path="")).rstrip("/")
+    try:
+        image = await images.ingest(db, file, kind, user_id, base_url)
+    except images.ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except images.ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return ImageOut(id=image.id, kind=image.kind, width=image.width, height=image.height, url=images.default_url(image), variants=image.variants)
@@ -1,32 +1,111 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import Notification, User
-from ..schemas import NotificationOut
-from ..auth import get_current_user_id
+from ..database import get_db, get_read_db, insert_for, SessionLocal
+from ..models import Notification, NotificationWatermark
+from ..schemas import NotificationPage
+from ..auth import get_current_user_id, get_stream_user_id
+from ..pagination import paginate_desc, encode_cursor, decode_cursor
+from ..notify import broker, joined_query, read_watermark, to_out
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
-@router.get("/", response_model=list[NotificationOut])
-def get_notifications(db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    notifications = db.query(Notification).filter(Notification.user_id == user_id).order_by(Notification.created_at.desc()).limit(50).all()
-    
-    results = []
-    for notif in notifications:
-        from_user = db.query(User).filter(User.id == notif.from_user_id).first()
-        results.append(NotificationOut(
-            id=notif.id,
-            type=notif.type,
-            rec_id=notif.rec_id,
-            is_read=notif.is_read,
-            created_at=notif.created_at,
-            from_username=from_user.username if from_user else "",
-            from_user_avatar=from_user.avatar or "" if from_user else ""
-        ))
-    return results
+STREAM_HEARTBEAT_SECONDS = 15
+
+@router.get("/", response_model=NotificationPage)
+def get_notifications(db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(50, ge=1, le=100)):
+    read_at = read_watermark(db, user_id)
+    query = joined_query(db, user_id)
+    rows, next_cursor = paginate_desc(query, Notification.created_at, Notification.id, cursor, 0, limit, key=lambda row: row[0])
+    return NotificationPage(items=[to_out(*row, read_at) for row in rows], next_cursor=next_cursor)
+
+@router.get("/unread-count")
+def get_unread_count(db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id)):
+    # Counted inside ix_notifications_user_unread, from the read watermark on
+    query = db.query(func.count()).select_from(Notification).filter(Notification.user_id == user_id, Notification.is_read == False)
+    read_at = read_watermark(db, user_id)
+    if read_at is not None:
+        query = query.filter(Notification.created_at > read_at)
+    return {"count": query.scalar()}
+
+# Stream positions are (created_at, id) keyset cursors rather than bare ids: merging
+# into a coalesced notification keeps its id but moves created_at to the merge, so
+# "X and 3 others" comes after everything the client has seen and is sent again.
+
+def _position(user_id: int, last_event_id: str | None) -> tuple[datetime, int]:
+    db = SessionLocal()
+    try:
+        if last_event_id and not last_event_id.isdigit():
+            return decode_cursor(last_event_id)
+        query = db.query(Notification.created_at, Notification.id).filter(Notification.user_id == user_id)
+        # A bare id is from before positions were cursors; with none, the stream starts
+        # after the latest notification
+        row = last_event_id and query.filter(Notification.id == int(last_event_id)).first()
+        row = row or query.order_by(Notification.created_at.desc(), Notification.id.desc()).first()
+        return tuple(row) if row else (datetime.min, 0)
+    finally:
+        db.close()
+
+def _since(user_id: int, position: tuple[datetime, int]) -> list[dict]:
+    db = SessionLocal()
+    try:
+        read_at = read_watermark(db, user_id)
+        rows = joined_query(db, user_id).filter(
+            tuple_(Notification.created_at, Notification.id) > tuple_(*position)
+        ).order_by(Notification.created_at, Notification.id).limit(100).all()
+        return [to_out(*row, read_at).model_dump(mode="json") for row in rows]
+    finally:
+        db.close()
+
+def _key(payload: dict) -> tuple[datetime, int]:
+    return datetime.fromisoformat(payload["created_at"]), payload["id"]
+
+def _event(payload: dict) -> str:
+    return f"id: {encode_cursor(*_key(payload))}\nevent: notification\ndata: {json.dumps(payload)}\n\n"
+
+@router.get("/stream")
+async def stream_notifications(request: Request, user_id: int = Depends(get_stream_user_id), last_event_id: str | None = Header(None)):
+    # Server-sent events: one `notification` event per new or merged notification.
+    # Reconnecting clients send Last-Event-ID and get whatever they missed replayed first.
+    queue = broker.subscribe(user_id)
+    try:
+        position = await run_in_threadpool(_position, user_id, last_event_id)
+    except Exception:
+        broker.unsubscribe(user_id, queue)
+        raise
+
+    async def events():
+        nonlocal position
+        try:
+            missed = await run_in_threadpool(_since, user_id, position) if last_event_id is not None else []
+            while True:
+                for payload in missed:
+                    if _key(payload) > position:
+                        position = _key(payload)
+                        yield _event(payload)
+                if await request.is_disconnected():
+                    break
+                try:
+                    missed = [await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)]
+                except asyncio.TimeoutError:
+                    # Picks up notifications published by other worker processes
+                    missed = await run_in_threadpool(_since, user_id, position)
+                    yield ": heartbeat\n\n"
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.post("/read")
 def mark_all_read(db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    db.query(Notification).filter(Notification.user_id == user_id, Notification.is_read == False).update({"is_read": True})
+    # One upsert of the user's watermark, however many notifications are unread
+    now = datetime.utcnow()
+    stmt = insert_for(db, NotificationWatermark).values(user_id=user_id, read_at=now)
+    db.execute(stmt.on_conflict_do_update(index_elements=["user_id"], set_={"read_at": now}))
     db.commit()
-    return {"message": "All notifications marked as read"}
\ No newline at end of file
+    return {"message": "All notifications marked as read"}
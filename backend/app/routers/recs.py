@@ -1,155 +1,224 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from typing import List
-from ..database import get_db
-from ..models import Rec, User, Follow, Like, Comment, Notification
-from ..schemas import RecCreate, RecOut, CommentCreate, CommentOut
-from ..auth import get_current_user_id
+from ..database import get_db, get_read_db
+from ..models import Rec, User, Comment
+from ..schemas import RecCreate, RecOut, RecPage, CommentCreate, CommentOut, CommentPage, BulkRecIds, BulkLikeOut, BulkRecImport, BulkImportOut
+from ..auth import get_current_user_id, get_token_user, TokenUser
+from ..hydration import hydrate_recs, cached_rec, rec_card, comment_out, comments_query, latest_comments, user_card
+from ..cache import cache, rec_key, user_key
+from ..pagination import paginate_desc, paginate_asc, encode_offset, decode_offset
+from .. import timeline, counters, search, outbox, bulk, unfurl, images, http_cache, trending, similar
 
 router = APIRouter(prefix="/recs", tags=["recs"])
 
-def get_rec_with_details(rec, username, db, user_id):
-    likes_count = db.query(func.count(Like.id)).filter(Like.rec_id == rec.id).scalar()
-    is_liked = db.query(Like).filter(Like.user_id == user_id, Like.rec_id == rec.id).first() is not None
-    user = db.query(User).filter(User.username == username).first()
-    user_avatar = user.avatar if user else ""
-    return RecOut(**rec.__dict__, username=username, likes_count=likes_count, is_liked=is_liked, user_avatar=user_avatar)
-
 @router.post("/", response_model=RecOut)
 def create_rec(rec: RecCreate, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    new_rec = Rec(**rec.dict(), user_id=user_id)
+    try:
+        new_rec = Rec(**images.rec_fields(db, [rec])[0], user_id=user_id)
+    except images.ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if new_rec.link and not new_rec.image:
+        # Fill in the image from a preview already fetched through /unfurl; never fetches here
+        try:
+            preview = unfurl.cached(db, unfurl.normalize_url(new_rec.link))
+        except unfurl.UnfurlError:
+            preview = None
+        if preview and not preview.error:
+            new_rec.image = preview.image
     db.add(new_rec)
+    db.flush()
+    counters.rec_created(db, user_id)
+    timeline.fan_out(db, new_rec.id, user_id)
+    trending.rec_created(db, new_rec.id)
     db.commit()
     db.refresh(new_rec)
+    cache.invalidate(user_key(user_id))
+    search.index_rec(db, new_rec)
     
-    user = db.query(User).filter(User.id == user_id).first()
-    return get_rec_with_details(new_rec, user.username, db, user_id)
-
-@router.get("/feed", response_model=List[RecOut])
-def get_feed(db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 50):
-    following_ids = db.query(Follow.following_id).filter(Follow.follower_id == user_id).subquery()
-    recs = db.query(Rec, User.username).join(User).filter(
-        (Rec.user_id.in_(following_ids)) | (Rec.user_id == user_id)
-    ).order_by(desc(Rec.created_at)).offset(skip).limit(limit).all()
+    card = cache.get_or_load(user_key(user_id), lambda: user_card(db, user_id))
+    return hydrate_recs(db, [(new_rec, card["username"], card["avatar"])], user_id)[0]
+
+@router.get("/feed", response_model=RecPage)
+def get_feed(db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), cursor: str | None = None, skip: int = 0, limit: int = Query(50, ge=1, le=100), comments: int = Query(0, ge=0, le=10)):
+    recs, next_cursor = timeline.read_timeline(db, user_id, cursor, skip, limit)
     
-    return [get_rec_with_details(rec, username, db, user_id) for rec, username in recs]
-@router.get("/user/{username}", response_model=List[RecOut])
-def get_user_recs(username: str, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 20):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    return RecPage(items=hydrate_recs(db, recs, user_id, comments), next_cursor=next_cursor)
+
+@router.get("/search", response_model=RecPage)
+def search_recs(q: str, db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(20, ge=1, le=50)):
+    offset = decode_offset(cursor)
+    rows = search.search_recs(db, q, offset, limit + 1)
+    next_cursor = encode_offset(offset + limit) if len(rows) > limit else None
+    return RecPage(items=hydrate_recs(db, rows[:limit], user_id), next_cursor=next_cursor)
+
+@router.get("/trending", response_model=RecPage)
+def get_trending(db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(20, ge=1, le=50), comments: int = Query(0, ge=0, le=10)):
+    return _ranked_page(db, None, user_id, cursor, limit, comments)
+
+@router.get("/category/{category}", response_model=RecPage)
+def get_category(category: str, db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(20, ge=1, le=50), comments: int = Query(0, ge=0, le=10)):
+    return _ranked_page(db, category, user_id, cursor, limit, comments)
+
+def _ranked_page(db: Session, category: str | None, user_id: int, cursor: str | None, limit: int, comments: int) -> RecPage:
+    # Scores move between requests, so pages are offsets into the current ranking
+    offset = decode_offset(cursor)
+    rows = trending.ranked(db, category, offset, limit + 1)
+    next_cursor = encode_offset(offset + limit) if len(rows) > limit else None
+    return RecPage(items=hydrate_recs(db, rows[:limit], user_id, comments), next_cursor=next_cursor)
+
+@router.get("/user/{username}", response_model=RecPage)
+def get_user_recs(username: str, request: Request, response: Response, db: Session = Depends(get_read_db), current_user: TokenUser = Depends(get_token_user), cursor: str | None = None, skip: int = 0, limit: int = Query(20, ge=1, le=100), comments: int = Query(0, ge=0, le=10)):
+    user_id = current_user.id
+    if username == current_user.username:
+        card = cache.get_or_load(user_key(user_id), lambda: user_card(db, user_id))
+        author_id, avatar, author_version = user_id, card["avatar"], card["version"]
+    else:
+        user = db.query(User.id, User.avatar, User.version).filter(User.username == username, User.deleted_at.is_(None)).first()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        author_id, avatar, author_version = user
     
-    recs = db.query(Rec).filter(Rec.user_id == user.id).order_by(desc(Rec.created_at)).offset(skip).limit(limit).all()
-    return [get_rec_with_details(rec, username, db, user_id) for rec in recs]
+    query = db.query(Rec).filter(Rec.user_id == author_id, Rec.deleted_at.is_(None))
+    recs, next_cursor = paginate_desc(query, Rec.created_at, Rec.id, cursor, skip, limit)
+    # Likes (the viewer's included) and comments bump the rec's version, so the page
+    # itself is the validator; a match skips the is_liked and comment lookups
+    tag = http_cache.etag("user-recs", author_id, author_version, user_id, comments, next_cursor, [(rec.id, rec.version) for rec in recs])
+    modified = max((rec.updated_at or rec.created_at for rec in recs), default=None)
+    if cached := http_cache.not_modified(request, response, tag, modified):
+        return cached
+    return RecPage(items=hydrate_recs(db, [(rec, username, avatar) for rec in recs], user_id, comments), next_cursor=next_cursor)
+
+@router.get("/comments", response_model=dict[int, list[CommentOut]])
+def get_comments_bulk(rec_ids: list[int] = Query(..., max_length=100), db: Session = Depends(get_read_db), limit: int = Query(3, ge=1, le=10)):
+    # Latest comments for many recs in one round trip, for clients that load previews lazily
+    previews = latest_comments(db, list(set(rec_ids)), limit)
+    return {rec_id: previews.get(rec_id, []) for rec_id in rec_ids}
+
+@router.post("/likes", response_model=BulkLikeOut)
+def like_recs(body: BulkRecIds, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    results = bulk.like(db, user_id, body.rec_ids)
+    trending.recs_liked(db, [result["rec_id"] for result in results if result["status"] == "liked"])
+    db.commit()
+    cache.invalidate(*[rec_key(result["rec_id"]) for result in results if result["status"] == "liked"])
+    return BulkLikeOut(results=results)
+
+@router.delete("/likes", response_model=BulkLikeOut)
+def unlike_recs(body: BulkRecIds, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    results = bulk.unlike(db, user_id, body.rec_ids)
+    trending.likes_removed(db, [(result["rec_id"], result["liked_at"]) for result in results if result["status"] == "unliked"])
+    db.commit()
+    cache.invalidate(*[rec_key(result["rec_id"]) for result in results if result["status"] == "unliked"])
+    return BulkLikeOut(results=results)
+
+@router.post("/import", response_model=BulkImportOut)
+def import_recs(body: BulkRecImport, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    try:
+        rec_ids = bulk.import_recs(db, user_id, body.recs)
+    except images.ImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    cache.invalidate(user_key(user_id))
+    for rec_id, rec in zip(rec_ids, body.recs):
+        search.index_rec(db, Rec(id=rec_id, **rec.model_dump(exclude={"created_at", "image_id"})))
+    return BulkImportOut(results=[{"index": index, "id": rec_id} for index, rec_id in enumerate(rec_ids)])
 
 @router.post("/{rec_id}/like")
 def like_rec(rec_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    rec = db.query(Rec).filter(Rec.id == rec_id).first()
-    if not rec:
+    status = bulk.like(db, user_id, [rec_id])[0]["status"]
+    if status == "not_found":
         raise HTTPException(status_code=404, detail="Rec not found")
-    
-    existing = db.query(Like).filter(Like.user_id == user_id, Like.rec_id == rec_id).first()
-    if existing:
+    if status == "already_liked":
         raise HTTPException(status_code=400, detail="Already liked")
     
-    like = Like(user_id=user_id, rec_id=rec_id)
-    db.add(like)
+    trending.recs_liked(db, [rec_id])
     db.commit()
-    
-    # Create notification (if not liking own rec)
-    if rec.user_id != user_id:
-        notification = Notification(
-            user_id=rec.user_id,
-            from_user_id=user_id,
-            type="like",
-            rec_id=rec_id
-        )
-        db.add(notification)
-        db.commit()
+    cache.invalidate(rec_key(rec_id))
     
     return {"message": "Liked"}
 
 @router.delete("/{rec_id}/like")
 def unlike_rec(rec_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    like = db.query(Like).filter(Like.user_id == user_id, Like.rec_id == rec_id).first()
-    if not like:
+    result = bulk.unlike(db, user_id, [rec_id])[0]
+    if result["status"] == "not_liked":
         raise HTTPException(status_code=400, detail="Not liked")
     
-    db.delete(like)
+    trending.likes_removed(db, [(rec_id, result["liked_at"])])
     db.commit()
+    cache.invalidate(rec_key(rec_id))
     return {"message": "Unliked"}
 
-@router.get("/{rec_id}/comments", response_model=list[CommentOut])
-def get_comments(rec_id: int, db: Session = Depends(get_db)):
-    comments = db.query(Comment).filter(Comment.rec_id == rec_id).order_by(Comment.created_at.asc()).all()
-    results = []
-    for comment in comments:
-        user = db.query(User).filter(User.id == comment.user_id).first()
-        results.append(CommentOut(
-            id=comment.id,
-            user_id=comment.user_id,
-            rec_id=comment.rec_id,
-            content=comment.content,
-            created_at=comment.created_at,
-            username=user.username,
-            user_avatar=user.avatar or ""
-        ))
-    return results
+@router.get("/{rec_id}/comments", response_model=CommentPage)
+def get_comments(rec_id: int, request: Request, response: Response, db: Session = Depends(get_read_db), cursor: str | None = None, limit: int = Query(50, ge=1, le=100)):
+    # A new comment bumps the rec's version, so one primary-key read validates the thread
+    rec = db.query(Rec.version, Rec.updated_at, Rec.created_at).filter(Rec.id == rec_id, Rec.deleted_at.is_(None)).first()
+    if not rec:
+        return CommentPage(items=[], next_cursor=None)
+    tag = http_cache.etag("comments", rec_id, rec.version, cursor, limit)
+    cache_control = f"public, max-age={http_cache.COMMENTS_MAX_AGE}"
+    if cached := http_cache.not_modified(request, response, tag, rec.updated_at or rec.created_at, cache_control):
+        return cached
+    
+    query = comments_query(db).filter(Comment.rec_id == rec_id)
+    rows, next_cursor = paginate_asc(query, Comment.created_at, Comment.id, cursor, limit, key=lambda row: row[0])
+    return CommentPage(items=[comment_out(*row) for row in rows], next_cursor=next_cursor)
+
+@router.get("/{rec_id}/similar", response_model=list[RecOut])
+def get_similar(rec_id: int, db: Session = Depends(get_read_db), user_id: int = Depends(get_current_user_id), limit: int = Query(10, ge=1, le=similar.SIMILAR_RECS)):
+    # Precomputed by app.similar; empty until the rec has likes and a run has seen them
+    return hydrate_recs(db, similar.similar_recs(db, rec_id, limit), user_id)
 
 @router.post("/{rec_id}/comments", response_model=CommentOut)
 def create_comment(rec_id: int, comment: CommentCreate, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    rec = db.query(Rec).filter(Rec.id == rec_id).first()
+    rec = db.query(Rec).filter(Rec.id == rec_id, Rec.deleted_at.is_(None)).first()
     if not rec:
         raise HTTPException(status_code=404, detail="Rec not found")
     
     new_comment = Comment(user_id=user_id, rec_id=rec_id, content=comment.content)
     db.add(new_comment)
+    counters.rec_commented(db, rec_id)
+    trending.rec_commented(db, rec_id)
+    # Notification (if not commenting on own rec) is written by the outbox worker
+    if rec.user_id != user_id:
+        outbox.enqueue(db, "notification", {"user_id": rec.user_id, "from_user_id": user_id, "type": "comment", "rec_id": rec_id})
     db.commit()
     db.refresh(new_comment)
+    cache.invalidate(rec_key(rec_id))
     
-    # Create notification (if not commenting on own rec)
-    if rec.user_id != user_id:
-        notification = Notification(
-            user_id=rec.user_id,
-            from_user_id=user_id,
-            type="comment",
-            rec_id=rec_id
-        )
-        db.add(notification)
-        db.commit()
-    
-    user = db.query(User).filter(User.id == user_id).first()
-    return CommentOut(
-        id=new_comment.id,
-        user_id=new_comment.user_id,
-        rec_id=new_comment.rec_id,
-        content=new_comment.content,
-        created_at=new_comment.created_at,
-        username=user.username,
-        user_avatar=user.avatar or ""
-    )
+    author = cache.get_or_load(user_key(user_id), lambda: user_card(db, user_id))
+    return comment_out(new_comment, author["username"], author["avatar"])
+
 @router.delete("/{rec_id}")
 def delete_rec(rec_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    rec = db.query(Rec).filter(Rec.id == rec_id).first()
+    rec = db.query(Rec).filter(Rec.id == rec_id, Rec.deleted_at.is_(None)).first()
     if not rec:
         raise HTTPException(status_code=404, detail="Rec not found")
     if rec.user_id != user_id:
         raise HTTPException(status_code=403, detail="Not your rec")
     
-    # Delete related likes, comments, notifications first
-    db.query(Like).filter(Like.rec_id == rec_id).delete()
-    db.query(Comment).filter(Comment.rec_id == rec_id).delete()
-    db.query(Notification).filter(Notification.rec_id == rec_id).delete()
-    
-    db.delete(rec)
+    # Hidden from every read at once; app.purge removes its likes, comments,
+    # notifications and timeline entries in batches, then the row itself
+    rec.deleted_at = datetime.now(timezone.utc)
+    trending.retract(db, rec_id)
+    counters.rec_created(db, user_id, -1)
     db.commit()
+    cache.invalidate(rec_key(rec_id), user_key(user_id))
+    search.unindex_rec(db, rec_id)
     return {"message": "Rec deleted"}
 
 @router.get("/{rec_id}", response_model=RecOut)
-def get_rec(rec_id: int, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    rec = db.query(Rec).filter(Rec.id == rec_id).first()
+def get_rec(rec_id: int, request: Request, response: Response, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    card = cache.get_or_load(rec_key(rec_id), lambda: rec_card(db, rec_id))
+    if card:
+        # The viewer liking or unliking bumps the version, so is_liked needs no lookup here
+        author = cache.get_or_load(user_key(card["user_id"]), lambda: user_card(db, card["user_id"]))
+        if not author:
+            raise HTTPException(status_code=404, detail="Rec not found")
+        tag = http_cache.etag("rec", rec_id, card["version"], author["version"], user_id)
+        if cached := http_cache.not_modified(request, response, tag, card["updated_at"]):
+            return cached
+    
+    rec = cached_rec(db, rec_id, user_id)
     if not rec:
         raise HTTPException(status_code=404, detail="Rec not found")
-    user = db.query(User).filter(User.id == rec.user_id).first()
-    return get_rec_with_details(rec, user.username, db, user_id)
\ No newline at end of file
+    return rec
\ No newline at end of file
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..schemas import LinkPreviewOut
+from ..auth import get_current_user_id
+from .. import unfurl as previews
+
+router = APIRouter(prefix="/unfurl", tags=["unfurl"])
+
+# Async like auth: the cost is waiting on remote sites, which happens on the event
+# loop under unfurl's concurrency limit; only the cache reads and writes use the
+# threadpool.
+
+@router.get("", response_model=LinkPreviewOut)
+async def unfurl(url: str = Query(..., max_length=2000), db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    try:
+        url = previews.normalize_url(url)
+    except previews.UnfurlError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    preview = await run_in_threadpool(previews.cached, db, url)
+    if preview is None:
+        try:
+            fields, error = await previews.fetcher().fetch(url), None
+        except previews.UnfurlError as e:
+            fields, error = None, str(e)
+        preview = await run_in_threadpool(previews.store, db, url, fields, error)
+    
+    if preview.error:
+        raise HTTPException(status_code=502, detail=preview.error)
+    return preview
@@ -1,31 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..database import get_db
-from ..models import User, Follow, Rec
-from ..schemas import UserProfile, UserUpdate
-from ..auth import get_current_user_id
+from ..database import get_db, get_read_db
+from ..models import User, Follow
+from ..schemas import UserProfile, UserProfilePage, UserSuggestion, UserUpdate, BulkUsernames, BulkFollowOut
+from ..hydration import to_profile, build_profiles, user_card
+from ..cache import cache, user_key, username_key
+from ..auth import get_current_user_id, get_token_user, TokenUser, oauth2_scheme, forget_token
+from ..pagination import paginate_desc, encode_offset, decode_offset
+from .. import timeline, counters, search, bulk, images, http_cache, suggestions
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/me", response_model=UserProfile)
 def get_current_user(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    user = db.query(User).filter(User.id == current_user_id).first()
-    
-    recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == user.id).scalar()
-    tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == user.id).scalar()
-    tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == user.id).scalar()
-    
-    return UserProfile(
-        id=user.id,
-        username=user.username,
-        bio=user.bio,
-        avatar=user.avatar,
-        recs_count=recs_count,
-        tuned_in=tuned_in,
-        tuned_to=tuned_to,
-        is_following=False
-    )
+    card = cache.get_or_load(user_key(current_user_id), lambda: user_card(db, current_user_id))
+    return UserProfile(**card, is_following=False)
 
 @router.patch("/me", response_model=UserProfile)
 def update_current_user(updates: UserUpdate, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
@@ -33,141 +23,126 @@ def update_current_user(updates: UserUpdate, db: Session = Depends(get_db), curr
     
     if updates.bio is not None:
         user.bio = updates.bio
-    if updates.avatar is not None:
-        user.avatar = updates.avatar
+    if updates.avatar_id is not None:
+        try:
+            image = images.get(db, updates.avatar_id, "avatar")
+        except images.ImageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        user.avatar, user.avatar_variants = images.default_url(image), image.variants
+    elif updates.avatar is not None:
+        user.avatar, user.avatar_variants = updates.avatar, []
     
     db.commit()
     db.refresh(user)
-    
-    recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == user.id).scalar()
-    tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == user.id).scalar()
-    tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == user.id).scalar()
-    
-    return UserProfile(
-        id=user.id,
-        username=user.username,
-        bio=user.bio,
-        avatar=user.avatar,
-        recs_count=recs_count,
-        tuned_in=tuned_in,
-        tuned_to=tuned_to,
-        is_following=False
-    )
+    cache.invalidate(user_key(user.id))
+    return to_profile(user, False)
 
-@router.get("/search", response_model=list[UserProfile])
-def search_users(q: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    users = db.query(User).filter(User.username.ilike(f"%{q}%")).limit(20).all()
-    
-    results = []
-    for user in users:
-        recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == user.id).scalar()
-        tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == user.id).scalar()
-        tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == user.id).scalar()
-        is_following = db.query(Follow).filter(Follow.follower_id == current_user_id, Follow.following_id == user.id).first() is not None
-        
-        results.append(UserProfile(
-            id=user.id,
-            username=user.username,
-            bio=user.bio,
-            avatar=user.avatar,
-            recs_count=recs_count,
-            tuned_in=tuned_in,
-            tuned_to=tuned_to,
-            is_following=is_following
-        ))
-    return results
-@router.get("/{username}/followers", response_model=list[UserProfile])
-def get_followers(username: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    user = db.query(User).filter(User.username == username).first()
+@router.delete("/me")
+def delete_current_user(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id), token: str = Depends(oauth2_scheme)):
+    user = db.query(User).filter(User.id == current_user_id, User.deleted_at.is_(None)).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    followers = db.query(User).join(Follow, Follow.follower_id == User.id).filter(Follow.following_id == user.id).all()
-    
-    results = []
-    for follower in followers:
-        recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == follower.id).scalar()
-        tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == follower.id).scalar()
-        tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == follower.id).scalar()
-        is_following = db.query(Follow).filter(Follow.follower_id == current_user_id, Follow.following_id == follower.id).first() is not None
-        
-        results.append(UserProfile(
-            id=follower.id,
-            username=follower.username,
-            bio=follower.bio,
-            avatar=follower.avatar,
-            recs_count=recs_count,
-            tuned_in=tuned_in,
-            tuned_to=tuned_to,
-            is_following=is_following
-        ))
-    return results
+    # Hidden from every read at once; app.purge removes their recs, likes, comments,
+    # follows and notifications in batches, fixing the counters they touched, then
+    # the account itself
+    user.deleted_at = datetime.now(timezone.utc)
+    db.commit()
+    cache.invalidate(user_key(user.id), username_key(user.username))
+    search.unindex_user(db, user.id)
+    forget_token(token)
+    return {"message": "Account deleted"}
 
-@router.get("/{username}/following", response_model=list[UserProfile])
-def get_following(username: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    user = db.query(User).filter(User.username == username).first()
+@router.post("/me/following", response_model=BulkFollowOut)
+def follow_users(body: BulkUsernames, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
+    results = bulk.follow(db, current_user_id, body.usernames)
+    db.commit()
+    followed = [result["user_id"] for result in results if result["status"] == "followed"]
+    if followed:
+        cache.invalidate(user_key(current_user_id), *[user_key(user_id) for user_id in followed])
+        suggestions.followed(current_user_id, followed)
+    return BulkFollowOut(results=results)
+
+@router.get("/search", response_model=UserProfilePage)
+def search_users(q: str, db: Session = Depends(get_read_db), current_user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(20, ge=1, le=50)):
+    offset = decode_offset(cursor)
+    users = search.search_users(db, q, offset, limit + 1)
+    next_cursor = encode_offset(offset + limit) if len(users) > limit else None
+    return UserProfilePage(items=build_profiles(db, users[:limit], current_user_id), next_cursor=next_cursor)
+
+@router.get("/suggestions", response_model=list[UserSuggestion])
+def get_suggestions(db: Session = Depends(get_read_db), current_user_id: int = Depends(get_current_user_id), limit: int = Query(20, ge=1, le=50)):
+    # Ranked from the in-memory follow graph (app.suggestions); the database is only
+    # asked for the profiles and the names in "followed by"
+    ranked = suggestions.suggestion_index.suggest(db, current_user_id, limit)
+    named = {user_id for _, mutuals, _ in ranked for user_id in mutuals[:suggestions.FOLLOWED_BY_NAMES]}
+    users = {user.id: user for user in db.query(User).filter(User.id.in_([candidate for candidate, _, _ in ranked]), User.deleted_at.is_(None))} if ranked else {}
+    names = dict(db.query(User.id, User.username).filter(User.id.in_(named), User.deleted_at.is_(None))) if named else {}
+    return [
+        UserSuggestion(
+            **to_profile(users[candidate], False).model_dump(),
+            mutuals_count=len(mutuals),
+            followed_by=[names[user_id] for user_id in mutuals[:suggestions.FOLLOWED_BY_NAMES] if user_id in names],
+            follows_you=follows_you,
+        )
+        for candidate, mutuals, follows_you in ranked if candidate in users
+    ]
+
+@router.get("/{username}/followers", response_model=UserProfilePage)
+def get_followers(username: str, db: Session = Depends(get_read_db), current_user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(50, ge=1, le=100)):
+    user = db.query(User).filter(User.username == username, User.deleted_at.is_(None)).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    following = db.query(User).join(Follow, Follow.following_id == User.id).filter(Follow.follower_id == user.id).all()
+    query = db.query(User, Follow).join(Follow, Follow.follower_id == User.id).filter(Follow.following_id == user.id, User.deleted_at.is_(None))
+    rows, next_cursor = paginate_desc(query, Follow.created_at, Follow.id, cursor, 0, limit, key=lambda row: row[1])
+    return UserProfilePage(items=build_profiles(db, [follower for follower, _ in rows], current_user_id), next_cursor=next_cursor)
+
+@router.get("/{username}/following", response_model=UserProfilePage)
+def get_following(username: str, db: Session = Depends(get_read_db), current_user_id: int = Depends(get_current_user_id), cursor: str | None = None, limit: int = Query(50, ge=1, le=100)):
+    user = db.query(User).filter(User.username == username, User.deleted_at.is_(None)).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    results = []
-    for followed in following:
-        recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == followed.id).scalar()
-        tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == followed.id).scalar()
-        tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == followed.id).scalar()
-        is_following = db.query(Follow).filter(Follow.follower_id == current_user_id, Follow.following_id == followed.id).first() is not None
-        
-        results.append(UserProfile(
-            id=followed.id,
-            username=followed.username,
-            bio=followed.bio,
-            avatar=followed.avatar,
-            recs_count=recs_count,
-            tuned_in=tuned_in,
-            tuned_to=tuned_to,
-            is_following=is_following
-        ))
-    return results
+    query = db.query(User, Follow).join(Follow, Follow.following_id == User.id).filter(Follow.follower_id == user.id, User.deleted_at.is_(None))
+    rows, next_cursor = paginate_desc(query, Follow.created_at, Follow.id, cursor, 0, limit, key=lambda row: row[1])
+    return UserProfilePage(items=build_profiles(db, [followed for followed, _ in rows], current_user_id), next_cursor=next_cursor)
 
 @router.get("/{username}", response_model=UserProfile)
-def get_user_profile(username: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+def get_user_profile(username: str, request: Request, response: Response, db: Session = Depends(get_db), current_user: TokenUser = Depends(get_token_user)):
+    own = username == current_user.username
+    if own:
+        user_id = current_user.id
+    else:
+        user_id = cache.get_or_load(username_key(username), lambda: db.query(User.id).filter(User.username == username).scalar())
+    card = cache.get_or_load(user_key(user_id), lambda: user_card(db, user_id)) if user_id else None
+    if not card:
         raise HTTPException(status_code=404, detail="User not found")
     
-    recs_count = db.query(func.count(Rec.id)).filter(Rec.user_id == user.id).scalar()
-    tuned_in = db.query(func.count(Follow.id)).filter(Follow.following_id == user.id).scalar()
-    tuned_to = db.query(func.count(Follow.id)).filter(Follow.follower_id == user.id).scalar()
-    is_following = db.query(Follow).filter(Follow.follower_id == current_user_id, Follow.following_id == user.id).first() is not None
+    # Following or unfollowing bumps the profile's version, so is_following needs no lookup here
+    tag = http_cache.etag("user", user_id, card["version"], current_user.id)
+    if cached := http_cache.not_modified(request, response, tag, card["updated_at"]):
+        return cached
+    
+    is_following = not own and db.query(Follow).filter(Follow.follower_id == current_user.id, Follow.following_id == user_id).first() is not None
     
-    return UserProfile(
-        id=user.id,
-        username=user.username,
-        bio=user.bio,
-        avatar=user.avatar,
-        recs_count=recs_count,
-        tuned_in=tuned_in,
-        tuned_to=tuned_to,
-        is_following=is_following
-    )
+    return UserProfile(**card, is_following=is_following)
 
 @router.post("/{username}/follow")
 def follow_user(username: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
-    user_to_follow = db.query(User).filter(User.username == username).first()
-    if not user_to_follow:
+    result = bulk.follow(db, current_user_id, [username])[0]
+    if result["status"] == "not_found":
         raise HTTPException(status_code=404, detail="User not found")
     
-    if user_to_follow.id == current_user_id:
+    if result["status"] == "self":
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    existing = db.query(Follow).filter(Follow.follower_id == current_user_id, Follow.following_id == user_to_follow.id).first()
-    if existing:
+    if result["status"] == "already_following":
         raise HTTPException(status_code=400, detail="Already following")
     
-    follow = Follow(follower_id=current_user_id, following_id=user_to_follow.id)
-    db.add(follow)
     db.commit()
+    cache.invalidate(user_key(current_user_id), user_key(result["user_id"]))
+    suggestions.followed(current_user_id, [result["user_id"]])
     return {"message": f"Now following {username}"}
 
 @router.delete("/{username}/follow")
@@ -181,6 +156,10 @@ def unfollow_user(username: str, db: Session = Depends(get_db), current_user_id:
         raise HTTPException(status_code=400, detail="Not following")
     
     db.delete(follow)
+    counters.user_followed(db, current_user_id, user_to_unfollow.id, -1)
+    timeline.prune(db, current_user_id, user_to_unfollow.id)
     db.commit()
+    cache.invalidate(user_key(current_user_id), user_key(user_to_unfollow.id))
+    suggestions.unfollowed(current_user_id, user_to_unfollow.id)
     return {"message": f"Unfollowed {username}"}
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 from typing import Optional
 
@@ -28,6 +28,22 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
+# Images
+class ImageVariant(BaseModel):
+    width: int
+    height: int
+    webp: str
+    jpeg: str
+
+class ImageOut(BaseModel):
+    id: str
+    kind: str
+    width: int
+    height: int
+    # Default variant, for clients that only read Rec.image / User.avatar
+    url: str
+    variants: list[ImageVariant]
+
 # Rec
 class RecCreate(BaseModel):
     category: str
@@ -35,6 +51,8 @@ class RecCreate(BaseModel):
     description: str = ""
     link: str = ""
     image: str = ""
+    # From POST /images?kind=rec; takes precedence over image
+    image_id: str | None = None
 
 class RecOut(BaseModel):
     id: int
@@ -62,6 +80,7 @@ class UserProfile(BaseModel):
     username: str
     bio: str
     avatar: str
+    avatar_variants: list[ImageVariant] = []
     recs_count: int
     tuned_in: int
     tuned_to: int
@@ -70,10 +89,41 @@ class UserProfile(BaseModel):
     class Config:
         from_attributes = True
 
+class UserProfilePage(BaseModel):
+    items: list[UserProfile]
+    next_cursor: str | None = None
+
+class UserSuggestion(UserProfile):
+    # Accounts the viewer follows that follow this one: the total and the first few names
+    mutuals_count: int = 0
+    followed_by: list[str] = []
+    follows_you: bool = False
+
 class UserUpdate(BaseModel):
     bio: str | None = None
     avatar: str | None = None
+    # From POST /images?kind=avatar; takes precedence over avatar
+    avatar_id: str | None = None
     
+class CommentCreate(BaseModel):
+    content: str
+
+class CommentOut(BaseModel):
+    id: int
+    user_id: int
+    rec_id: int
+    content: str
+    created_at: datetime
+    username: str
+    user_avatar: str = ""
+
+    class Config:
+        from_attributes = True
+
+class CommentPage(BaseModel):
+    items: list[CommentOut]
+    next_cursor: str | None = None
+
 class RecOut(BaseModel):
     id: int
     user_id: int
@@ -82,29 +132,57 @@ class RecOut(BaseModel):
     description: str
     link: str
     image: str
+    image_variants: list[ImageVariant] = []
     created_at: datetime
     username: str | None = None
     likes_count: int = 0
     is_liked: bool = False
     user_avatar: str = ""
+    comments_count: int = 0
+    # The latest few comments in thread order; only filled when the endpoint is asked for a preview
+    latest_comments: list[CommentOut] = []
 
     class Config:
         from_attributes = True
 
-class CommentCreate(BaseModel):
-    content: str
+class RecPage(BaseModel):
+    items: list[RecOut]
+    next_cursor: str | None = None
 
-class CommentOut(BaseModel):
-    id: int
-    user_id: int
+# Bulk writes: at most 500 items per call, one result per item in request order
+class BulkRecIds(BaseModel):
+    rec_ids: list[int] = Field(min_length=1, max_length=500)
+
+class BulkLikeResult(BaseModel):
     rec_id: int
-    content: str
-    created_at: datetime
+    status: str  # liked, unliked, already_liked, not_liked, not_found
+
+class BulkLikeOut(BaseModel):
+    results: list[BulkLikeResult]
+
+class BulkUsernames(BaseModel):
+    usernames: list[str] = Field(min_length=1, max_length=500)
+
+class BulkFollowResult(BaseModel):
     username: str
-    user_avatar: str = ""
+    status: str  # followed, already_following, not_found, self
 
-    class Config:
-        from_attributes = True
+class BulkFollowOut(BaseModel):
+    results: list[BulkFollowResult]
+
+class RecImport(RecCreate):
+    # Keeps the original date when migrating from another platform
+    created_at: datetime | None = None
+
+class BulkRecImport(BaseModel):
+    recs: list[RecImport] = Field(min_length=1, max_length=500)
+
+class BulkImportResult(BaseModel):
+    index: int
+    id: int
+
+class BulkImportOut(BaseModel):
+    results: list[BulkImportResult]
 
 class NotificationOut(BaseModel):
     id: int
@@ -114,6 +192,22 @@ class NotificationOut(BaseModel):
     created_at: datetime
     from_username: str
     from_user_avatar: str = ""
+    others_count: int = 0
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class NotificationPage(BaseModel):
+    items: list[NotificationOut]
+    next_cursor: str | None = None
+
+# Link previews
+class LinkPreviewOut(BaseModel):
+    url: str
+    title: str
+    description: str
+    image: str
+    site_name: str
+
+    class Config:
+        from_attributes = True
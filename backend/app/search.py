@@ -0,0 +1,168 @@
+import re
+import threading
+from collections import defaultdict
+from sqlalchemy import func, literal_column, or_
+from sqlalchemy.orm import Session
+from .models import User, Rec, REC_SEARCH_VECTOR
+from .hydration import visible
+
+# User search uses pg_trgm (ix_users_username_trgm) and rec search uses the tsvector
+# index (ix_recs_search) on Postgres. Other databases, i.e. SQLite in offline tests,
+# get an equivalent in-process index built on first use and kept current by the
+# index_* hooks called from the write paths.
+
+USERNAME_SIMILARITY = 0.3
+
+def is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def tokens(text: str) -> list[str]:
+    return re.findall(r"\w+", (text or "").lower())
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {(text or '').lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class MemoryIndex:
+    def __init__(self, analyze):
+        self.analyze = analyze
+        self.postings = defaultdict(set)
+        self.terms = {}
+
+    def add(self, doc_id: int, text: str):
+        self.remove(doc_id)
+        terms = self.analyze(text)
+        self.terms[doc_id] = terms
+        for term in set(terms):
+            self.postings[term].add(doc_id)
+
+    def remove(self, doc_id: int):
+        for term in set(self.terms.pop(doc_id, ())):
+            self.postings[term].discard(doc_id)
+
+    def candidates(self, terms) -> set[int]:
+        found = set()
+        for term in terms:
+            found |= self.postings.get(term, set())
+        return found
+
+class MemorySearch:
+    # Written from request threads and the outbox and purge workers while other
+    # requests query it, so every read and write of the index holds the lock.
+    # Updates before the first load are dropped; the load reads them from the table.
+    def __init__(self):
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.usernames = {}
+        self.users = MemoryIndex(lambda text: sorted(trigrams(text)))
+        self.recs = MemoryIndex(tokens)
+
+    def load(self, db: Session):
+        with self.lock:
+            if self.loaded:
+                return
+            for user_id, username in db.query(User.id, User.username).filter(User.deleted_at.is_(None)):
+                self._add_user(user_id, username)
+            for rec_id, title, description, category in db.query(Rec.id, Rec.title, Rec.description, Rec.category).filter(Rec.deleted_at.is_(None)):
+                self._add_rec(rec_id, title, description, category)
+            self.loaded = True
+
+    def _add_user(self, user_id: int, username: str):
+        self.usernames[user_id] = username.lower()
+        self.users.add(user_id, username)
+
+    def _add_rec(self, rec_id: int, title: str, description: str, category: str):
+        self.recs.add(rec_id, f"{title} {description or ''} {category}")
+
+    def add_user(self, user_id: int, username: str):
+        with self.lock:
+            if self.loaded:
+                self._add_user(user_id, username)
+
+    def remove_user(self, user_id: int):
+        with self.lock:
+            self.usernames.pop(user_id, None)
+            self.users.remove(user_id)
+
+    def add_rec(self, rec_id: int, title: str, description: str, category: str):
+        with self.lock:
+            if self.loaded:
+                self._add_rec(rec_id, title, description, category)
+
+    def remove_rec(self, rec_id: int):
+        with self.lock:
+            self.recs.remove(rec_id)
+
+    def search_users(self, q: str) -> list[int]:
+        query = trigrams(q)
+        with self.lock:
+            substring = {user_id for user_id, name in self.usernames.items() if q.lower() in name}
+            scored = []
+            for user_id in self.users.candidates(query) | substring:
+                name = set(self.users.terms[user_id])
+                similarity = len(query & name) / len(query | name)
+                if q.lower() in self.usernames[user_id] or similarity >= USERNAME_SIMILARITY:
+                    scored.append((similarity, -user_id))
+        return [-neg_id for _, neg_id in sorted(scored, reverse=True)]
+
+    def search_recs(self, q: str) -> list[int]:
+        # Every query term must match, like websearch_to_tsquery; rank by term frequency
+        terms = set(tokens(q))
+        if not terms:
+            return []
+        with self.lock:
+            matches = set.intersection(*(self.recs.postings.get(term, set()) for term in terms))
+            scored = [
+                (sum(term in terms for term in self.recs.terms[rec_id]) / len(self.recs.terms[rec_id]), rec_id)
+                for rec_id in matches
+            ]
+        return [rec_id for _, rec_id in sorted(scored, reverse=True)]
+
+memory_search = MemorySearch()
+
+def index_user(db: Session, user: User):
+    if not is_postgres(db):
+        memory_search.add_user(user.id, user.username)
+
+def index_rec(db: Session, rec: Rec):
+    if not is_postgres(db):
+        memory_search.add_rec(rec.id, rec.title, rec.description, rec.category)
+
+def unindex_rec(db: Session, rec_id: int):
+    if not is_postgres(db):
+        memory_search.remove_rec(rec_id)
+
+def unindex_user(db: Session, user_id: int):
+    if not is_postgres(db):
+        memory_search.remove_user(user_id)
+
+def _in_order(rows, ids, key):
+    by_id = {key(row): row for row in rows}
+    return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+def search_users(db: Session, q: str, offset: int, limit: int) -> list[User]:
+    if is_postgres(db):
+        similarity = func.similarity(User.username, q)
+        return db.query(User).filter(
+            or_(User.username.op("%")(q), User.username.ilike(f"%{q}%")), User.deleted_at.is_(None)
+        ).order_by(similarity.desc(), User.id).offset(offset).limit(limit).all()
+
+    memory_search.load(db)
+    ids = memory_search.search_users(q)[offset:offset + limit]
+    users = db.query(User).filter(User.id.in_(ids), User.deleted_at.is_(None)).all() if ids else []
+    return _in_order(users, ids, key=lambda user: user.id)
+
+def search_recs(db: Session, q: str, offset: int, limit: int):
+    # Returns (rec, username, user_avatar) rows, best match first
+    base = visible(db.query(Rec, User.username, User.avatar).join(User, User.id == Rec.user_id))
+    if is_postgres(db):
+        query = func.websearch_to_tsquery(literal_column("'english'"), q)
+        rank = func.ts_rank(REC_SEARCH_VECTOR, query)
+        return base.filter(REC_SEARCH_VECTOR.op("@@")(query)).order_by(
+            rank.desc(), Rec.created_at.desc(), Rec.id.desc()
+        ).offset(offset).limit(limit).all()
+
+    memory_search.load(db)
+    ids = memory_search.search_recs(q)[offset:offset + limit]
+    rows = base.filter(Rec.id.in_(ids)).all() if ids else []
+    return _in_order(rows, ids, key=lambda row: row[0].id)
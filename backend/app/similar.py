@@ -0,0 +1,199 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.orm import Session
+from .models import Rec, User, Like, RecSimilar, SimilarityRun
+from .hydration import visible
+
+# "More like this": item-to-item similarity over the likes matrix. Two recs are
+# similar when the same people like them, scored by the cosine of their liker sets,
+# co-likes / sqrt(likes(a) * likes(b)). The top SIMILAR_RECS per rec are stored in
+# rec_similar, so /recs/{id}/similar is one index range.
+#
+# A run reads likes once into a scipy.sparse users x recs matrix and its transpose
+# (8 bytes per like each), then scores recs in chunks: one sparse product gives the
+# co-likes of a chunk of recs with every other rec, and each chunk's rows are
+# replaced and committed as it goes. Chunks are cut at CHUNK_SIZE recs or
+# CHUNK_CO_LIKES products, so only the matrices and one chunk's results are held
+# at a time. A full run scores every liked rec; an incremental one only recs liked
+# since the previous run started. Unlikes leave nothing to find, so they wait for
+# the next full run:
+#
+#     python -m app.similar [--full]
+
+SIMILAR_WORKER = os.getenv("SIMILAR_WORKER", "true").lower() == "true"
+SIMILAR_REFRESH_SECONDS = float(os.getenv("SIMILAR_REFRESH_SECONDS", "900"))
+SIMILAR_RECS = int(os.getenv("SIMILAR_RECS", "20"))
+# People who like nearly everything say little about any pair and cost the square
+# of their likes to count, so they are left out
+SIMILAR_MAX_USER_LIKES = int(os.getenv("SIMILAR_MAX_USER_LIKES", "1000"))
+# Co-likes counted per rec before its list is cut short
+EDGE_BUDGET = 500000
+CHUNK_SIZE = 1000
+CHUNK_CO_LIKES = 5_000_000
+LOAD_BATCH_SIZE = 50000
+# Likes committed just before a run started may carry an earlier timestamp than
+# the run's; incremental runs look back this much further
+WATERMARK_SLACK = timedelta(minutes=5)
+
+logger = logging.getLogger(__name__)
+
+class LikesMatrix:
+    def __init__(self, user_ids: np.ndarray, rec_ids: np.ndarray, users: int, recs: int):
+        likes = sparse.csr_matrix((np.ones(len(user_ids), dtype=np.int32), (user_ids, rec_ids)), shape=(users, recs))
+        self.likes_count = np.bincount(rec_ids, minlength=recs)
+        # 1 / sqrt(likes) per rec id, the cosine's denominator; over every liker
+        with np.errstate(divide="ignore"):
+            self.scale = np.where(self.likes_count > 0, 1 / np.sqrt(self.likes_count), 0.0)
+        # Co-likes only come from people under SIMILAR_MAX_USER_LIKES
+        degree = np.diff(likes.indptr)
+        light = degree <= SIMILAR_MAX_USER_LIKES
+        likes.data[np.repeat(~light, degree)] = 0
+        likes.eliminate_zeros()
+        self.by_user = likes
+        self.by_rec = likes.T.tocsr()
+        self.degree = np.where(light, degree, 0)
+        # Co-likes a rec's full count would take: the likes of everyone who liked it
+        self.work = self.by_rec @ self.degree
+
+    @classmethod
+    def load(cls, db: Session) -> "LikesMatrix":
+        users = (db.query(func.max(User.id)).scalar() or 0) + 1
+        recs = (db.query(func.max(Rec.id)).scalar() or 0) + 1
+        rows = db.execute(select(Like.user_id, Like.rec_id).execution_options(yield_per=LOAD_BATCH_SIZE))
+        pairs = [np.fromiter(chain.from_iterable(batch), dtype=np.int32, count=2 * len(batch)) for batch in rows.partitions()]
+        pairs = np.concatenate(pairs).reshape(-1, 2) if pairs else np.empty((0, 2), dtype=np.int32)
+        # Likes made after the max ids were read belong to the next run
+        pairs = pairs[(pairs[:, 0] < users) & (pairs[:, 1] < recs)]
+        return cls(pairs[:, 0], pairs[:, 1], users, recs)
+
+    def recs(self) -> list[int]:
+        return np.flatnonzero(self.likes_count).tolist()
+
+    def chunks(self, rec_ids: list[int]):
+        # Runs of at most CHUNK_SIZE recs and about CHUNK_CO_LIKES co-likes
+        chunk, work = [], 0
+        for rec_id in rec_ids:
+            cost = min(int(self.work[rec_id]), EDGE_BUDGET) if rec_id < len(self.work) else 0
+            if chunk and (len(chunk) == CHUNK_SIZE or work + cost > CHUNK_CO_LIKES):
+                yield chunk
+                chunk, work = [], 0
+            chunk.append(rec_id)
+            work += cost
+        if chunk:
+            yield chunk
+
+    def _likers(self, rec_ids: list[int]) -> sparse.csr_matrix:
+        # Rows of by_rec; a rec whose likers would take more than EDGE_BUDGET
+        # co-likes keeps the likers, in user order, up to the one that crosses it
+        likers = self.by_rec[rec_ids]
+        for row in np.flatnonzero(self.work[rec_ids] > EDGE_BUDGET):
+            start, end = likers.indptr[row], likers.indptr[row + 1]
+            spent = np.cumsum(self.degree[likers.indices[start:end]])
+            likers.data[start + np.searchsorted(spent, EDGE_BUDGET) + 1:end] = 0
+        likers.eliminate_zeros()
+        return likers
+
+    def top_similar(self, rec_ids: list[int], limit: int = SIMILAR_RECS) -> dict[int, list[tuple[float, int]]]:
+        # (score, rec_id) best first, per rec
+        rec_ids = [rec_id for rec_id in rec_ids if rec_id < len(self.scale)]
+        results = {}
+        if not rec_ids:
+            return results
+        co_likes = (self._likers(rec_ids) @ self.by_user).tocsr()
+        for row, rec_id in enumerate(rec_ids):
+            start, end = co_likes.indptr[row], co_likes.indptr[row + 1]
+            others = co_likes.indices[start:end]
+            keep = others != rec_id
+            others = others[keep]
+            # Ranked by co-likes / sqrt(likes(other)); the rec's own factor is the same for all
+            scores = co_likes.data[start:end][keep] * self.scale[others]
+            if len(scores) > limit:
+                # Every candidate tied with the limit-th score, then the larger id first
+                cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+                others, scores = others[scores >= cutoff], scores[scores >= cutoff]
+            order = np.lexsort((-others, -scores))[:limit]
+            results[rec_id] = list(zip((scores[order] * self.scale[rec_id]).tolist(), others[order].tolist()))
+        return results
+
+def _store(db: Session, results: dict[int, list[tuple[float, int]]]):
+    db.execute(delete(RecSimilar).where(RecSimilar.rec_id.in_(list(results))))
+    rows = [{"rec_id": rec_id, "similar_id": other, "score": score} for rec_id, ranked in results.items() for score, other in ranked]
+    if rows:
+        db.execute(insert(RecSimilar.__table__), rows)
+    db.commit()
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands timestamps back naive; they are UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def run(db: Session, full: bool = False) -> int:
+    started_at = datetime.now(timezone.utc)
+    last = db.query(SimilarityRun.started_at).order_by(SimilarityRun.id.desc()).first()
+    full = full or last is None
+    if full:
+        changed = None
+    else:
+        since = _aware(last.started_at) - WATERMARK_SLACK
+        changed = sorted(rec_id for rec_id, in db.query(Like.rec_id).filter(Like.created_at >= since).distinct())
+        if not changed:
+            return 0
+
+    matrix = LikesMatrix.load(db)
+    targets = changed if changed is not None else matrix.recs()
+    for chunk in matrix.chunks(targets):
+        _store(db, matrix.top_similar(chunk))
+    if full:
+        # Recs whose last like was taken back
+        db.execute(delete(RecSimilar).where(~exists().where(Like.rec_id == RecSimilar.rec_id)))
+    db.add(SimilarityRun(started_at=started_at, finished_at=datetime.now(timezone.utc), full=full, recs=len(targets)))
+    db.commit()
+    return len(targets)
+
+def similar_recs(db: Session, rec_id: int, limit: int):
+    # Returns (rec, username, user_avatar) rows, most similar first
+    return visible(db.query(Rec, User.username, User.avatar).select_from(RecSimilar).join(Rec, Rec.id == RecSimilar.similar_id).join(
+        User, User.id == Rec.user_id
+    )).filter(RecSimilar.rec_id == rec_id).order_by(RecSimilar.score.desc(), RecSimilar.similar_id).limit(limit).all()
+
+def start_worker(session_factory):
+    # An incremental run every SIMILAR_REFRESH_SECONDS (a full one the first time)
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            db = session_factory()
+            try:
+                started = time.perf_counter()
+                if count := run(db):
+                    logger.info("Similar recs recomputed for %d recs in %.1fs", count, time.perf_counter() - started)
+            except Exception:
+                db.rollback()
+                logger.exception("Similar recs run failed")
+            finally:
+                db.close()
+            stop.wait(SIMILAR_REFRESH_SECONDS)
+
+    thread = threading.Thread(target=work, name="similar", daemon=True)
+    thread.stop = stop.set
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute similar recs from the likes table.")
+    parser.add_argument("--full", action="store_true", help="rescore every liked rec, not only recs liked since the last run")
+    args = parser.parse_args()
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        print(f"{run(db, args.full)} recs scored in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
@@ -0,0 +1,113 @@
+import os
+from sqlalchemy import Integer, func, insert, select, literal, union_all, update
+from sqlalchemy.orm import Session
+from .models import TimelineEntry, Rec, Follow, User
+from .pagination import keyset_before, encode_cursor
+from .hydration import visible
+
+# Authors with more followers than this are not fanned out on write; their recs
+# are merged into each reader's feed at read time instead. Which way a rec goes is
+# decided when it is posted and kept in recs.fanned_out, so an author crossing the
+# threshold either way leaves every earlier rec where readers already find it.
+FANOUT_FOLLOWER_LIMIT = int(os.getenv("TIMELINE_FANOUT_FOLLOWER_LIMIT", "5000"))
+# How many of an author's latest recs are copied into a timeline on follow.
+BACKFILL_LIMIT = int(os.getenv("TIMELINE_BACKFILL_LIMIT", "100"))
+
+TIMELINE_COLUMNS = ["user_id", "created_at", "rec_id", "author_id"]
+
+def is_fanned_out(db: Session, author_id: int) -> bool:
+    followers_count = db.query(User.followers_count).filter(User.id == author_id).scalar()
+    return followers_count is not None and followers_count <= FANOUT_FOLLOWER_LIMIT
+
+def fan_out(db: Session, rec_id: int, author_id: int):
+    fan_out_many(db, [rec_id], author_id)
+
+def fan_out_many(db: Session, rec_ids: list[int], author_id: int):
+    # The author always sees their own recs; followers get them only for regular accounts.
+    # Must run after the recs are flushed, in the same transaction.
+    own = select(Rec.user_id, Rec.created_at, Rec.id, Rec.user_id).where(Rec.id.in_(rec_ids))
+    source = own
+    if is_fanned_out(db, author_id):
+        followers = select(Follow.follower_id, Rec.created_at, Rec.id, Rec.user_id).join(
+            Follow, Follow.following_id == Rec.user_id
+        ).where(Rec.id.in_(rec_ids))
+        source = union_all(own, followers)
+    else:
+        db.execute(update(Rec).where(Rec.id.in_(rec_ids)).values(fanned_out=False).execution_options(synchronize_session=False))
+    db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS, source))
+
+def backfill(db: Session, follower_id: int, author_ids: list[int]):
+    # Latest BACKFILL_LIMIT fanned-out recs of every newly followed account, in one
+    # statement; the rest are merged at read time
+    if not author_ids:
+        return
+    position = func.row_number().over(
+        partition_by=Rec.user_id, order_by=(Rec.created_at.desc(), Rec.id.desc())
+    ).label("position")
+    ranked = select(Rec.created_at, Rec.id, Rec.user_id, position).where(
+        Rec.user_id.in_(author_ids), Rec.fanned_out == True
+    ).subquery()
+    latest = select(
+        literal(follower_id, Integer), ranked.c.created_at, ranked.c.id, ranked.c.user_id
+    ).where(ranked.c.position <= BACKFILL_LIMIT)
+    db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS, latest))
+
+def copy_latest(db: Session, reader_id: int, author_id: int):
+    latest = select(
+        literal(reader_id, Integer), Rec.created_at, Rec.id, Rec.user_id
+    ).where(Rec.user_id == author_id).order_by(Rec.created_at.desc(), Rec.id.desc()).limit(BACKFILL_LIMIT)
+    db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS, latest))
+
+def prune(db: Session, follower_id: int, author_id: int):
+    db.query(TimelineEntry).filter(
+        TimelineEntry.user_id == follower_id, TimelineEntry.author_id == author_id
+    ).delete(synchronize_session=False)
+
+def read_timeline(db: Session, user_id: int, cursor: str | None, skip: int, limit: int):
+    # Primary-key range read of the materialized timeline, merged with the recs of
+    # followed accounts that were posted without fan-out.
+    # Returns (rows, next_cursor) with rows shaped (rec, username, user_avatar).
+    window = skip + limit + 1 if not cursor else limit + 1
+    base = visible(db.query(Rec, User.username, User.avatar).join(User, User.id == Rec.user_id))
+
+    materialized = base.join(TimelineEntry, TimelineEntry.rec_id == Rec.id).filter(TimelineEntry.user_id == user_id)
+    materialized = keyset_before(materialized, TimelineEntry.created_at, TimelineEntry.rec_id, cursor)
+    rows = materialized.order_by(TimelineEntry.created_at.desc(), TimelineEntry.rec_id.desc()).limit(window).all()
+
+    # A range of ix_recs_pulled per followed account, which only holds those recs
+    pulled = base.join(Follow, Follow.following_id == Rec.user_id).filter(Follow.follower_id == user_id, Rec.fanned_out == False)
+    pulled = keyset_before(pulled, Rec.created_at, Rec.id, cursor)
+    pulled_rows = pulled.order_by(Rec.created_at.desc(), Rec.id.desc()).limit(window).all()
+    if pulled_rows:
+        rows = sorted(rows + pulled_rows, key=lambda row: (row[0].created_at, row[0].id), reverse=True)
+
+    if not cursor:
+        rows = rows[skip:]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0].created_at, rows[-1][0].id)
+    return rows, next_cursor
+
+def rebuild(db: Session, user_id: int | None = None):
+    # Recompute timelines from the follow graph, e.g. after enabling the table on an
+    # existing database or changing the fan-out threshold.
+    query = db.query(TimelineEntry)
+    users = db.query(User.id)
+    if user_id is not None:
+        query = query.filter(TimelineEntry.user_id == user_id)
+        users = users.filter(User.id == user_id)
+    query.delete(synchronize_session=False)
+    for (reader_id,) in users.all():
+        copy_latest(db, reader_id, reader_id)
+        followed = db.query(Follow.following_id).filter(Follow.follower_id == reader_id).all()
+        backfill(db, reader_id, [author_id for author_id, in followed])
+    db.commit()
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
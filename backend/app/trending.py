@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import chain
+import numpy as np
+from sqlalchemy import case, cast, delete, func, insert, literal, select, union_all, update, Float
+from sqlalchemy.orm import Session
+from .models import Rec, User, Like, Comment, RecScore
+from .database import insert_for
+from .search import is_postgres
+from .hydration import visible
+
+# Trending and per-category rankings. Posting, likes and comments each add a weight
+# that halves every TRENDING_HALF_LIFE_HOURS. Decaying every stored score as time
+# passes would rewrite the whole table, so contributions are scaled *up* instead:
+# an event at time t is worth weight * 2^((t - start of epoch) / half-life). All
+# scores in one epoch grow at the same rate, so their order is the decayed order
+# and a new like is a single `score = score + delta`. Epochs last 32 half-lives,
+# which keeps the numbers well inside a float.
+#
+# refresh() rebuilds rec_scores from the last TRENDING_WINDOW_DAYS of recs, likes
+# and comments (older events weigh under 1%) in one batch pass, and rebases
+# every row on the current epoch. It runs every TRENDING_REFRESH_SECONDS in the
+# background, or from cron as `python -m app.trending`. Between refreshes the write
+# paths bump the affected rows in the same transaction as the write, on the epoch
+# the table is on, so an epoch rollover never mixes scales. Reads are one index
+# range over rec_scores.
+
+TRENDING_WORKER = os.getenv("TRENDING_WORKER", "true").lower() == "true"
+TRENDING_REFRESH_SECONDS = float(os.getenv("TRENDING_REFRESH_SECONDS", "300"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+TRENDING_WINDOW_DAYS = float(os.getenv("TRENDING_WINDOW_DAYS", "7"))
+POST_WEIGHT = 1.0
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+HALF_LIFE_SECONDS = TRENDING_HALF_LIFE_HOURS * 3600
+EPOCH_SECONDS = 32 * HALF_LIFE_SECONDS
+BATCH_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+def epoch_at(now: float) -> int:
+    return int(now // EPOCH_SECONDS)
+
+def weighted(weight: float, at: float, epoch: int) -> float:
+    return weight * 2 ** ((at - epoch * EPOCH_SECONDS) / HALF_LIFE_SECONDS)
+
+def bump(db: Session, rec_ids, weight: float):
+    # Adds an event happening now to each rec's score, creating missing rows. Every
+    # row is on the epoch refresh() last wrote, so scores compare across the table;
+    # when that is the previous epoch (a refresh is due), the delta and any new rows
+    # go on its scale too, until the refresh rebases them all.
+    if not rec_ids:
+        return
+    now = time.time()
+    epoch = epoch_at(now)
+    delta = weighted(weight, now, epoch)
+    previous = weighted(weight, now, epoch - 1)
+    table_epoch = func.coalesce(select(RecScore.epoch).limit(1).scalar_subquery(), epoch)
+    stmt = insert_for(db, RecScore).from_select(
+        ["rec_id", "category", "score", "epoch"],
+        select(Rec.id, Rec.category, case((table_epoch == epoch, delta), else_=previous), table_epoch).where(Rec.id.in_(list(rec_ids))),
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["rec_id"],
+        set_={"score": RecScore.score + case((RecScore.epoch == epoch, delta), else_=previous)},
+    ))
+
+def rec_created(db: Session, rec_id: int):
+    bump(db, [rec_id], POST_WEIGHT)
+
+def recs_liked(db: Session, rec_ids):
+    bump(db, rec_ids, LIKE_WEIGHT)
+
+def likes_removed(db: Session, likes):
+    # likes: (rec_id, created_at) of deleted likes. Each takes back what it added:
+    # its weight at the time it was made, and only if refresh() would still count
+    # it. Rows are only ever lowered here, never created.
+    now = time.time()
+    epoch = epoch_at(now)
+    since = now - TRENDING_WINDOW_DAYS * 86400
+    amounts = defaultdict(float)
+    for rec_id, created_at in likes:
+        # SQLite hands back the naive UTC it stored
+        at = (created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)).timestamp()
+        if at >= since:
+            amounts[rec_id] += weighted(LIKE_WEIGHT, at, epoch)
+    if not amounts:
+        return
+    amount = case(amounts, value=RecScore.rec_id)
+    db.execute(
+        update(RecScore).where(RecScore.rec_id.in_(list(amounts))).values(
+            # Rows still on the previous epoch take it on their scale, as in bump
+            score=RecScore.score - case((RecScore.epoch == epoch, amount), else_=amount * 2 ** (EPOCH_SECONDS / HALF_LIFE_SECONDS))
+        ).execution_options(synchronize_session=False)
+    )
+
+def rec_commented(db: Session, rec_id: int):
+    bump(db, [rec_id], COMMENT_WEIGHT)
+
+def retract(db: Session, rec_id: int):
+    db.execute(delete(RecScore).where(RecScore.rec_id == rec_id))
+
+def _seconds(db: Session, column):
+    # Unix time of a timestamp column, computed by the database rather than by
+    # building a datetime per row. Naive columns hold UTC, which both read as such.
+    if is_postgres(db):
+        return cast(func.extract("epoch", column), Float)
+    return cast(func.strftime("%s", column), Float)
+
+def _events(db: Session, since: datetime):
+    # (rec_id, weight, at) for every post, like and comment in the window; each part
+    # is one range scan of its created_at index
+    naive = since.replace(tzinfo=None)
+    return union_all(
+        select(Rec.id.label("rec_id"), literal(POST_WEIGHT, Float).label("weight"), _seconds(db, Rec.created_at).label("at")).where(Rec.created_at >= since),
+        select(Like.rec_id, literal(LIKE_WEIGHT, Float), _seconds(db, Like.created_at)).where(Like.created_at >= since),
+        select(Comment.rec_id, literal(COMMENT_WEIGHT, Float), _seconds(db, Comment.created_at)).where(Comment.created_at >= naive),
+    ).subquery()
+
+def refresh(db: Session) -> int:
+    now = time.time()
+    epoch = epoch_at(now)
+    events = _events(db, datetime.fromtimestamp(now - TRENDING_WINDOW_DAYS * 86400, timezone.utc))
+    # Replaced in one transaction, so readers see either the old table or the new one
+    db.execute(delete(RecScore))
+    if is_postgres(db):
+        # The whole pass is one INSERT ... SELECT ... GROUP BY inside the database
+        score = func.sum(events.c.weight * func.power(2.0, (events.c.at - epoch * EPOCH_SECONDS) / HALF_LIFE_SECONDS))
+        scored = select(events.c.rec_id, Rec.category, score, literal(epoch)).join(Rec, Rec.id == events.c.rec_id).group_by(events.c.rec_id, Rec.category)
+        count = db.execute(insert(RecScore).from_select(["rec_id", "category", "score", "epoch"], scored)).rowcount
+    else:
+        # SQLite has no power(): each batch of events is added into an array of
+        # scores indexed by rec id, so memory is 8 bytes per rec, not per event
+        scores = np.zeros((db.query(func.max(Rec.id)).scalar() or 0) + 1)
+        rows = db.execute(select(events.c.rec_id, events.c.weight, events.c.at).execution_options(yield_per=BATCH_SIZE))
+        for batch in rows.partitions():
+            rec_id, weight, at = np.fromiter(chain.from_iterable(batch), dtype=np.float64, count=3 * len(batch)).reshape(-1, 3).T
+            rec_id = rec_id.astype(np.int64)
+            if rec_id.max() >= len(scores):
+                # Posted since the array was sized
+                scores = np.concatenate([scores, np.zeros(rec_id.max() + 1 - len(scores))])
+            np.add.at(scores, rec_id, weight * np.exp2((at - epoch * EPOCH_SECONDS) / HALF_LIFE_SECONDS))
+        rec_ids = np.flatnonzero(scores)
+        scores = scores[rec_ids]
+        count = 0
+        for start in range(0, len(rec_ids), BATCH_SIZE):
+            chunk = dict(zip(rec_ids[start:start + BATCH_SIZE].tolist(), scores[start:start + BATCH_SIZE].tolist()))
+            rows = [
+                {"rec_id": rec_id, "category": category, "score": chunk[rec_id], "epoch": epoch}
+                for rec_id, category in db.execute(select(Rec.id, Rec.category).where(Rec.id.in_(list(chunk))))
+            ]
+            if rows:
+                db.execute(insert(RecScore.__table__), rows)
+            count += len(rows)
+    db.commit()
+    return count
+
+def ranked(db: Session, category: str | None, offset: int, limit: int):
+    # Returns (rec, username, user_avatar) rows, highest score first
+    query = visible(db.query(Rec, User.username, User.avatar).select_from(RecScore).join(Rec, Rec.id == RecScore.rec_id).join(User, User.id == Rec.user_id))
+    if category is not None:
+        query = query.filter(RecScore.category == category)
+    return query.order_by(RecScore.score.desc(), RecScore.rec_id.desc()).offset(offset).limit(limit).all()
+
+def start_worker(session_factory):
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            db = session_factory()
+            try:
+                started = time.perf_counter()
+                count = refresh(db)
+                logger.info("Trending scores refreshed: %d recs in %.1fs", count, time.perf_counter() - started)
+            except Exception:
+                db.rollback()
+                logger.exception("Trending refresh failed")
+            finally:
+                db.close()
+            stop.wait(TRENDING_REFRESH_SECONDS)
+
+    thread = threading.Thread(target=run, name="trending", daemon=True)
+    thread.stop = stop.set
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        print(f"{refresh(db)} recs scored")
+    finally:
+        db.close()
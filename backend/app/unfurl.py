@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import ipaddress
+import os
+import socket
+import weakref
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+import httpx
+from sqlalchemy.orm import Session
+from .models import LinkPreview
+from .database import insert_for
+
+# Server-side link previews (OpenGraph / Twitter card / <title>). Previews are
+# stored in link_previews keyed by the normalized URL, so a link shared by many
+# users is fetched once per UNFURL_TTL_HOURS. Fetches go through a per-process
+# limit on concurrent requests, and concurrent requests for the same URL share one
+# fetch. Failures are remembered for a shorter time so dead links are not retried
+# on every paste.
+
+UNFURL_CONCURRENCY = int(os.getenv("UNFURL_CONCURRENCY", "8"))
+UNFURL_TIMEOUT_SECONDS = float(os.getenv("UNFURL_TIMEOUT_SECONDS", "5"))
+UNFURL_MAX_BYTES = int(os.getenv("UNFURL_MAX_BYTES", str(512 * 1024)))
+UNFURL_MAX_REDIRECTS = int(os.getenv("UNFURL_MAX_REDIRECTS", "3"))
+UNFURL_TTL_HOURS = int(os.getenv("UNFURL_TTL_HOURS", "168"))
+UNFURL_FAILURE_TTL_MINUTES = int(os.getenv("UNFURL_FAILURE_TTL_MINUTES", "30"))
+# Loopback and private addresses are refused so /unfurl cannot be used to probe the
+# internal network; enable only for local development against a stub server
+UNFURL_ALLOW_PRIVATE = os.getenv("UNFURL_ALLOW_PRIVATE", "false").lower() == "true"
+HEADERS = {
+    "User-Agent": "recs-unfurl/1.0 (+https://recs-nine.vercel.app)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5",
+}
+
+# Query parameters that only identify the referrer, never the content
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref_src", "si"}
+
+class UnfurlError(Exception):
+    pass
+
+def normalize_url(url: str) -> str:
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise UnfurlError("Only http(s) links can be previewed")
+        # IPv6 literals keep their brackets; names go to their ASCII form
+        host = f"[{parts.hostname}]" if ":" in parts.hostname else parts.hostname.encode("idna").decode()
+        port = parts.port
+    except (ValueError, UnicodeError):
+        raise UnfurlError("Not a valid link")
+    netloc = host if port in (None, 80 if scheme == "http" else 443) else f"{host}:{port}"
+    query = urlencode(sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+class _MetaParser(HTMLParser):
+    # Collects <meta> and <title> from the head; the body is never needed
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "meta":
+            name = (attrs.get("property") or attrs.get("name") or "").lower()
+            if name and attrs.get("content") and name not in self.meta:
+                self.meta[name] = attrs["content"].strip()
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+def parse_preview(html: str, url: str) -> dict:
+    parser = _MetaParser()
+    head_end = html.lower().find("</head>")
+    parser.feed(html if head_end < 0 else html[:head_end])
+    meta = parser.meta
+
+    def first(*names):
+        return next((meta[name] for name in names if meta.get(name)), "")
+
+    image = first("og:image:secure_url", "og:image", "og:image:url", "twitter:image", "twitter:image:src")
+    return {
+        "title": (first("og:title", "twitter:title") or " ".join(parser.title.split()))[:300],
+        "description": first("og:description", "twitter:description", "description")[:1000],
+        "image": urljoin(url, image)[:500] if image else "",
+        "site_name": first("og:site_name")[:100],
+    }
+
+async def _check_host(host: str) -> str:
+    # Returns the address to connect to. The request goes to that address rather
+    # than the name, so a second lookup cannot swap in a private one after the check.
+    if UNFURL_ALLOW_PRIVATE:
+        return host
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnfurlError("Host not found")
+    addresses = [ipaddress.ip_address(sockaddr[0]) for *_, sockaddr in infos]
+    if not addresses or not all(address.is_global for address in addresses):
+        raise UnfurlError("Host not allowed")
+    return str(addresses[0])
+
+def _pinned(parts, port: int | None, address: str) -> str:
+    host = f"[{address}]" if ":" in address else address
+    netloc = host if port is None else f"{host}:{port}"
+    return urlunsplit((parts.scheme, netloc, parts.path or "/", parts.query, ""))
+
+async def fetch_preview(client: httpx.AsyncClient, url: str) -> dict:
+    # Redirects are followed by hand so every hop goes through _check_host
+    for _ in range(UNFURL_MAX_REDIRECTS + 1):
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
+            raise UnfurlError("Not a valid link")
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise UnfurlError("Only http(s) links can be previewed")
+        address = await _check_host(parts.hostname)
+        # Host and SNI still name the site, so virtual hosting and certificate checks work
+        host = parts.netloc.rpartition("@")[2]
+        async with client.stream("GET", _pinned(parts, port, address), headers={"Host": host}, extensions={"sni_hostname": parts.hostname}) as response:
+            if response.is_redirect and response.headers.get("location"):
+                url = urljoin(url, response.headers["location"])
+                continue
+            if response.status_code != 200:
+                raise UnfurlError(f"Link returned {response.status_code}")
+            if "html" not in response.headers.get("content-type", ""):
+                # Direct links to images and other media have no metadata to read
+                return {"title": "", "description": "", "image": url if response.headers.get("content-type", "").startswith("image/") else "", "site_name": ""}
+            body = b""
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= UNFURL_MAX_BYTES:
+                    break
+            try:
+                html = body[:UNFURL_MAX_BYTES].decode(response.encoding or "utf-8", errors="replace")
+            except LookupError:
+                # A charset Python has no codec for
+                html = body[:UNFURL_MAX_BYTES].decode("utf-8", errors="replace")
+            return parse_preview(html, url)
+    raise UnfurlError("Too many redirects")
+
+class Fetcher:
+    # One per event loop: the semaphore and the in-flight futures belong to the
+    # loop that created them
+    def __init__(self):
+        self.limit = asyncio.Semaphore(UNFURL_CONCURRENCY)
+        self.in_flight = {}
+
+    async def _fetch(self, url: str) -> dict:
+        async with self.limit:
+            try:
+                # Previews are spread over many hosts, so there is little to gain from a shared pool
+                async with httpx.AsyncClient(timeout=UNFURL_TIMEOUT_SECONDS, headers=HEADERS) as client:
+                    return await fetch_preview(client, url)
+            except httpx.HTTPError as e:
+                raise UnfurlError(f"Could not fetch link: {type(e).__name__}")
+
+    async def fetch(self, url: str) -> dict:
+        if url not in self.in_flight:
+            task = asyncio.ensure_future(self._fetch(url))
+            self.in_flight[url] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(url, None))
+        return await asyncio.shield(self.in_flight[url])
+
+_fetchers = weakref.WeakKeyDictionary()
+
+def fetcher() -> Fetcher:
+    loop = asyncio.get_running_loop()
+    if loop not in _fetchers:
+        _fetchers[loop] = Fetcher()
+    return _fetchers[loop]
+
+def cached(db: Session, url: str) -> LinkPreview | None:
+    preview = db.get(LinkPreview, url_key(url))
+    return preview if preview and preview.expires_at > datetime.utcnow() else None
+
+def store(db: Session, url: str, fields: dict | None, error: str | None) -> LinkPreview:
+    now = datetime.utcnow()
+    ttl = timedelta(hours=UNFURL_TTL_HOURS) if fields is not None else timedelta(minutes=UNFURL_FAILURE_TTL_MINUTES)
+    row = {
+        "key": url_key(url), "url": url, **(fields or {"title": "", "description": "", "image": "", "site_name": ""}),
+        "error": error, "fetched_at": now, "expires_at": now + ttl,
+    }
+    stmt = insert_for(db, LinkPreview).values(row)
+    db.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={name: stmt.excluded[name] for name in row if name != "key"}))
+    db.commit()
+    return db.get(LinkPreview, row["key"], populate_existing=True)
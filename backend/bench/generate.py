@@ -0,0 +1,171 @@
+import argparse
+import math
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from pathlib import Path
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import insert, text
+from app.database import SessionLocal, engine
+from app.models import User, Rec, Follow, Like, Comment, Notification
+from app.auth import hash_password
+from app import counters, timeline, trending
+
+# Synthetic data for the benchmark suite. Everything is drawn from one seeded RNG,
+# so the same arguments always produce the same database.
+#
+#     DATABASE_URL=sqlite:///bench.db python -m bench.generate --users 2000
+#
+# Follow targets are Zipf-distributed by popularity, so a few accounts get very
+# large audiences (and cross app.timeline's fan-out threshold at scale) while most
+# have a handful. Per-user activity (follows, recs, likes, comments) is lognormal
+# around the given means.
+
+PASSWORD = "bench"
+WORDS = (
+    "ambient jazz techno folk indie soul punk opera vinyl playlist album single live "
+    "novel poetry memoir essay thriller sci-fi fantasy history philosophy design "
+    "film documentary anime series director trailer podcast interview episode "
+    "recipe coffee ramen pasta bakery travel hiking city museum gallery sneakers "
+    "denim vintage minimal camera lens photography video tutorial retro synth"
+).split()
+CATEGORIES = ["music", "video", "podcast", "book", "film", "article", "fashion"]
+
+def lognormal_count(rng: random.Random, mean: float, cap: int, sigma: float = 1.0) -> int:
+    if mean <= 0:
+        return 0
+    return min(cap, int(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)))
+
+def weighted_sample(rng: random.Random, population: list, cum_weights: list, k: int, exclude=None) -> list:
+    # k distinct picks proportional to weight; gives up after a few rounds on tiny populations
+    picked = set()
+    total = cum_weights[-1]
+    for _ in range(k * 4):
+        if len(picked) >= k:
+            break
+        item = population[bisect_left(cum_weights, rng.random() * total)]
+        if item != exclude:
+            picked.add(item)
+    return list(picked)
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def generate(args) -> dict:
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    start = now - timedelta(days=args.days)
+
+    def moment(after: datetime = start) -> datetime:
+        return after + (now - after) * rng.random()
+
+    user_ids = list(range(1, args.users + 1))
+    ranks = user_ids[:]
+    rng.shuffle(ranks)
+    popularity = [1 / rank ** args.popularity_alpha for rank in ranks]
+    popularity_cum = list(accumulate(popularity))
+
+    password = hash_password(PASSWORD)
+    users = [
+        {
+            "id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@bench.local",
+            "password": password, "bio": sentence(rng, 6), "avatar": "", "created_at": start,
+        }
+        for user_id in user_ids
+    ]
+
+    follows = []
+    for user_id in user_ids:
+        degree = lognormal_count(rng, args.follow_mean, args.users - 1)
+        for target in weighted_sample(rng, user_ids, popularity_cum, degree, exclude=user_id):
+            follows.append({"follower_id": user_id, "following_id": target, "created_at": moment()})
+
+    recs = []
+    for user_id in user_ids:
+        for _ in range(lognormal_count(rng, args.recs_mean, 10 * int(args.recs_mean) + 10)):
+            recs.append({
+                "id": len(recs) + 1, "user_id": user_id, "category": rng.choice(CATEGORIES),
+                "title": sentence(rng, rng.randint(2, 6)), "description": sentence(rng, rng.randint(5, 20)),
+                "link": f"https://example.com/{len(recs) + 1}", "image": "", "created_at": moment(),
+            })
+    rec_ids = [rec["id"] for rec in recs]
+    # Recs by popular authors attract proportionally more likes and comments
+    rec_cum = list(accumulate(popularity[rec["user_id"] - 1] for rec in recs))
+    rec_by_id = {rec["id"]: rec for rec in recs}
+
+    likes, comments, notifications = [], [], []
+
+    def notify(user_id, from_user_id, type, rec_id, created_at):
+        if user_id != from_user_id:
+            notifications.append({
+                "user_id": user_id, "from_user_id": from_user_id, "type": type, "rec_id": rec_id,
+                "is_read": rng.random() < args.read_ratio, "created_at": created_at, "actor_count": 1,
+            })
+
+    if recs:
+        for user_id in user_ids:
+            for rec_id in weighted_sample(rng, rec_ids, rec_cum, lognormal_count(rng, args.likes_mean, len(recs))):
+                rec = rec_by_id[rec_id]
+                created_at = moment(rec["created_at"])
+                likes.append({"user_id": user_id, "rec_id": rec_id, "created_at": created_at})
+                notify(rec["user_id"], user_id, "like", rec_id, created_at)
+            for rec_id in weighted_sample(rng, rec_ids, rec_cum, lognormal_count(rng, args.comments_mean, len(recs))):
+                rec = rec_by_id[rec_id]
+                created_at = moment(rec["created_at"])
+                comments.append({"user_id": user_id, "rec_id": rec_id, "content": sentence(rng, rng.randint(3, 12)), "created_at": created_at})
+                notify(rec["user_id"], user_id, "comment", rec_id, created_at)
+    for follow in follows:
+        notify(follow["following_id"], follow["follower_id"], "follow", None, follow["created_at"])
+
+    db = SessionLocal()
+    try:
+        for model, rows in [(User, users), (Rec, recs), (Follow, follows), (Like, likes), (Comment, comments), (Notification, notifications)]:
+            for offset in range(0, len(rows), args.batch):
+                db.execute(insert(model), rows[offset:offset + args.batch])
+        if engine.dialect.name == "postgresql":
+            # Users and recs were inserted with explicit ids
+            for table in ("users", "recs"):
+                db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+        db.commit()
+        counters.reconcile(db)
+        timeline.rebuild(db)
+        trending.refresh(db)
+    finally:
+        db.close()
+
+    return {
+        "users": len(users), "follows": len(follows), "recs": len(recs), "likes": len(likes),
+        "comments": len(comments), "notifications": len(notifications),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill an empty database with synthetic benchmark data.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follow-mean", type=float, default=25, help="mean follows per user")
+    parser.add_argument("--popularity-alpha", type=float, default=1.0, help="Zipf exponent of follow targets")
+    parser.add_argument("--recs-mean", type=float, default=8, help="mean recs per user")
+    parser.add_argument("--likes-mean", type=float, default=30, help="mean likes per user")
+    parser.add_argument("--comments-mean", type=float, default=5, help="mean comments per user")
+    parser.add_argument("--read-ratio", type=float, default=0.8, help="share of notifications already read")
+    parser.add_argument("--days", type=int, default=30, help="spread of created_at into the past")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=5000, help="rows per INSERT batch")
+    args = parser.parse_args()
+
+    command.upgrade(Config(str(Path(__file__).resolve().parent.parent / "alembic.ini")), "head")
+    db = SessionLocal()
+    try:
+        if db.query(User.id).first() is not None:
+            parser.error("the database already has users; point DATABASE_URL at an empty one")
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    counts = generate(args)
+    print(", ".join(f"{count} {name}" for name, count in counts.items()) + f" in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
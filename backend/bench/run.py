@@ -0,0 +1,240 @@
+import os
+
+# The outbox worker would compete with the measured requests; like storms leave
+# their events in the outbox instead
+os.environ.setdefault("OUTBOX_WORKER", "false")
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func
+from app.main import app
+from app.auth import create_access_token
+from app.database import SessionLocal, engine, replica_engine, async_engine, async_replica_engine
+from app.models import User, Rec
+from bench.generate import WORDS, CATEGORIES
+
+# Scripted scenarios against the app in-process (no network), on whatever
+# DATABASE_URL points at. Each scenario is replayed as a number of sessions by
+# random users: first a sequential warm-up pass that also counts the SQL statements
+# behind every endpoint, then the timed pass. Reports per-endpoint p50/p95/p99
+# latency, throughput and queries per request.
+#
+#     DATABASE_URL=sqlite:///bench.db python -m bench.run --json after.json --baseline before.json
+
+FEED_PAGES = 3
+HOT_RECS = 20
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.queries = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, label: str, seconds: float, ok: bool, queries: int | None):
+        with self.lock:
+            self.latencies[label].append(seconds)
+            if not ok:
+                self.errors[label] += 1
+            if queries is not None:
+                self.queries[label].append(queries)
+
+class QueryCounter:
+    # Only meaningful while a single request is in flight (the warm-up pass)
+    def __init__(self):
+        self.count = 0
+        for eng in (engine, replica_engine, async_engine and async_engine.sync_engine, async_replica_engine and async_replica_engine.sync_engine):
+            if eng is not None:
+                event.listen(eng, "before_cursor_execute", self.before_cursor_execute)
+
+    def before_cursor_execute(self, *args):
+        self.count += 1
+
+class Context:
+    def __init__(self):
+        db = SessionLocal()
+        try:
+            self.users = db.query(User.id, User.username).order_by(User.id).all()
+            self.hot_recs = [rec_id for rec_id, in db.query(Rec.id).order_by(Rec.likes_count.desc()).limit(HOT_RECS)]
+            self.recs = db.query(func.count(Rec.id)).scalar()
+        finally:
+            db.close()
+        if not self.users or not self.hot_recs:
+            raise SystemExit("no data: run `python -m bench.generate` first")
+        self.tokens = {}
+
+    def token(self, user_id: int, username: str) -> str:
+        if user_id not in self.tokens:
+            self.tokens[user_id] = create_access_token({"user_id": user_id, "username": username})
+        return self.tokens[user_id]
+
+class Session:
+    def __init__(self, client: TestClient, context: Context, stats: Stats, rng: random.Random, counter: QueryCounter | None):
+        self.client = client
+        self.context = context
+        self.stats = stats
+        self.rng = rng
+        self.counter = counter
+        self.user_id, self.username = rng.choice(context.users)
+
+    def other_user(self) -> str:
+        return self.rng.choice(self.context.users)[1]
+
+    def call(self, label: str, method: str, path: str, expect=(200,), **kwargs):
+        headers = {"Authorization": f"Bearer {self.context.token(self.user_id, self.username)}"}
+        before = self.counter.count if self.counter else 0
+        started = time.perf_counter()
+        response = self.client.request(method, path, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - started
+        queries = self.counter.count - before if self.counter else None
+        self.stats.add(label, elapsed, response.status_code in expect, queries)
+        return response
+
+def feed_scroll(session: Session):
+    cursor = None
+    for _ in range(FEED_PAGES):
+        page = session.call("GET /recs/feed", "GET", "/recs/feed", params={"limit": 20, "comments": 3, "cursor": cursor}).json()
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+
+def profile_view(session: Session):
+    username = session.other_user()
+    session.call("GET /users/{username}", "GET", f"/users/{username}")
+    session.call("GET /recs/user/{username}", "GET", f"/recs/user/{username}", params={"comments": 3})
+    session.call("GET /users/{username}/followers", "GET", f"/users/{username}/followers")
+    session.call("GET /users/{username}/following", "GET", f"/users/{username}/following")
+
+def search(session: Session):
+    session.call("GET /users/search", "GET", "/users/search", params={"q": session.other_user()[:6]})
+    session.call("GET /recs/search", "GET", "/recs/search", params={"q": session.rng.choice(WORDS)})
+
+def browse(session: Session):
+    session.call("GET /recs/trending", "GET", "/recs/trending", params={"comments": 3})
+    category = session.rng.choice(CATEGORIES)
+    page = session.call("GET /recs/category/{category}", "GET", f"/recs/category/{category}").json()
+    if page.get("next_cursor"):
+        session.call("GET /recs/category/{category}", "GET", f"/recs/category/{category}", params={"cursor": page["next_cursor"]})
+
+def like_storm(session: Session):
+    # Many users hitting the same few popular recs; 400 means this user had already liked it
+    rec_id = session.rng.choice(session.context.hot_recs)
+    if session.call("POST /recs/{rec_id}/like", "POST", f"/recs/{rec_id}/like", expect=(200, 400)).status_code == 200:
+        session.call("DELETE /recs/{rec_id}/like", "DELETE", f"/recs/{rec_id}/like")
+
+def notification_check(session: Session):
+    session.call("GET /notifications/unread-count", "GET", "/notifications/unread-count")
+    session.call("GET /notifications/", "GET", "/notifications/")
+    if session.rng.random() < 0.2:
+        session.call("POST /notifications/read", "POST", "/notifications/read")
+
+SCENARIOS = {
+    "feed_scroll": feed_scroll,
+    "profile_view": profile_view,
+    "search": search,
+    "browse": browse,
+    "like_storm": like_storm,
+    "notification_check": notification_check,
+}
+
+def percentile(values: list[float], pct: float) -> float:
+    # Nearest-rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def run_scenario(scenario, context: Context, counter: QueryCounter, args) -> tuple[dict, float]:
+    # Warm-up: sequential, so statement counts can be attributed to each request
+    warmup = Stats()
+    client = TestClient(app)
+    rng = random.Random(args.seed)
+    for _ in range(args.warmup):
+        scenario(Session(client, context, warmup, rng, counter))
+
+    stats = Stats()
+    sessions_per_worker = [args.sessions // args.concurrency + (i < args.sessions % args.concurrency) for i in range(args.concurrency)]
+
+    def worker(index: int):
+        worker_client = TestClient(app)
+        worker_rng = random.Random(args.seed * 1000 + index + 1)
+        for _ in range(sessions_per_worker[index]):
+            scenario(Session(worker_client, context, stats, worker_rng, None))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    results = {}
+    for label, latencies in stats.latencies.items():
+        queries = warmup.queries.get(label)
+        results[label] = {
+            "requests": len(latencies),
+            "errors": stats.errors[label],
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "rps": len(latencies) / wall,
+            "queries": sum(queries) / len(queries) if queries else None,
+        }
+    return results, wall
+
+def _delta(value, base) -> str:
+    if value is None or not base:
+        return ""
+    return f"{(value - base) / base * 100:+.0f}%"
+
+def report(results: dict, baseline: dict | None):
+    header = f"{'endpoint':<36}{'reqs':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}"
+    for scenario, endpoints in results["scenarios"].items():
+        print(f"\n{scenario}\n{header}")
+        for label, row in endpoints.items():
+            queries = f"{row['queries']:.1f}" if row["queries"] is not None else "-"
+            print(f"{label:<36}{row['requests']:>7}{row['errors']:>5}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['rps']:>9.1f}{queries:>9}")
+            base = (baseline or {}).get("scenarios", {}).get(scenario, {}).get(label)
+            if base:
+                print(f"{'  vs baseline':<48}{_delta(row['p50_ms'], base['p50_ms']):>9}{_delta(row['p95_ms'], base['p95_ms']):>9}"
+                      f"{_delta(row['p99_ms'], base['p99_ms']):>9}{_delta(row['rps'], base['rps']):>9}{_delta(row['queries'], base['queries']):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API benchmark scenarios.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repeatable; default all")
+    parser.add_argument("--sessions", type=int, default=200, help="timed sessions per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="sequential warm-up sessions per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    context = Context()
+    counter = QueryCounter()
+    users, recs = len(context.users), context.recs
+    results = {
+        "database": engine.dialect.name,
+        "dataset": {"users": users, "recs": recs},
+        "settings": {"sessions": args.sessions, "concurrency": args.concurrency, "seed": args.seed},
+        "scenarios": {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        results["scenarios"][name], wall = run_scenario(SCENARIOS[name], context, counter, args)
+        print(f"{name}: {args.sessions} sessions in {wall:.1f}s")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(f"\n{results['database']}, {users} users, {recs} recs, concurrency {args.concurrency}")
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
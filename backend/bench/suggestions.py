@@ -0,0 +1,91 @@
+import argparse
+import random
+import time
+import resource
+from itertools import accumulate
+from app.suggestions import CSR, FollowGraph
+from bench.generate import lognormal_count
+from bench.run import percentile
+
+# Benchmark of the follow-graph index behind /users/suggestions, on a synthetic
+# graph held in memory (no database), so it scales to millions of edges:
+#
+#     python -m bench.suggestions --users 200000 --follow-mean 25
+#
+# Follow targets are Zipf-distributed like bench.generate's. Reports the build
+# time and footprint of the CSR arrays, suggestion latency for random users and
+# for the users who follow the most accounts, and incremental update throughput.
+
+def synthetic_edges(rng: random.Random, users: int, follow_mean: float, alpha: float):
+    # Yields (follower, following) sorted by follower, then following; ids start at 1
+    ranks = list(range(1, users + 1))
+    rng.shuffle(ranks)
+    cum_weights = list(accumulate(1 / rank ** alpha for rank in ranks))
+    population = range(1, users + 1)
+    for follower in population:
+        degree = lognormal_count(rng, follow_mean, users - 1)
+        targets = set(rng.choices(population, cum_weights=cum_weights, k=degree))
+        targets.discard(follower)
+        for target in sorted(targets):
+            yield follower, target
+
+def timed_queries(graph: FollowGraph, user_ids: list[int], limit: int) -> list[float]:
+    latencies = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        graph.suggest(user_id, limit)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def report(label: str, latencies: list[float]):
+    print(f"{label:<28}{len(latencies):>7}{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 95) * 1000:>9.2f}{percentile(latencies, 99) * 1000:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the follow-graph suggestion index.")
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--follow-mean", type=float, default=25, help="mean follows per user")
+    parser.add_argument("--popularity-alpha", type=float, default=1.0, help="Zipf exponent of follow targets")
+    parser.add_argument("--queries", type=int, default=2000, help="suggestion requests per group")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=100000, help="follow/unfollow pairs")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Generated up front so the build is timed on its own, as it would be over a DB cursor
+    started = time.perf_counter()
+    edges = list(synthetic_edges(rng, args.users, args.follow_mean, args.popularity_alpha))
+    print(f"generated {len(edges)} edges over {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    following = CSR.from_sorted_edges(edges, args.users + 1)
+    forward = time.perf_counter() - started
+    graph = FollowGraph(following)
+    total = time.perf_counter() - started
+    del edges
+    # ru_maxrss is in KB on Linux; it includes the generated edge list
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    print(f"built in {total:.1f}s (forward {forward:.1f}s, reverse and ranking {total - forward:.1f}s); "
+          f"arrays {graph.nbytes() / 1e6:.1f} MB, process peak {peak:.0f} MB")
+
+    user_ids = list(range(1, args.users + 1))
+    heaviest = sorted(user_ids, key=graph.following.degree, reverse=True)[:args.queries]
+    print(f"\n{'suggestions':<28}{'reqs':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    report("random users", timed_queries(graph, rng.sample(user_ids, min(args.queries, args.users)), args.limit))
+    report("users following the most", timed_queries(graph, heaviest, args.limit))
+
+    # Updates land in the overlay until the next rebuild; measure queries with it populated
+    pairs = [(rng.randrange(1, args.users + 1), rng.randrange(1, args.users + 1)) for _ in range(args.updates)]
+    started = time.perf_counter()
+    for follower, target in pairs:
+        graph.follow(follower, target)
+    follows = time.perf_counter() - started
+    report(f"with {args.updates} overlay edges", timed_queries(graph, rng.sample(user_ids, min(args.queries, args.users)), args.limit))
+    started = time.perf_counter()
+    for follower, target in pairs:
+        graph.unfollow(follower, target)
+    unfollows = time.perf_counter() - started
+    print(f"\nincremental updates: {args.updates / follows:,.0f} follows/s, {args.updates / unfollows:,.0f} unfollows/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Denormalized counters, timeline, coalesced notifications, outbox and search indexes
+
+Backfills the counters and the timeline from the source tables, and drops
+duplicate likes/follows so their unique constraints can be added.
+
+Revision ID: 0002_feed_schema
+Revises: 0001_initial
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_feed_schema"
+down_revision: Union[str, Sequence[str], None] = "0001_initial"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Matches app.timeline.BACKFILL_LIMIT's default
+TIMELINE_BACKFILL_LIMIT = 100
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    postgres = op.get_bind().dialect.name == "postgresql"
+
+    # Counters (app.counters)
+    for table, column in [("users", "recs_count"), ("users", "followers_count"), ("users", "following_count"),
+                          ("recs", "likes_count"), ("recs", "comments_count")]:
+        op.add_column(table, sa.Column(column, sa.Integer(), nullable=False, server_default="0"))
+
+    # Duplicate edges would fail the unique constraints below
+    op.execute("DELETE FROM likes WHERE id NOT IN (SELECT min(id) FROM likes GROUP BY user_id, rec_id)")
+    op.execute("DELETE FROM follows WHERE id NOT IN (SELECT min(id) FROM follows GROUP BY follower_id, following_id)")
+    with op.batch_alter_table("likes") as batch:
+        batch.create_unique_constraint("uq_likes_user_rec", ["user_id", "rec_id"])
+    with op.batch_alter_table("follows") as batch:
+        batch.create_unique_constraint("uq_follows_follower_following", ["follower_id", "following_id"])
+
+    op.execute("""
+        UPDATE users SET
+            recs_count = (SELECT count(*) FROM recs WHERE recs.user_id = users.id),
+            followers_count = (SELECT count(*) FROM follows WHERE follows.following_id = users.id),
+            following_count = (SELECT count(*) FROM follows WHERE follows.follower_id = users.id)
+    """)
+    op.execute("""
+        UPDATE recs SET
+            likes_count = (SELECT count(*) FROM likes WHERE likes.rec_id = recs.id),
+            comments_count = (SELECT count(*) FROM comments WHERE comments.rec_id = recs.id)
+    """)
+
+    # Keyset pagination
+    op.create_index("ix_recs_user_created_id", "recs", ["user_id", sa.text("created_at DESC"), "id"])
+    op.create_index("ix_comments_rec_created_id", "comments", ["rec_id", "created_at", "id"])
+    op.create_index("ix_notifications_user_created_id", "notifications", ["user_id", sa.text("created_at DESC"), "id"])
+
+    # Materialized timeline (app.timeline), filled the way `python -m app.timeline` would
+    op.create_table(
+        "timeline",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("rec_id", sa.Integer(), sa.ForeignKey("recs.id"), nullable=False),
+        sa.Column("author_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "created_at", "rec_id"),
+    )
+    op.create_index("ix_timeline_user_author", "timeline", ["user_id", "author_id"])
+    op.create_index("ix_timeline_rec", "timeline", ["rec_id"])
+    op.execute(f"""
+        INSERT INTO timeline (user_id, created_at, rec_id, author_id)
+        SELECT reader_id, created_at, id, user_id FROM (
+            SELECT edges.reader_id, recs.created_at, recs.id, recs.user_id,
+                   row_number() OVER (
+                       PARTITION BY edges.reader_id, recs.user_id ORDER BY recs.created_at DESC, recs.id DESC
+                   ) AS position
+            FROM (
+                SELECT id AS reader_id, id AS author_id FROM users
+                UNION
+                SELECT follower_id, following_id FROM follows
+            ) AS edges
+            JOIN recs ON recs.user_id = edges.author_id
+        ) AS ranked
+        WHERE position <= {TIMELINE_BACKFILL_LIMIT}
+    """)
+
+    # Coalesced notifications and the transactional outbox (app.outbox)
+    op.add_column("notifications", sa.Column("actor_count", sa.Integer(), nullable=False, server_default="1"))
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=50), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    # Search (app.search); elsewhere search falls back to an in-process index
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_users_username_trgm ON users USING gin (username gin_trgm_ops)")
+        op.execute(
+            "CREATE INDEX ix_recs_search ON recs USING gin "
+            "(to_tsvector('english', title || ' ' || coalesce(description, '') || ' ' || category))"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX ix_recs_search")
+        op.execute("DROP INDEX ix_users_username_trgm")
+    op.drop_table("outbox")
+    with op.batch_alter_table("notifications") as batch:
+        batch.drop_column("actor_count")
+    op.drop_table("timeline")
+    op.drop_index("ix_notifications_user_created_id", "notifications")
+    op.drop_index("ix_comments_rec_created_id", "comments")
+    op.drop_index("ix_recs_user_created_id", "recs")
+    with op.batch_alter_table("follows") as batch:
+        batch.drop_constraint("uq_follows_follower_following", type_="unique")
+    with op.batch_alter_table("likes") as batch:
+        batch.drop_constraint("uq_likes_user_rec", type_="unique")
+    for table, column in [("recs", "comments_count"), ("recs", "likes_count"), ("users", "following_count"),
+                          ("users", "followers_count"), ("users", "recs_count")]:
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column(column)
@@ -0,0 +1,49 @@
+"""Indexes for the foreign keys on hot query paths
+
+Each index matches a query shape in the routers (see tests/test_query_plans.py):
+
+- likes (rec_id): per-rec like counts and deletes; (user_id, rec_id) is
+  already covered by uq_likes_user_rec
+- follows (follower_id, created_at, id) / (following_id, created_at, id):
+  keyset pages of /users/{username}/following and /followers
+- notifications (rec_id): clean-up when a rec is deleted
+
+On Postgres they are built CONCURRENTLY so the tables stay writable.
+
+Revision ID: 0003_hot_indexes
+Revises: 0002_feed_schema
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_hot_indexes"
+down_revision: Union[str, Sequence[str], None] = "0002_feed_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_likes_rec_id", "likes", ["rec_id"]),
+    ("ix_follows_follower_created_id", "follows", ["follower_id", sa.text("created_at DESC"), "id"]),
+    ("ix_follows_following_created_id", "follows", ["following_id", sa.text("created_at DESC"), "id"]),
+    ("ix_notifications_rec_id", "notifications", ["rec_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
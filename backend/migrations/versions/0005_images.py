@@ -0,0 +1,46 @@
+"""Uploaded images and their resized variants
+
+Revision ID: 0005_images
+Revises: 0004_link_previews
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_images"
+down_revision: Union[str, Sequence[str], None] = "0004_link_previews"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "images",
+        sa.Column("id", sa.String(length=64), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("width", sa.Integer(), nullable=False),
+        sa.Column("height", sa.Integer(), nullable=False),
+        sa.Column("variants", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # Constant server defaults, so existing rows are not rewritten on Postgres
+    op.add_column("recs", sa.Column("image_variants", sa.JSON(), server_default="[]", nullable=False))
+    op.add_column("users", sa.Column("avatar_variants", sa.JSON(), server_default="[]", nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("avatar_variants")
+    with op.batch_alter_table("recs") as batch_op:
+        batch_op.drop_column("image_variants")
+    op.drop_table("images")
@@ -0,0 +1,54 @@
+"""Trending score table and created_at indexes for its refresh
+
+The table starts empty; the first app.trending refresh fills it.
+
+Revision ID: 0007_rec_scores
+Revises: 0006_row_versions
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_rec_scores"
+down_revision: Union[str, Sequence[str], None] = "0006_row_versions"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_recs_created_at", "recs", ["created_at"]),
+    ("ix_likes_created_at", "likes", ["created_at"]),
+    ("ix_comments_created_at", "comments", ["created_at"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rec_scores",
+        sa.Column("rec_id", sa.Integer(), nullable=False),
+        sa.Column("category", sa.String(length=50), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.Column("epoch", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["rec_id"], ["recs.id"]),
+        sa.PrimaryKeyConstraint("rec_id"),
+    )
+    op.create_index("ix_rec_scores_score", "rec_scores", [sa.text("score DESC"), sa.text("rec_id DESC")])
+    op.create_index("ix_rec_scores_category_score", "rec_scores", ["category", sa.text("score DESC"), sa.text("rec_id DESC")])
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
+    op.drop_index("ix_rec_scores_category_score", table_name="rec_scores")
+    op.drop_index("ix_rec_scores_score", table_name="rec_scores")
+    op.drop_table("rec_scores")
@@ -0,0 +1,50 @@
+"""Item-to-item similar recs and the runs that computed them
+
+Revision ID: 0008_rec_similar
+Revises: 0007_rec_scores
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_rec_similar"
+down_revision: Union[str, Sequence[str], None] = "0007_rec_scores"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rec_similar",
+        sa.Column("rec_id", sa.Integer(), nullable=False),
+        sa.Column("similar_id", sa.Integer(), nullable=False),
+        sa.Column("score", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["rec_id"], ["recs.id"]),
+        sa.ForeignKeyConstraint(["similar_id"], ["recs.id"]),
+        sa.PrimaryKeyConstraint("rec_id", "similar_id"),
+    )
+    op.create_index("ix_rec_similar_rec_score", "rec_similar", ["rec_id", sa.text("score DESC"), "similar_id"])
+    op.create_index("ix_rec_similar_similar_id", "rec_similar", ["similar_id"])
+    op.create_table(
+        "similarity_runs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("full", sa.Boolean(), nullable=False),
+        sa.Column("recs", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("similarity_runs")
+    op.drop_index("ix_rec_similar_similar_id", table_name="rec_similar")
+    op.drop_index("ix_rec_similar_rec_score", table_name="rec_similar")
+    op.drop_table("rec_similar")
@@ -0,0 +1,119 @@
+"""Cascading foreign keys, soft-delete columns and the indexes the purger needs
+
+Every foreign key onto users and recs gains ON DELETE CASCADE (images keep the
+file and lose the uploader). On Postgres the constraints are re-added NOT VALID,
+which is a brief lock, and validated after commit without blocking writes. SQLite
+rebuilds each table in batch mode.
+
+Revision ID: 0009_cascading_deletes
+Revises: 0008_rec_similar
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_cascading_deletes"
+down_revision: Union[str, Sequence[str], None] = "0008_rec_similar"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referenced table, ON DELETE)
+FOREIGN_KEYS = [
+    ("recs", "user_id", "users", "CASCADE"),
+    ("follows", "follower_id", "users", "CASCADE"),
+    ("follows", "following_id", "users", "CASCADE"),
+    ("likes", "user_id", "users", "CASCADE"),
+    ("likes", "rec_id", "recs", "CASCADE"),
+    ("comments", "user_id", "users", "CASCADE"),
+    ("comments", "rec_id", "recs", "CASCADE"),
+    ("notifications", "user_id", "users", "CASCADE"),
+    ("notifications", "from_user_id", "users", "CASCADE"),
+    ("notifications", "rec_id", "recs", "CASCADE"),
+    ("timeline", "user_id", "users", "CASCADE"),
+    ("timeline", "rec_id", "recs", "CASCADE"),
+    ("timeline", "author_id", "users", "CASCADE"),
+    ("rec_scores", "rec_id", "recs", "CASCADE"),
+    ("rec_similar", "rec_id", "recs", "CASCADE"),
+    ("rec_similar", "similar_id", "recs", "CASCADE"),
+    ("images", "user_id", "users", "SET NULL"),
+]
+
+# Postgres' names for the unnamed constraints of earlier revisions
+NAMING_CONVENTION = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+DELETED = sa.text("deleted_at IS NOT NULL")
+
+INDEXES = [
+    ("ix_users_deleted_at", "users", ["deleted_at"], {"postgresql_where": DELETED, "sqlite_where": DELETED}),
+    ("ix_recs_deleted_at", "recs", ["deleted_at"], {"postgresql_where": DELETED, "sqlite_where": DELETED}),
+    # Deleting a user or rec has to find these rows, both for the cascade and the purger
+    ("ix_comments_user_id", "comments", ["user_id"], {}),
+    ("ix_notifications_from_user_id", "notifications", ["from_user_id"], {}),
+    ("ix_timeline_author", "timeline", ["author_id"], {}),
+    ("ix_images_user_id", "images", ["user_id"], {}),
+]
+
+
+def _replace_foreign_keys(cascade: bool) -> None:
+    tables = {}
+    for table, column, referent, ondelete in FOREIGN_KEYS:
+        tables.setdefault(table, []).append((column, referent, ondelete if cascade else None))
+
+    if op.get_context().dialect.name != "postgresql":
+        bind = op.get_bind()
+        for table, columns in tables.items():
+            # The rebuilt table gets its indexes back from reflection, which drops
+            # DESC; the original DDL is replayed over them
+            indexes = bind.execute(
+                sa.text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"),
+                {"table": table},
+            ).all()
+            with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+                if table == "images":
+                    batch_op.alter_column("user_id", existing_type=sa.Integer(), nullable=cascade)
+                for column, referent, ondelete in columns:
+                    name = f"{table}_{column}_fkey"
+                    batch_op.drop_constraint(name, type_="foreignkey")
+                    batch_op.create_foreign_key(name, referent, [column], ["id"], ondelete=ondelete)
+            for name, sql in indexes:
+                op.execute(f"DROP INDEX IF EXISTS {name}")
+                op.execute(sql)
+        return
+
+    op.alter_column("images", "user_id", existing_type=sa.Integer(), nullable=cascade)
+    for table, columns in tables.items():
+        for column, referent, ondelete in columns:
+            name = f"{table}_{column}_fkey"
+            op.drop_constraint(name, table, type_="foreignkey")
+            op.create_foreign_key(name, table, referent, [column], ["id"], ondelete=ondelete, postgresql_not_valid=True)
+    with op.get_context().autocommit_block():
+        for table, columns in tables.items():
+            for column, _, _ in columns:
+                op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{column}_fkey")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("users", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("recs", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True))
+    _replace_foreign_keys(cascade=True)
+    with op.get_context().autocommit_block():
+        for name, table, columns, kw in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in INDEXES:
+            op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
+    _replace_foreign_keys(cascade=False)
+    with op.batch_alter_table("recs") as batch_op:
+        batch_op.drop_column("deleted_at")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("deleted_at")
@@ -0,0 +1,45 @@
+"""Notification read watermarks and the indexes for unread counts and retention
+
+Revision ID: 0010_notification_retention
+Revises: 0009_cascading_deletes
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010_notification_retention"
+down_revision: Union[str, Sequence[str], None] = "0009_cascading_deletes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_notifications_user_unread", "notifications", ["user_id", "is_read", "created_at"]),
+    ("ix_notifications_created_at", "notifications", ["created_at"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "notification_watermarks",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("read_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table, postgresql_concurrently=True, if_exists=True)
+    op.drop_table("notification_watermarks")
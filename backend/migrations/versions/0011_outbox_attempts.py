@@ -0,0 +1,45 @@
+"""Outbox attempt counts and parking, and the actors merged into a notification
+
+Revision ID: 0011_outbox_attempts
+Revises: 0010_notification_retention
+Create Date: 2026-10-18 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0011_outbox_attempts"
+down_revision: Union[str, Sequence[str], None] = "0010_notification_retention"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PENDING = sa.text("parked_at IS NULL")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("outbox", sa.Column("attempts", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("outbox", sa.Column("last_error", sa.Text(), nullable=True))
+    op.add_column("outbox", sa.Column("parked_at", sa.DateTime(), nullable=True))
+    op.add_column("notifications", sa.Column("actor_ids", sa.JSON(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_outbox_pending", "outbox", ["id"],
+            postgresql_where=PENDING, sqlite_where=PENDING, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_outbox_pending", "outbox", postgresql_concurrently=True, if_exists=True)
+    with op.batch_alter_table("notifications") as batch_op:
+        batch_op.drop_column("actor_ids")
+    with op.batch_alter_table("outbox") as batch_op:
+        batch_op.drop_column("parked_at")
+        batch_op.drop_column("last_error")
+        batch_op.drop_column("attempts")
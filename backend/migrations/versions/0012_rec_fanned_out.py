@@ -0,0 +1,51 @@
+"""Whether each rec was fanned out, and the index feeds pull the others from
+
+Recs by authors over the fan-out limit at the time of the migration were never
+fanned out, so they start out pulled. The limit is read from the same setting as
+app.timeline.
+
+Revision ID: 0012_rec_fanned_out
+Revises: 0011_outbox_attempts
+Create Date: 2026-10-18 00:00:00
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0012_rec_fanned_out"
+down_revision: Union[str, Sequence[str], None] = "0011_outbox_attempts"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FANOUT_FOLLOWER_LIMIT = int(os.getenv("TIMELINE_FANOUT_FOLLOWER_LIMIT", "5000"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("recs", sa.Column("fanned_out", sa.Boolean(), server_default=sa.true(), nullable=False))
+    recs = sa.table("recs", sa.column("user_id", sa.Integer()), sa.column("fanned_out", sa.Boolean()))
+    users = sa.table("users", sa.column("id", sa.Integer()), sa.column("followers_count", sa.Integer()))
+    op.execute(
+        recs.update().where(
+            recs.c.user_id.in_(sa.select(users.c.id).where(users.c.followers_count > FANOUT_FOLLOWER_LIMIT))
+        ).values(fanned_out=False)
+    )
+    pulled = recs.c.fanned_out == sa.false()
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_recs_pulled", "recs", ["user_id", sa.text("created_at DESC"), "id"],
+            postgresql_where=pulled, sqlite_where=pulled, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_recs_pulled", "recs", postgresql_concurrently=True, if_exists=True)
+    with op.batch_alter_table("recs") as batch_op:
+        batch_op.drop_column("fanned_out")
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+# Settings are read when the app modules are imported, so the scratch database and
+# the switches go in first. The background workers stay off: tests drain the outbox
+# and run the purger themselves when they need them.
+_scratch = Path(tempfile.mkdtemp(prefix="recs-tests-"))
+os.environ.update({
+    # TEST_DATABASE_URL points the suite at a scratch Postgres database instead
+    "DATABASE_URL": os.getenv("TEST_DATABASE_URL", f"sqlite:///{_scratch / 'recs.db'}"),
+    "DB_MODE": "sync",
+    "SECRET_KEY": "tests",
+    "BCRYPT_ROUNDS": "4",
+    "MEDIA_ROOT": str(_scratch / "media"),
+    "OUTBOX_WORKER": "false",
+    "PURGE_WORKER": "false",
+    "TRENDING_WORKER": "false",
+    "SIMILAR_WORKER": "false",
+    "SUGGESTIONS_PRELOAD": "false",
+})
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.cache import MemoryBackend, set_backend
+from app.database import engine, SessionLocal
+
+@pytest.fixture(scope="session")
+def client():
+    command.upgrade(Config(str(Path(__file__).resolve().parent.parent / "alembic.ini")), "head")
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def signup(client):
+    # Creates an account with a fresh name and returns (auth headers, username)
+    def signup(prefix: str = "user"):
+        username = f"{prefix}_{uuid.uuid4().hex[:8]}"
+        email = f"{username}@example.com"
+        response = client.post("/auth/signup", json={"username": username, "email": email, "password": "tests"})
+        assert response.status_code == 200, response.text
+        token = client.post("/auth/login", data={"username": email, "password": "tests"}).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}, username
+    return signup
+
+@pytest.fixture
+def cold_cache():
+    # cold_cache() empties the in-process cache, so the next request reads what it
+    # hydrates from the database
+    def reset():
+        set_backend(MemoryBackend())
+    yield reset
+    reset()
+
+@pytest.fixture
+def statements():
+    # with statements() as issued: ... collects (statement, parameters, executemany)
+    # for everything sent to the database
+    @contextmanager
+    def record():
+        issued = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            issued.append((statement, parameters, executemany))
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield issued
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return record
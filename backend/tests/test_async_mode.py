@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# DB_MODE is read when the app is imported, so async mode runs in a child process
+# with its own scratch database, through aiosqlite and the greenlet bridge of
+# AsyncSession.run_sync.
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+def _smoke():
+    from alembic import command
+    from alembic.config import Config
+    from fastapi.testclient import TestClient
+    command.upgrade(Config(str(BACKEND / "alembic.ini")), "head")
+    from app import database
+    from app.main import app
+    assert database.async_engine.dialect.driver == "aiosqlite"
+
+    with TestClient(app) as client:
+        for name in ("author", "fan"):
+            assert client.post("/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": "tests"}).status_code == 200
+        author, fan = (
+            {"Authorization": "Bearer " + client.post("/auth/login", data={"username": f"{name}@example.com", "password": "tests"}).json()["access_token"]}
+            for name in ("author", "fan")
+        )
+        assert client.post("/users/author/follow", headers=fan).status_code == 200
+        rec = client.post("/recs/", json={"category": "music", "title": "async"}, headers=author)
+        assert rec.status_code == 200, rec.text
+        rec_id = rec.json()["id"]
+        assert client.post(f"/recs/{rec_id}/like", headers=fan).status_code == 200
+        assert [item["title"] for item in client.get("/recs/feed", headers=fan).json()["items"]] == ["async"]
+        assert client.get(f"/recs/{rec_id}", headers=fan).json()["likes_count"] == 1
+
+def test_requests_run_through_the_async_driver(tmp_path):
+    env = {**os.environ, "DB_MODE": "async", "DATABASE_URL": f"sqlite:///{tmp_path / 'async.db'}", "MEDIA_ROOT": str(tmp_path / "media")}
+    result = subprocess.run(
+        [sys.executable, "-c", "from tests.test_async_mode import _smoke; _smoke()"],
+        cwd=BACKEND, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr[-3000:]
@@ -0,0 +1,60 @@
+import json
+import pytest
+from app.cache import MemoryBackend, cache, rec_key, set_backend
+
+class _SharedStore:
+    # Stands in for a shared cache server: values go through JSON like they would
+    # over the wire, and every call is recorded
+    evictions = 0
+
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def get(self, key: str):
+        self.calls.append(("get", key))
+        return self.data.get(key)
+
+    def set(self, key: str, value, ttl: int):
+        self.calls.append(("set", key))
+        self.data[key] = json.loads(json.dumps(value))
+
+    def delete(self, *keys: str):
+        self.calls.append(("delete", *keys))
+        for key in keys:
+            self.data.pop(key, None)
+
+    def size(self) -> int:
+        return len(self.data)
+
+@pytest.fixture
+def store():
+    store = _SharedStore()
+    set_backend(store)
+    yield store
+    set_backend(MemoryBackend())
+
+def test_rec_cards_are_read_through_and_invalidated_on_write(client, signup, statements, store):
+    (author, _), (fan, _) = signup("author"), signup("fan")
+    rec_id = client.post("/recs/", json={"category": "music", "title": "cached"}, headers=author).json()["id"]
+    key = rec_key(rec_id)
+
+    # Miss: loaded from the database and stored
+    with statements() as issued:
+        assert client.get(f"/recs/{rec_id}", headers=fan).json()["likes_count"] == 0
+    assert any("FROM recs" in statement for statement, _, _ in issued)
+    assert ("set", key) in store.calls
+    misses = cache.stats()["misses"]
+
+    # Hit: served from the store without reading the rec
+    with statements() as issued:
+        assert client.get(f"/recs/{rec_id}", headers=fan).json()["title"] == "cached"
+    assert not any("FROM recs" in statement for statement, _, _ in issued)
+    assert cache.stats()["misses"] == misses and cache.stats()["hits"] >= 2
+
+    # A like drops the card, and the next read loads the new count
+    store.calls.clear()
+    assert client.post(f"/recs/{rec_id}/like", headers=fan).status_code == 200
+    assert ("delete", key) in store.calls and key not in store.data
+    assert client.get(f"/recs/{rec_id}", headers=fan).json()["likes_count"] == 1
+    assert store.data[key]["likes_count"] == 1
@@ -0,0 +1,52 @@
+def _contents(comments):
+    return [comment["content"] for comment in comments]
+
+def _thread(client, headers, rec_id, limit):
+    # Every page of the thread, following next_cursor
+    pages, cursor = [], None
+    while True:
+        page = client.get(f"/recs/{rec_id}/comments", params={"limit": limit, **({"cursor": cursor} if cursor else {})}, headers=headers).json()
+        pages.append(_contents(page["items"]))
+        if not (cursor := page["next_cursor"]):
+            return pages
+
+def test_previews_threads_and_batches(client, signup):
+    (author, author_name), (viewer, _), (other, _) = signup("author"), signup("viewer"), signup("other")
+    client.post(f"/users/{author_name}/follow", headers=viewer)
+    busy, quiet, silent = (
+        client.post("/recs/", json={"category": "music", "title": title}, headers=author).json()["id"]
+        for title in ("busy", "quiet", "silent")
+    )
+    for i in range(1, 6):
+        client.post(f"/recs/{busy}/comments", json={"content": f"c{i}"}, headers=viewer)
+    client.post(f"/recs/{quiet}/comments", json={"content": "q1"}, headers=other)
+
+    # The latest few per rec, oldest first, in the feed page itself
+    feed = {rec["id"]: _contents(rec["latest_comments"]) for rec in client.get("/recs/feed", params={"comments": 3}, headers=viewer).json()["items"]}
+    assert feed == {busy: ["c3", "c4", "c5"], quiet: ["q1"], silent: []}
+    assert all(not rec["latest_comments"] for rec in client.get("/recs/feed", headers=viewer).json()["items"])
+
+    batch = client.get("/recs/comments", params={"rec_ids": [busy, silent], "limit": 2}, headers=viewer).json()
+    assert {int(rec_id): _contents(comments) for rec_id, comments in batch.items()} == {busy: ["c4", "c5"], silent: []}
+
+    assert _thread(client, viewer, busy, 2) == [["c1", "c2"], ["c3", "c4"], ["c5"]]
+
+    # Comments by deleted accounts leave the previews and the thread at once
+    assert client.delete("/users/me", headers=other).status_code == 200
+    page = client.get(f"/recs/user/{author_name}", params={"comments": 3}, headers=viewer).json()["items"]
+    assert {rec["id"]: _contents(rec["latest_comments"]) for rec in page}[quiet] == []
+    assert _thread(client, viewer, quiet, 10) == [[]]
+
+def test_threads_revalidate_until_a_new_comment(client, signup):
+    author, _ = signup("author")
+    rec_id = client.post("/recs/", json={"category": "music", "title": "thread"}, headers=author).json()["id"]
+    client.post(f"/recs/{rec_id}/comments", json={"content": "first"}, headers=author)
+
+    response = client.get(f"/recs/{rec_id}/comments", headers=author)
+    etag = response.headers["etag"]
+    assert client.get(f"/recs/{rec_id}/comments", headers={**author, "If-None-Match": etag}).status_code == 304
+
+    client.post(f"/recs/{rec_id}/comments", json={"content": "second"}, headers=author)
+    response = client.get(f"/recs/{rec_id}/comments", headers={**author, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert _contents(response.json()["items"]) == ["first", "second"]
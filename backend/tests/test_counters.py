@@ -0,0 +1,50 @@
+from app import counters, purge
+
+def _profile(client, headers, username):
+    profile = client.get(f"/users/{username}", headers=headers).json()
+    return profile["recs_count"], profile["tuned_in"], profile["tuned_to"]
+
+def _rec(client, headers, rec_id):
+    rec = client.get(f"/recs/{rec_id}", headers=headers).json()
+    return rec["likes_count"], rec["comments_count"]
+
+def test_counters_follow_every_write(client, db, signup):
+    (author, author_name), (fan, fan_name), (other, other_name) = signup("author"), signup("fan"), signup("other")
+    first, second = (
+        client.post("/recs/", json={"category": "music", "title": title}, headers=author).json()["id"]
+        for title in ("first", "second")
+    )
+    client.post(f"/users/{author_name}/follow", headers=fan)
+    client.post(f"/users/{author_name}/follow", headers=other)
+    client.post(f"/users/{author_name}/follow", headers=other)
+    assert _profile(client, fan, author_name) == (2, 2, 0)
+    assert _profile(client, fan, fan_name) == (0, 0, 1)
+
+    # Likes count once per user, single or in bulk
+    client.post(f"/recs/{first}/like", headers=fan)
+    client.post(f"/recs/{first}/like", headers=fan)
+    client.post("/recs/likes", json={"rec_ids": [first, second]}, headers=other)
+    client.post(f"/recs/{first}/comments", json={"content": "one"}, headers=fan)
+    client.post(f"/recs/{first}/comments", json={"content": "two"}, headers=other)
+    assert _rec(client, fan, first) == (2, 2)
+    assert _rec(client, fan, second) == (1, 0)
+
+    client.delete(f"/recs/{first}/like", headers=fan)
+    client.delete(f"/recs/{first}/like", headers=fan)
+    client.request("DELETE", "/recs/likes", json={"rec_ids": [second]}, headers=other)
+    client.delete(f"/users/{author_name}/follow", headers=fan)
+    assert _rec(client, other, first) == (1, 2)
+    assert _rec(client, other, second) == (0, 0)
+    assert _profile(client, other, author_name) == (2, 1, 0)
+    assert _profile(client, other, fan_name) == (0, 0, 0)
+
+    # Deleting a rec takes it off the author's count at once
+    assert client.delete(f"/recs/{second}", headers=author).status_code == 200
+    assert _profile(client, other, author_name) == (1, 1, 0)
+
+    # A deleted account's likes, comments and follows come off once it is purged
+    assert client.delete("/users/me", headers=other).status_code == 200
+    purge.run(db)
+    assert _rec(client, fan, first) == (0, 1)
+    assert _profile(client, fan, author_name) == (1, 0, 0)
+    assert not any(counters.reconcile(db).values())
@@ -0,0 +1,47 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+from app import images
+
+def _png(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(out, "PNG")
+    return out.getvalue()
+
+@pytest.fixture
+def in_process(monkeypatch):
+    # Resizes in a thread of this process, so settings patched here apply to it
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(images, "pool", lambda: executor)
+    yield
+    executor.shutdown()
+
+def _upload(client, headers, content: bytes, kind: str = "rec"):
+    return client.post("/images", params={"kind": kind}, files={"file": ("upload.png", content, "image/png")}, headers=headers)
+
+def test_upload_is_resized_and_stored_once(client, signup, in_process):
+    headers, _ = signup()
+    content = _png(700, 350)
+    response = _upload(client, headers, content)
+    assert response.status_code == 200, response.text
+    image = response.json()
+    assert (image["width"], image["height"]) == (700, 350)
+    assert [variant["width"] for variant in image["variants"]] == [320, 640, 700]
+    assert _upload(client, headers, content).json()["id"] == image["id"]
+
+def test_images_over_the_pixel_limit_are_refused_undecoded(client, signup, in_process, monkeypatch):
+    # 1.5 times the limit: Pillow itself would only warn and decode it
+    monkeypatch.setattr(images, "MAX_IMAGE_PIXELS", 10_000)
+    headers, _ = signup()
+    assert _upload(client, headers, _png(150, 100)).status_code == 413
+    assert _upload(client, headers, _png(100, 100)).status_code == 200
+
+def test_bodies_over_the_upload_limit_are_refused(client, signup):
+    headers, _ = signup()
+    response = _upload(client, headers, b"\0" * (images.MAX_UPLOAD_BYTES + images.MULTIPART_OVERHEAD_BYTES))
+    assert response.status_code == 413
+
+def test_other_files_are_refused(client, signup, in_process):
+    headers, _ = signup()
+    assert _upload(client, headers, b"not an image").status_code == 400
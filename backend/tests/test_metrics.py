@@ -0,0 +1,17 @@
+import pytest
+from app import instrumentation
+
+INTERNAL = ["/metrics", "/cache/stats", "/db/stats"]
+
+@pytest.mark.parametrize("path", INTERNAL)
+def test_internal_endpoints_are_off_by_default(client, path):
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={"Authorization": "Bearer anything"}).status_code == 404
+
+@pytest.mark.parametrize("path", INTERNAL)
+def test_internal_endpoints_take_the_metrics_token(client, monkeypatch, path):
+    monkeypatch.setattr(instrumentation, "METRICS_TOKEN", "scrape-secret")
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get(path, headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200, response.text
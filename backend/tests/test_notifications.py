@@ -0,0 +1,162 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from urllib.parse import urlencode
+import pytest
+from app import outbox
+from app.notify import broker
+from app.routers import notifications
+
+class _Stream(threading.Thread):
+    # GET /notifications/stream on its own event loop, read the way EventSource
+    # does; the test client would buffer the endless response instead
+    def __init__(self, app, headers, last_event_id: str | None = None):
+        super().__init__(daemon=True)
+        self.app = app
+        self.token = headers["Authorization"].removeprefix("Bearer ")
+        self.last_event_id = last_event_id
+        self.events = queue.Queue()
+        self.closed = threading.Event()
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        headers = [(b"host", b"testserver")]
+        if self.last_event_id is not None:
+            headers.append((b"last-event-id", self.last_event_id.encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/notifications/stream", "raw_path": b"/notifications/stream", "root_path": "",
+            "query_string": urlencode({"token": self.token}).encode(), "headers": headers,
+            "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+        }
+        buffer = ""
+
+        async def receive():
+            await asyncio.get_running_loop().run_in_executor(None, self.closed.wait)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal buffer
+            if message["type"] != "http.response.body":
+                return
+            buffer += message.get("body", b"").decode()
+            *blocks, buffer = buffer.split("\n\n")
+            for block in blocks:
+                fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+                if "data" in fields:
+                    self.events.put((fields["id"], json.loads(fields["data"])))
+
+        await self.app(scope, receive, send)
+
+    def next(self):
+        return self.events.get(timeout=5)
+
+    def close(self):
+        self.closed.set()
+        self.join(5)
+
+@pytest.fixture
+def stream(client, monkeypatch):
+    # Short heartbeats so the stream notices the disconnect and catches up quickly
+    monkeypatch.setattr(notifications, "STREAM_HEARTBEAT_SECONDS", 0.1)
+    opened = []
+
+    def open_stream(headers, last_event_id: str | None = None):
+        # Returns once the stream is subscribed, so nothing published after is missed
+        user_id = client.get("/users/me", headers=headers).json()["id"]
+        subscribed = len(broker.subscribers.get(user_id, ()))
+        opened.append(_Stream(client.app, headers, last_event_id))
+        opened[-1].start()
+        deadline = time.monotonic() + 5
+        while len(broker.subscribers.get(user_id, ())) == subscribed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return opened[-1]
+
+    yield open_stream
+    for opened_stream in opened:
+        opened_stream.close()
+
+@pytest.fixture
+def drain(db):
+    return lambda: outbox.drain(db)
+
+def test_coalesced_likes_reach_an_open_stream(client, signup, stream, drain):
+    (author, _), (first, _), (second, _), (third, _) = (signup() for _ in range(4))
+    rec_id = client.post("/recs/", json={"category": "music", "title": "liked"}, headers=author).json()["id"]
+    client.post(f"/recs/{rec_id}/like", headers=first)
+    drain()
+    notification_id = client.get("/notifications/", headers=author).json()["items"][0]["id"]
+
+    # Pushed in-process: the merge keeps the id and raises the count
+    live = stream(author)
+    client.post(f"/recs/{rec_id}/like", headers=second)
+    drain()
+    event_id, payload = live.next()
+    assert (payload["id"], payload["type"], payload["others_count"]) == (notification_id, "like", 1)
+    live.close()
+
+    # Caught up from the database by a client reconnecting with Last-Event-ID
+    client.post(f"/recs/{rec_id}/like", headers=third)
+    drain()
+    _, payload = stream(author, last_event_id=event_id).next()
+    assert (payload["id"], payload["others_count"]) == (notification_id, 2)
+
+def _listing(client, headers, **params):
+    page = client.get("/notifications/", params=params, headers=headers).json()
+    return [(item["type"], item["from_username"], item["others_count"]) for item in page["items"]], page["next_cursor"]
+
+def _unread(client, headers):
+    return client.get("/notifications/unread-count", headers=headers).json()["count"]
+
+def test_notifications_are_listed_newest_first_and_paged(client, signup, drain):
+    (author, author_name), (follower, follower_name), (liker, liker_name), (commenter, commenter_name) = (signup() for _ in range(4))
+    rec_id = client.post("/recs/", json={"category": "music", "title": "noticed"}, headers=author).json()["id"]
+    client.post(f"/users/{author_name}/follow", headers=follower)
+    drain()
+    client.post(f"/recs/{rec_id}/like", headers=liker)
+    drain()
+    client.post(f"/recs/{rec_id}/comments", json={"content": "hi"}, headers=commenter)
+    # The author's own actions notify nobody
+    client.post(f"/recs/{rec_id}/like", headers=author)
+    drain()
+
+    expected = [("comment", commenter_name, 0), ("like", liker_name, 0), ("follow", follower_name, 0)]
+    assert _listing(client, author) == (expected, None)
+    assert _unread(client, author) == 3
+    first, cursor = _listing(client, author, limit=2)
+    assert first == expected[:2] and cursor
+    assert _listing(client, author, limit=2, cursor=cursor) == (expected[2:], None)
+
+def test_likes_coalesce_without_counting_anyone_twice(client, signup, drain):
+    (author, _), *fans = (signup() for _ in range(4))
+    rec_id = client.post("/recs/", json={"category": "music", "title": "popular"}, headers=author).json()["id"]
+    for fan, _ in fans:
+        client.post(f"/recs/{rec_id}/like", headers=fan)
+    drain()
+    assert _listing(client, author)[0] == [("like", fans[-1][1], 2)]
+
+    # Unliking and liking again is not a new actor
+    client.delete(f"/recs/{rec_id}/like", headers=fans[0][0])
+    client.post(f"/recs/{rec_id}/like", headers=fans[0][0])
+    drain()
+    assert _listing(client, author)[0] == [("like", fans[-1][1], 2)]
+    assert _unread(client, author) == 1
+
+def test_new_notifications_are_pushed_and_replayed(client, signup, stream, drain):
+    (author, author_name), (first, first_name), (second, second_name) = (signup() for _ in range(3))
+    live = stream(author)
+    client.post(f"/users/{author_name}/follow", headers=first)
+    drain()
+    event_id, payload = live.next()
+    assert (payload["type"], payload["from_username"], payload["is_read"]) == ("follow", first_name, False)
+    live.close()
+
+    # Missed while disconnected, replayed from Last-Event-ID
+    client.post(f"/users/{author_name}/follow", headers=second)
+    drain()
+    _, payload = stream(author, last_event_id=event_id).next()
+    assert (payload["type"], payload["from_username"]) == ("follow", second_name)
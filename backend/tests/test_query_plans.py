@@ -0,0 +1,138 @@
+import re
+from app.database import engine, Base
+from app import outbox, purge
+
+# EXPLAIN audit of the queries behind the routers. Seeds a few users, recs and
+# edges through the API, replays every hot route while recording the SQL it
+# issues, then EXPLAINs each statement and fails on any sequential scan of an
+# application table.
+#
+# With TEST_DATABASE_URL set to a scratch Postgres database the planner runs with
+# enable_seqscan=off, which makes it pick any usable index even on tiny tables; a
+# Seq Scan that survives means no index fits the query.
+
+# Search is served from an in-process index outside Postgres, and that index is
+# loaded with a deliberate full scan
+POSTGRES_ONLY = ("/users/search", "/recs/search")
+# The outbox is read from its head in primary-key order, and /recs/trending from the
+# head of ix_rec_scores_score, which SQLite reports as (LIMITed) scans
+SCAN_ALLOWED = {"outbox", "rec_scores"}
+
+def _seed(client, signup):
+    users = {name: signup(f"audit_{name}") for name in "abc"}
+    (a, _), (b, b_name), (c, c_name) = users["a"], users["b"], users["c"]
+    client.post(f"/users/{b_name}/follow", headers=a)
+    client.post(f"/users/{c_name}/follow", headers=a)
+    client.post(f"/users/{users['a'][1]}/follow", headers=b)
+    rec_ids = [
+        client.post("/recs/", json={"category": "music", "title": f"audit {i}", "description": "seed"}, headers=[a, b, c][i % 3]).json()["id"]
+        for i in range(9)
+    ]
+    for rec_id in rec_ids[:4]:
+        client.post(f"/recs/{rec_id}/like", headers=b)
+        client.post(f"/recs/{rec_id}/comments", json={"content": "seed"}, headers=c)
+    return users, rec_ids
+
+def _scenarios(users, rec_ids):
+    (a, a_name), (b, b_name), (c, _) = users["a"], users["b"], users["c"]
+    # rec_ids[0] was posted by a, so a can delete it
+    rec_id, other_id, own_id = rec_ids[1], rec_ids[4], rec_ids[0]
+    return [
+        ("GET", "/users/me", a, None),
+        ("GET", f"/users/{b_name}", a, None),
+        ("GET", f"/users/{b_name}/followers", a, None),
+        ("GET", f"/users/{a_name}/following", a, None),
+        ("GET", "/users/search?q=audit", a, None),
+        ("GET", "/recs/feed?comments=3", a, None),
+        ("GET", f"/recs/user/{b_name}?comments=3", a, None),
+        ("GET", "/recs/search?q=audit", a, None),
+        ("GET", "/recs/trending?comments=3", a, None),
+        ("GET", "/recs/category/music", a, None),
+        ("GET", f"/recs/{rec_id}", a, None),
+        ("GET", f"/recs/{rec_id}/comments", a, None),
+        ("GET", f"/recs/{rec_id}/similar", a, None),
+        ("GET", f"/recs/comments?rec_ids={rec_id}&rec_ids={other_id}", a, None),
+        ("GET", "/notifications/", b, None),
+        ("GET", "/notifications/unread-count", b, None),
+        ("POST", f"/recs/{other_id}/like", a, None),
+        ("DELETE", f"/recs/{other_id}/like", a, None),
+        ("POST", "/recs/likes", c, {"rec_ids": rec_ids[:3]}),
+        ("POST", f"/recs/{other_id}/comments", a, {"content": "audit"}),
+        ("DELETE", f"/users/{b_name}/follow", a, None),
+        ("POST", f"/users/{b_name}/follow", a, None),
+        ("DELETE", f"/recs/{own_id}", a, None),
+        ("POST", "/notifications/read", b, None),
+        ("GET", "/notifications/unread-count", b, None),
+        ("DELETE", "/users/me", c, None),
+    ]
+
+def _explainable(issued):
+    return [
+        (statement, parameters) for statement, parameters, executemany in issued
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE", "WITH")
+    ]
+
+def _record(client, db, statements, users, rec_ids) -> list[tuple[str, str, object]]:
+    postgres = engine.dialect.name == "postgresql"
+    recorded = []
+    for method, path, auth, body in _scenarios(users, rec_ids):
+        if path.startswith(POSTGRES_ONLY) and not postgres:
+            continue
+        with statements() as issued:
+            response = client.request(method, path, headers=auth, json=body)
+        assert response.status_code < 400, f"{method} {path}: {response.status_code} {response.text}"
+        label = f"{method} {path.split('?')[0]}"
+        recorded += [(label, statement, parameters) for statement, parameters in _explainable(issued)]
+
+    with statements() as issued:
+        outbox.drain(db)
+    recorded += [("outbox worker", statement, parameters) for statement, parameters in _explainable(issued)]
+    # Removes a's deleted rec and c's account, then expired notifications
+    with statements() as issued:
+        purge.run(db)
+        purge.prune_notifications(db)
+    recorded += [("purge worker", statement, parameters) for statement, parameters in _explainable(issued)]
+    return recorded
+
+def _seq_scans_postgres(conn, statement, parameters) -> list[str]:
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    found = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan":
+            found.append(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return found
+
+def _seq_scans_sqlite(conn, statement, parameters) -> list[str]:
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    # "SCAN recs" reads the whole table and "SCAN recs USING INDEX ..." the whole index;
+    # only "SEARCH" narrows to a range
+    return [match.group(1) for *_, detail in rows if (match := re.match(r"SCAN (\w+)\b", detail))]
+
+def _explain(recorded) -> list[tuple[str, str, list[str]]]:
+    tables = set(Base.metadata.tables) - SCAN_ALLOWED
+    violations = []
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        seq_scans = _seq_scans_postgres if postgres else _seq_scans_sqlite
+        for label, statement, parameters in recorded:
+            scanned = [table for table in seq_scans(conn, statement, parameters) if table in tables]
+            if scanned:
+                violations.append((label, statement, scanned))
+        conn.rollback()
+    return violations
+
+def test_hot_paths_use_indexes(client, db, signup, statements):
+    users, rec_ids = _seed(client, signup)
+    recorded = _record(client, db, statements, users, rec_ids)
+    assert recorded
+    violations = _explain(recorded)
+    assert not violations, "\n\n".join(
+        f"{label}: seq scan on {', '.join(tables)}\n{statement}" for label, statement, tables in violations
+    )
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from app import outbox, purge
+from app.models import Notification, NotificationWatermark
+
+def _unread(client, headers):
+    return client.get("/notifications/unread-count", headers=headers).json()["count"]
+
+def _listing(client, headers):
+    return [(item["type"], item["others_count"], item["is_read"]) for item in client.get("/notifications/", headers=headers).json()["items"]]
+
+def _user_id(client, headers):
+    return client.get("/users/me", headers=headers).json()["id"]
+
+def _watermarks(db, user_id):
+    return db.query(func.count()).select_from(NotificationWatermark).filter(NotificationWatermark.user_id == user_id).scalar()
+
+def test_the_read_watermark_covers_what_came_before_it(client, db, signup):
+    (author, author_name), (first, _), (second, _), (third, _) = (signup() for _ in range(4))
+    rec_id = client.post("/recs/", json={"category": "music", "title": "read"}, headers=author).json()["id"]
+    client.post(f"/users/{author_name}/follow", headers=first)
+    client.post(f"/recs/{rec_id}/like", headers=first)
+    outbox.drain(db)
+    assert _unread(client, author) == 2
+
+    assert client.post("/notifications/read", headers=author).status_code == 200
+    assert _unread(client, author) == 0
+    assert _listing(client, author) == [("like", 0, True), ("follow", 0, True)]
+
+    # A like after it is a new unread notification rather than merged into the read one
+    client.post(f"/recs/{rec_id}/like", headers=second)
+    outbox.drain(db)
+    assert _unread(client, author) == 1
+    assert _listing(client, author)[0] == ("like", 0, False)
+    # ... and the next one merges into that
+    client.post(f"/recs/{rec_id}/like", headers=third)
+    outbox.drain(db)
+    assert _unread(client, author) == 1
+    assert _listing(client, author)[0] == ("like", 1, False)
+
+    # The watermark goes with the account
+    user_id = _user_id(client, author)
+    assert _watermarks(db, user_id) == 1
+    assert client.delete("/users/me", headers=author).status_code == 200
+    purge.run(db)
+    assert _watermarks(db, user_id) == 0
+
+def test_notifications_past_retention_are_pruned(client, db, signup, monkeypatch):
+    (author, author_name), (follower, _) = signup(), signup()
+    rec_id = client.post("/recs/", json={"category": "music", "title": "old"}, headers=author).json()["id"]
+    client.post(f"/users/{author_name}/follow", headers=follower)
+    outbox.drain(db)
+    client.post(f"/recs/{rec_id}/like", headers=follower)
+    outbox.drain(db)
+    user_id = _user_id(client, author)
+    expired = datetime.utcnow() - timedelta(days=purge.NOTIFICATION_RETENTION_DAYS + 1)
+    db.execute(update(Notification).where(Notification.user_id == user_id, Notification.type == "follow").values(created_at=expired))
+    db.commit()
+
+    # 0 keeps notifications forever
+    monkeypatch.setattr(purge, "NOTIFICATION_RETENTION_DAYS", 0)
+    assert purge.prune_notifications(db) == 0
+    monkeypatch.undo()
+
+    # Pruned in batches smaller than what is there
+    monkeypatch.setattr(purge, "PURGE_BATCH_SIZE", 1)
+    assert purge.prune_notifications(db) == 1
+    assert [item["type"] for item in client.get("/notifications/", headers=author).json()["items"]] == ["like"]
+    assert _unread(client, author) == 1
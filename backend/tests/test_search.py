@@ -0,0 +1,61 @@
+import uuid
+import pytest
+from app import purge
+from app.database import engine
+
+# Off Postgres, search is served from the in-process index in app.search; these
+# check that it follows the writes that go through the API and the purger.
+
+pytestmark = pytest.mark.skipif(engine.dialect.name == "postgresql", reason="Postgres searches its own indexes")
+
+def _usernames(client, headers, q):
+    response = client.get("/users/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [user["username"] for user in response.json()["items"]]
+
+def _titles(client, headers, q):
+    response = client.get("/recs/search", params={"q": q}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [rec["title"] for rec in response.json()["items"]]
+
+def test_users_are_found_by_substring_until_deleted(client, signup):
+    tag = uuid.uuid4().hex[:8]
+    viewer, _ = signup("viewer")
+    found, found_name = signup(f"found{tag}")
+    _, other_name = signup(f"other{tag}")
+
+    assert _usernames(client, viewer, f"found{tag}") == [found_name]
+    assert sorted(_usernames(client, viewer, tag)) == sorted([found_name, other_name])
+
+    assert client.delete("/users/me", headers=found).status_code == 200
+    assert _usernames(client, viewer, tag) == [other_name]
+
+def test_recs_match_every_term_until_deleted(client, db, signup):
+    tag = uuid.uuid4().hex[:8]
+    author, _ = signup("author")
+    both = client.post("/recs/", json={"category": "music", "title": f"{tag} jazz {tag}"}, headers=author).json()["id"]
+    client.post("/recs/", json={"category": "film", "title": f"{tag} noir"}, headers=author)
+    imported = client.post("/recs/import", json={"recs": [{"category": "books", "title": f"{tag} essays", "description": "jazz"}]}, headers=author)
+    assert imported.status_code == 200, imported.text
+
+    # All terms must match; the rec where they make up more of the text ranks first
+    assert _titles(client, author, f"{tag} jazz") == [f"{tag} jazz {tag}", f"{tag} essays"]
+    assert _titles(client, author, f"{tag} noir") == [f"{tag} noir"]
+    assert sorted(_titles(client, author, tag)) == sorted([f"{tag} jazz {tag}", f"{tag} noir", f"{tag} essays"])
+
+    assert client.delete(f"/recs/{both}", headers=author).status_code == 200
+    assert _titles(client, author, f"{tag} jazz") == [f"{tag} essays"]
+    purge.run(db)
+    assert _titles(client, author, f"{tag} jazz") == [f"{tag} essays"]
+
+def test_deleted_accounts_take_their_recs_out_of_search(client, db, signup):
+    tag = uuid.uuid4().hex[:8]
+    viewer, _ = signup("viewer")
+    author, _ = signup("author")
+    client.post("/recs/", json={"category": "music", "title": f"{tag} gone"}, headers=author)
+    assert _titles(client, viewer, tag) == [f"{tag} gone"]
+
+    assert client.delete("/users/me", headers=author).status_code == 200
+    assert _titles(client, viewer, tag) == []
+    purge.run(db)
+    assert _titles(client, viewer, tag) == []
@@ -0,0 +1,31 @@
+from app import timeline
+
+def _feed(client, headers, skip: int = 0, limit: int = 50):
+    response = client.get("/recs/feed", params={"skip": skip, "limit": limit}, headers=headers)
+    assert response.status_code == 200, response.text
+    return [rec["title"] for rec in response.json()["items"]]
+
+def test_recs_stay_in_feeds_as_the_author_crosses_the_fanout_limit(client, signup, monkeypatch):
+    monkeypatch.setattr(timeline, "FANOUT_FOLLOWER_LIMIT", 1)
+    (author, author_name), (first, _), (second, _), (third, _) = (signup() for _ in range(4))
+
+    client.post(f"/users/{author_name}/follow", headers=first)
+    client.post("/recs/", json={"category": "music", "title": "fanned out"}, headers=author)
+    client.post(f"/users/{author_name}/follow", headers=second)
+    # Over the limit now: pulled at read time
+    client.post("/recs/", json={"category": "music", "title": "pulled"}, headers=author)
+    client.post(f"/users/{author_name}/follow", headers=third)
+    for reader in (first, second, third):
+        assert _feed(client, reader) == ["pulled", "fanned out"]
+        assert _feed(client, reader, skip=1, limit=1) == ["fanned out"]
+
+    # Back under the limit: what was pulled is still pulled
+    client.delete(f"/users/{author_name}/follow", headers=second)
+    client.delete(f"/users/{author_name}/follow", headers=third)
+    client.post("/recs/", json={"category": "music", "title": "fanned out again"}, headers=author)
+    assert _feed(client, first) == ["fanned out again", "pulled", "fanned out"]
+    assert _feed(client, first, skip=1, limit=1) == ["pulled"]
+    assert _feed(client, second) == []
+
+def test_missing_authors_are_not_fanned_out(db):
+    assert timeline.is_fanned_out(db, 10 ** 9) is False
@@ -0,0 +1,39 @@
+import uuid
+from sqlalchemy import update
+from app import trending
+from app.models import RecScore
+
+def _ranking(client, headers, category):
+    response = client.get(f"/recs/category/{category}", headers=headers)
+    assert response.status_code == 200, response.text
+    return [rec["title"] for rec in response.json()["items"]]
+
+def test_new_scores_rank_with_old_ones_across_an_epoch_rollover(client, db, signup):
+    category = f"trend{uuid.uuid4().hex[:8]}"
+    author, _ = signup("author")
+    fans = [signup("fan")[0] for _ in range(4)]
+
+    older = client.post("/recs/", json={"category": category, "title": "older"}, headers=author).json()["id"]
+    for fan in fans[:2]:
+        client.post(f"/recs/{older}/like", headers=fan)
+    trending.refresh(db)
+
+    # The epoch turns over before the next refresh: the table now holds the same
+    # scores on the previous epoch's scale
+    scale = 2 ** (trending.EPOCH_SECONDS / trending.HALF_LIFE_SECONDS)
+    db.execute(update(RecScore).values(epoch=RecScore.epoch - 1, score=RecScore.score * scale))
+    db.commit()
+
+    newer = client.post("/recs/", json={"category": category, "title": "newer"}, headers=author).json()["id"]
+    for fan in fans:
+        client.post(f"/recs/{newer}/like", headers=fan)
+    assert _ranking(client, author, category) == ["newer", "older"]
+
+    client.delete(f"/recs/{newer}/like", headers=fans[0])
+    client.delete(f"/recs/{newer}/like", headers=fans[1])
+    client.delete(f"/recs/{newer}/like", headers=fans[2])
+    assert _ranking(client, author, category) == ["older", "newer"]
+
+    # The refresh rebases everything and agrees
+    trending.refresh(db)
+    assert _ranking(client, author, category) == ["older", "newer"]
@@ -0,0 +1,125 @@
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app import unfurl
+
+# /unfurl against a stub site on loopback. Loopback is refused outside local
+# development, so the tests that fetch allow private addresses.
+
+PAGE = (
+    b'<html><head><title> Fallback  title </title>'
+    b'<meta property="og:title" content="OG &amp; title">'
+    b'<meta property="og:image" content="/cover.png">'
+    b'<meta name="description" content="A description">'
+    b'</head><body><meta property="og:title" content="not in the head"></body></html>'
+)
+
+class _Site(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers["Host"]))
+        if self.path.startswith("/redirect"):
+            self.send_response(302)
+            self.send_header("Location", "/page")
+            self.end_headers()
+        elif self.path.startswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+@pytest.fixture(scope="module")
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Site)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def allow_private(monkeypatch):
+    monkeypatch.setattr(unfurl, "UNFURL_ALLOW_PRIVATE", True)
+
+def _url(site, path: str) -> str:
+    # A fresh query string per test, so previews stored by other tests never answer
+    return f"http://127.0.0.1:{site.server_port}{path}?t={uuid.uuid4().hex}"
+
+def test_normalize_url():
+    assert unfurl.normalize_url("HTTP://Example.COM:80/a?b=2&utm_source=x&a=1&fbclid=y#top") == "http://example.com/a?a=1&b=2"
+    assert unfurl.normalize_url("https://bücher.example:8443") == "https://xn--bcher-kva.example:8443/"
+    assert unfurl.normalize_url("http://[::1]:8080/x") == "http://[::1]:8080/x"
+
+@pytest.mark.parametrize("url", ["ftp://example.com/", "example.com", "http://a:abc/x", "http://a..b/", "http://[::1/"])
+def test_invalid_links_are_refused(client, signup, url):
+    headers, _ = signup()
+    with pytest.raises(unfurl.UnfurlError):
+        unfurl.normalize_url(url)
+    assert client.get("/unfurl", params={"url": url}, headers=headers).status_code == 400
+    # A rec keeps the link it was given; there is just no preview image to fill in
+    response = client.post("/recs/", json={"category": "music", "title": "link", "link": url}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["image"] == ""
+
+def test_preview_is_read_from_the_head_and_stored(client, signup, site, allow_private):
+    headers, _ = signup()
+    url = _url(site, "/page")
+    response = client.get("/unfurl", params={"url": url + "&utm_source=feed"}, headers=headers)
+    assert response.status_code == 200, response.text
+    preview = response.json()
+    assert (preview["title"], preview["description"]) == ("OG & title", "A description")
+    assert preview["image"] == f"http://127.0.0.1:{site.server_port}/cover.png"
+
+    # Stored under the normalized URL: the second request is not fetched, and a rec
+    # posted with the link picks up the image
+    fetched = len(site.requests)
+    assert client.get("/unfurl", params={"url": url}, headers=headers).json()["title"] == "OG & title"
+    assert len(site.requests) == fetched
+    rec = client.post("/recs/", json={"category": "music", "title": "linked", "link": url}, headers=headers).json()
+    assert rec["image"] == preview["image"]
+
+def test_redirects_are_followed(client, signup, site, allow_private):
+    headers, _ = signup()
+    response = client.get("/unfurl", params={"url": _url(site, "/redirect")}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["title"] == "OG & title"
+
+def test_failures_are_remembered(client, signup, site, allow_private):
+    headers, _ = signup()
+    url = _url(site, "/missing")
+    for _ in range(2):
+        response = client.get("/unfurl", params={"url": url}, headers=headers)
+        assert response.status_code == 502
+        assert response.json()["detail"] == "Link returned 404"
+    assert sum(url.endswith(path) for path, _ in site.requests) == 1
+
+def test_private_addresses_are_refused(client, signup, site):
+    headers, _ = signup()
+    response = client.get("/unfurl", params={"url": _url(site, "/page")}, headers=headers)
+    assert response.status_code == 502
+    assert response.json()["detail"] == "Host not allowed"
+
+def test_requests_go_to_the_checked_address(client, signup, site, monkeypatch):
+    # The name never resolves: the fetch connects to what _check_host returned and
+    # still names the site in the Host header
+    checked = []
+
+    async def check_host(host):
+        checked.append(host)
+        return "127.0.0.1"
+
+    monkeypatch.setattr(unfurl, "_check_host", check_host)
+    headers, _ = signup()
+    token = uuid.uuid4().hex
+    response = client.get("/unfurl", params={"url": f"http://site.invalid:{site.server_port}/pinned?t={token}"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert checked == ["site.invalid"]
+    assert (f"/pinned?t={token}", f"site.invalid:{site.server_port}") in site.requests
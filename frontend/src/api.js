@@ -37,29 +37,54 @@ export const getUser = (username) => api.get(`/users/${username}`)
 export const followUser = (username) => api.post(`/users/${username}/follow`)
 export const unfollowUser = (username) => api.delete(`/users/${username}/follow`)
 export const updateMe = (data) => api.patch('/users/me', data)
-export const getFollowers = (username) => api.get(`/users/${username}/followers`)
-export const getFollowing = (username) => api.get(`/users/${username}/following`)
+export const deleteMe = async () => {
+  const res = await api.delete('/users/me')
+  logout()
+  return res
+}
+export const getFollowers = (username, cursor) => api.get(`/users/${username}/followers`, { params: { cursor } })
+export const getFollowing = (username, cursor) => api.get(`/users/${username}/following`, { params: { cursor } })
+export const followUsers = (usernames) => api.post('/users/me/following', { usernames })
 
 
 
 
 // Recs
 export const createRec = (data) => api.post('/recs/', data)
-export const getFeed = () => api.get('/recs/feed')
-export const getUserRecs = (username) => api.get(`/recs/user/${username}`)
+export const getFeed = (cursor, comments = 0) => api.get('/recs/feed', { params: { cursor, comments } })
+export const getTrending = (cursor) => api.get('/recs/trending', { params: { cursor } })
+export const getCategoryRecs = (category, cursor) => api.get(`/recs/category/${encodeURIComponent(category)}`, { params: { cursor } })
+export const getUserRecs = (username, cursor) => api.get(`/recs/user/${username}`, { params: { cursor } })
 export const likeRec = (recId) => api.post(`/recs/${recId}/like`)
 export const unlikeRec = (recId) => api.delete(`/recs/${recId}/like`)
+export const likeRecs = (recIds) => api.post('/recs/likes', { rec_ids: recIds })
+export const unlikeRecs = (recIds) => api.delete('/recs/likes', { data: { rec_ids: recIds } })
+export const importRecs = (recs) => api.post('/recs/import', { recs })
+export const unfurl = (url) => api.get('/unfurl', { params: { url } })
+export const uploadImage = (file, kind = 'rec') => {
+  const formData = new FormData()
+  formData.append('file', file)
+  return api.post('/images', formData, { params: { kind } })
+}
 
 export default api
 
 //Comments
-export const getComments = (recId) => api.get(`/recs/${recId}/comments`)
+export const getComments = (recId, cursor) => api.get(`/recs/${recId}/comments`, { params: { cursor } })
 export const createComment = (recId, content) => api.post(`/recs/${recId}/comments`, { content })
 
 // Notifications
-export const getNotifications = () => api.get('/notifications/')
+export const getNotifications = (cursor) => api.get('/notifications/', { params: { cursor } })
+export const getUnreadCount = () => api.get('/notifications/unread-count')
+export const streamNotifications = (onNotification) => {
+  const token = localStorage.getItem('token')
+  const source = new EventSource(`${API_URL}/notifications/stream?token=${encodeURIComponent(token)}`)
+  source.addEventListener('notification', (e) => onNotification(JSON.parse(e.data)))
+  return () => source.close()
+}
 export const markNotificationsRead = () => api.post('/notifications/read')
 export const getRec = (recId) => api.get(`/recs/${recId}`)
+export const getSimilarRecs = (recId) => api.get(`/recs/${recId}/similar`)
 
 //Delete
 export const deleteRec = (recId) => api.delete(`/recs/${recId}`)
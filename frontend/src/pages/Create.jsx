@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { createRec } from '../api'
+import { createRec, unfurl, uploadImage } from '../api'
 
 const defaultCategories = ['music', 'film', 'article', 'podcast', 'video', 'book', 'fashion']
 
@@ -17,18 +17,9 @@ const handleRecImageUpload = async (e) => {
   if (!file) return
 
   setUploadingImage(true)
-  const formData = new FormData()
-  formData.append('file', file)
-  formData.append('upload_preset', 'recs_unsigned')
-  formData.append('cloud_name', 'dzbhkicv0')
-
   try {
-    const res = await fetch('https://api.cloudinary.com/v1_1/dzbhkicv0/image/upload', {
-      method: 'POST',
-      body: formData
-    })
-    const data = await res.json()
-    setForm({ ...form, image: data.secure_url })
+    const { data } = await uploadImage(file, 'rec')
+    setForm({ ...form, image: data.url, image_id: data.id })
   } catch (err) {
     console.error('Upload failed:', err)
     alert('upload failed')
@@ -42,7 +33,8 @@ const handleRecImageUpload = async (e) => {
     title: '',
     description: '',
     link: '',
-    image: ''
+    image: '',
+    image_id: null
   })
 
   // Auto-fetch link preview
@@ -50,16 +42,12 @@ const handleRecImageUpload = async (e) => {
     if (!url.startsWith('http')) return
     setFetchingPreview(true)
     try {
-      const res = await fetch(`https://api.microlink.io?url=${encodeURIComponent(url)}`)
-      const data = await res.json()
-      if (data.status === 'success') {
-        const { title, image } = data.data
-        setForm(prev => ({
-          ...prev,
-          title: prev.title || title || '',
-          image: prev.image || image?.url || ''
-        }))
-      }
+      const { data } = await unfurl(url)
+      setForm(prev => ({
+        ...prev,
+        title: prev.title || data.title || '',
+        image: prev.image || data.image || ''
+      }))
     } catch (err) {
       console.error('Failed to fetch preview:', err)
     } finally {
@@ -193,7 +181,7 @@ const handleRecImageUpload = async (e) => {
       type="url"
       placeholder="paste image url..."
       value={form.image}
-      onChange={(e) => setForm({...form, image: e.target.value})}
+      onChange={(e) => setForm({...form, image: e.target.value, image_id: null})}
       className="url-input"
     />
   </div>
@@ -2,6 +2,13 @@ import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { getFeed, likeRec, unlikeRec, getComments, createComment } from '../api'
 
+// WebP variants from the backend's image pipeline; browsers pick the smallest that
+// covers the rendered size, and post.image (JPEG) remains the fallback
+function srcSet(variants) {
+  if (!variants?.length) return undefined
+  return variants.map(v => `${v.webp} ${v.width}w`).join(', ')
+}
+
 function timeAgo(dateString) {
   const now = new Date()
   const date = new Date(dateString)
@@ -26,28 +33,36 @@ function getDomain(url) {
   }
 }
 
+// Number of latest comments the feed endpoint embeds in each post
+const COMMENT_PREVIEW = 3
+
 function Post({ post, onLike, onNavigate }) {
-  const [comments, setComments] = useState([])
+  const [comments, setComments] = useState(post.latest_comments || [])
   const [newComment, setNewComment] = useState('')
-  const [loadingComments, setLoadingComments] = useState(true)
+  const [loadingComments, setLoadingComments] = useState(false)
 
   const hasLinkWithImage = post.link && post.image
   const hasImageOnly = post.image && !post.link
+  const hiddenComments = post.comments_count - comments.length
 
-  // Fetch comments automatically on mount
-  useEffect(() => {
-    const fetchComments = async () => {
-      try {
-        const res = await getComments(post.id)
-        setComments(res.data)
-      } catch (err) {
-        console.error(err)
-      } finally {
-        setLoadingComments(false)
-      }
+  // Only the preview comes with the feed; the rest of the thread loads on demand
+  const loadAllComments = async () => {
+    setLoadingComments(true)
+    try {
+      let all = []
+      let cursor = null
+      do {
+        const res = await getComments(post.id, cursor)
+        all = all.concat(res.data.items)
+        cursor = res.data.next_cursor
+      } while (cursor)
+      setComments(all)
+    } catch (err) {
+      console.error(err)
+    } finally {
+      setLoadingComments(false)
     }
-    fetchComments()
-  }, [post.id])
+  }
 
   const handleAddComment = async (e) => {
     e.preventDefault()
@@ -82,6 +97,8 @@ function Post({ post, onLike, onNavigate }) {
         {hasLinkWithImage && (
           <img 
             src={post.image} 
+            srcSet={srcSet(post.image_variants)}
+            sizes="72px"
             alt={post.title} 
             className="post-thumbnail"
             onClick={() => window.open(post.link, '_blank')}
@@ -91,7 +108,7 @@ function Post({ post, onLike, onNavigate }) {
 
       {hasImageOnly && (
         <div className="post-image-large">
-          <img src={post.image} alt={post.title} />
+          <img src={post.image} srcSet={srcSet(post.image_variants)} sizes="(max-width: 640px) 100vw, 600px" alt={post.title} />
         </div>
       )}
       
@@ -121,6 +138,11 @@ function Post({ post, onLike, onNavigate }) {
           <p className="comments-loading">loading comments...</p>
         ) : (
           <>
+            {hiddenComments > 0 && (
+              <p className="comments-more" onClick={loadAllComments}>
+                view all {post.comments_count} comments
+              </p>
+            )}
             {comments.length > 0 && (
               <div className="comments-list">
                 {comments.map(comment => (
@@ -165,8 +187,8 @@ export default function Feed() {
   const [loading, setLoading] = useState(true)
 
   useEffect(() => {
-    getFeed()
-      .then(res => setPosts(res.data))
+    getFeed(null, COMMENT_PREVIEW)
+      .then(res => setPosts(res.data.items))
       .catch(err => console.error(err))
       .finally(() => setLoading(false))
   }, [])
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import { getNotifications, markNotificationsRead } from '../api'
+import { getNotifications, markNotificationsRead, streamNotifications } from '../api'
 
 function timeAgo(dateString) {
   const now = new Date()
@@ -27,7 +27,7 @@ export default function Notifications() {
     const fetchNotifications = async () => {
       try {
         const res = await getNotifications()
-        setNotifications(res.data)
+        setNotifications(res.data.items)
         await markNotificationsRead()
       } catch (err) {
         console.error(err)
@@ -36,6 +36,12 @@ export default function Notifications() {
       }
     }
     fetchNotifications()
+
+    // New notifications are pushed while the page is open instead of refetching the list
+    return streamNotifications((notif) => {
+      // Coalesced notifications come back with the same id and a new count
+      setNotifications(prev => [notif, ...prev.filter(n => n.id !== notif.id)])
+    })
   }, [])
 
   const getNotificationText = (notif) => {
@@ -100,7 +106,9 @@ export default function Notifications() {
               </div>
               <div className="notif-text">
                 <p>
-                  <strong>{notif.from_username}</strong> {getNotificationText(notif)}
+                  <strong>{notif.from_username}</strong>
+                  {notif.others_count > 0 && ` and ${notif.others_count} ${notif.others_count === 1 ? 'other' : 'others'}`}
+                  {' '}{getNotificationText(notif)}
                 </p>
                 <span className="notif-time">{timeAgo(notif.created_at)}</span>
               </div>
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
-import { getMe, getUser, getUserRecs, followUser, unfollowUser, updateMe, getFollowers, getFollowing, deleteRec } from '../api'
+import { getMe, getUser, getUserRecs, followUser, unfollowUser, updateMe, getFollowers, getFollowing, deleteRec, uploadImage } from '../api'
 import { useAuth } from '../context/AuthContext'
 
 export default function Profile() {
@@ -13,6 +13,7 @@ export default function Profile() {
   const [editing, setEditing] = useState(false)
   const [bio, setBio] = useState('')
   const [avatar, setAvatar] = useState('')
+  const [avatarId, setAvatarId] = useState(null)
   const [showModal, setShowModal] = useState(null)
   const [modalUsers, setModalUsers] = useState([])
   const [loadingModal, setLoadingModal] = useState(false)
@@ -31,7 +32,7 @@ export default function Profile() {
         setAvatar(userRes.data.avatar || '')
 
         const recsRes = await getUserRecs(userRes.data.username)
-        setRecs(recsRes.data)
+        setRecs(recsRes.data.items)
       } catch (err) {
         console.error(err)
       } finally {
@@ -46,18 +47,10 @@ export default function Profile() {
     if (!file) return
 
     setUploading(true)
-    const formData = new FormData()
-    formData.append('file', file)
-    formData.append('upload_preset', 'recs_unsigned')
-    formData.append('cloud_name', 'dzbhkicv0')
-
     try {
-      const res = await fetch('https://api.cloudinary.com/v1_1/dzbhkicv0/image/upload', {
-        method: 'POST',
-        body: formData
-      })
-      const data = await res.json()
-      setAvatar(data.secure_url)
+      const { data } = await uploadImage(file, 'avatar')
+      setAvatar(data.url)
+      setAvatarId(data.id)
     } catch (err) {
       console.error('Upload failed:', err)
       alert('upload failed')
@@ -82,7 +75,7 @@ export default function Profile() {
 
   const handleSave = async () => {
     try {
-      const res = await updateMe({ bio, avatar })
+      const res = await updateMe(avatarId ? { bio, avatar_id: avatarId } : { bio, avatar })
       setUser(res.data)
       setEditing(false)
     } catch (err) {
@@ -109,7 +102,7 @@ export default function Profile() {
       const res = type === 'followers' 
         ? await getFollowers(user.username)
         : await getFollowing(user.username)
-      setModalUsers(res.data)
+      setModalUsers(res.data.items)
     } catch (err) {
       console.error(err)
     } finally {
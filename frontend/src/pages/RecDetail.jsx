@@ -39,8 +39,14 @@ export default function RecDetail() {
       try {
         const recRes = await getRec(recId)
         setRec(recRes.data)
-        const commentsRes = await getComments(recId)
-        setComments(commentsRes.data)
+        let all = []
+        let cursor = null
+        do {
+          const commentsRes = await getComments(recId, cursor)
+          all = all.concat(commentsRes.data.items)
+          cursor = commentsRes.data.next_cursor
+        } while (cursor)
+        setComments(all)
       } catch (err) {
         console.error(err)
       } finally {
@@ -17,7 +17,7 @@ export default function Search() {
     setLoading(true)
     try {
       const res = await api.get(`/users/search?q=${q}`)
-      setUsers(res.data)
+      setUsers(res.data.items)
     } catch (err) {
       console.error(err)
     } finally {